@@ -11,20 +11,34 @@ baidu_custom_settings = {
 
     "ITEM_PIPELINES": {
         "custom_crawler.pipelines.CustomCrawlerPipeline": 300,
+        # "custom_crawler.pipelines.ContentStorePipeline": 310,  # 大字段压缩去重存储，数据表只保存引用
+        # "custom_crawler.pipelines.ItemLogPipeline": 320,  # 写本地预写日志，由work_utils/load_item_log.py导入数据库
         "custom_crawler.pipelines.MysqlTwistedPipeline": 340,
+        # "custom_crawler.pipelines.MysqlBulkLoadPipeline": 340,  # 首次全量抓取时替换MysqlTwistedPipeline
         # "custom_crawler.pipelines.MongodbIndexPipeline": 380,
     },
+    "MYSQL_BATCH_SIZE": 100,  # MySQL 批量写入
+    "MYSQL_UPSERT": False,  # MySQL 按业务主键更新，先运行 work_utils/migrate_upsert.py --apply 再开启
 
     "DOWNLOADER_MIDDLEWARES": {
-        "custom_crawler.middlewares.RandomUserAgentMiddleware": 400,
+        "custom_crawler.middlewares.RandomUserAgentMiddleware": 415,  # 在代理中间件之后，可以按代理固定UA
         'scrapy.downloadermiddlewares.httpproxy.HttpProxyMiddleware': None,  # 禁用默认的代理
         "custom_crawler.middlewares.RandomProxyMiddlerware": 410,
         "scrapy.downloadermiddlewares.retry.RetryMiddleware": None,
-        "custom_crawler.middlewares.LocalRetryMiddlerware": 420,
+        "custom_crawler.middlewares.ProxyRetryMiddlerware": 420,
+        "custom_crawler.middlewares.AdaptiveConcurrencyMiddleware": 430,
     },
+    "RETRY_BAN_HTTP_CODES": [302, 403],  # 封IP的状态码
+    "ADAPTIVE_CONCURRENCY_ENABLED": True,  # 按封IP情况自动调整并发
+    "ADAPTIVE_CONCURRENCY_JSON_URLS": [r"/s/l\?", r"Ajax\?"],  # 列表页和各模块接口返回json，详情页是html
+    "PROXY_SESSION_ENABLED": True,  # 同一个企业的请求使用同一个代理
+    "FRESHNESS_ENABLED": True,  # 重新抓取时只请求到期的子模块
 
-    "SCHEDULER": "scrapy_redis.scheduler.Scheduler",
-    "DUPEFILTER_CLASS": "scrapy_redis.dupefilter.RFPDupeFilter",
+    "SCHEDULER": "custom_crawler.scheduler.BloomScheduler",
+    "DUPEFILTER_CLASS": "custom_crawler.dupefilter.BloomDupeFilter",  # 布隆过滤器去重，不再用集合保存全部指纹
+    # 请求去重和实体去重同一个周期轮换，新周期重新搜索关键词、请求企业详情，由新鲜度索引决定要请求的子模块
+    "BLOOM_DUPEFILTER_CYCLE_DAYS": 7,
+    "ENTITY_DEDUP_CYCLE_DAYS": 7,
     "SCHEDULER_QUEUE_CLASS": "scrapy_redis.queue.SpiderPriorityQueue",
     "SCHEDULER_PERSIST": True,
 }
@@ -45,11 +59,16 @@ search_custom_settings = {
     },
 
     "DOWNLOADER_MIDDLEWARES": {
-        "custom_crawler.middlewares.RandomUserAgentMiddleware": 400,
+        "custom_crawler.middlewares.RandomUserAgentMiddleware": 415,  # 在代理中间件之后，可以按代理固定UA
         "custom_crawler.middlewares.RandomProxyMiddlerware": 410,
         "scrapy.downloadermiddlewares.retry.RetryMiddleware": None,
-        "custom_crawler.middlewares.GsxcxRetryMiddlerware": 420,
+        "custom_crawler.middlewares.ProxyRetryMiddlerware": 420,
+        "custom_crawler.middlewares.AdaptiveConcurrencyMiddleware": 430,
     },
+    "RETRY_BAN_HTTP_CODES": [403, 565, 569],  # 封IP的状态码
+    "ADAPTIVE_CONCURRENCY_ENABLED": True,  # 按封IP情况自动调整并发
+    "ADAPTIVE_CONCURRENCY_JSON_URLS": [r"app\.gsxt\.gov\.cn/gsxt/"],
+    "PROXY_SESSION_ENABLED": True,  # 同一个企业的请求使用同一个代理
 
     "DEFAULT_REQUEST_HEADERS": {
         "charset": "utf-8",
@@ -75,7 +94,7 @@ xzcf_custom_settings = {
     # },
 
     "DOWNLOADER_MIDDLEWARES": {
-        "custom_crawler.middlewares.RandomUserAgentMiddleware": 400,
+        "custom_crawler.middlewares.RandomUserAgentMiddleware": 415,  # 在代理中间件之后，可以按代理固定UA
         "custom_crawler.middlewares.RandomProxyMiddlerware": 410,
         # "scrapy.downloadermiddlewares.retry.RetryMiddleware": None,
         # "custom_crawler.middlewares.LocalRetryDownloaderMiddleware": 420,
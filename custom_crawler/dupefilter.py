@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+from scrapy_redis.connection import get_redis_from_settings
+from scrapy_redis.dupefilter import RFPDupeFilter
+
+from custom_crawler.utils.content_store import LRUSet
+from custom_crawler.utils.redis_bloomfilter import CycleBloomFilter
+
+logger = logging.getLogger(__name__)
+
+
+class BloomDupeFilter(RFPDupeFilter):
+    """
+    布隆过滤器去重-替代scrapy_redis按集合保存全部指纹的RFPDupeFilter，内存只和数量、误判率有关
+    使用可扩容布隆过滤器，超过BLOOM_DUPEFILTER_CAPACITY后自动加层，误判率仍保持在BLOOM_DUPEFILTER_ERROR_RATE以内
+    BLOOM_DUPEFILTER_RECENT_SIZE: 本地精确保存最近的指纹数量，命中时不访问redis，0为关闭
+    过滤器的层参数和数量保存在 <key>:meta 中，之后修改配置不影响已有的层
+    BLOOM_DUPEFILTER_CYCLE_DAYS大于0时按天数分桶轮换 <key>:<周期>(CycleBloomFilter)，新周期的请求重新抓取，
+    旧周期的过滤器在最后一次写入一个周期后过期
+    搭配custom_crawler.scheduler.BloomScheduler使用，才能读取爬虫的配置和写入stats
+    """
+    def __init__(self, server, key, debug=False, capacity=100000000, error_rate=0.0001, recent_size=100000, cycle_days=0,
+                 stats=None):
+        super().__init__(server, key, debug)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.cycle_days = cycle_days
+        self.stats = stats
+        self.recent = LRUSet(recent_size) if recent_size > 0 else None
+        self.bloomfilter = None  # 第一次使用时创建
+        self.active_key = None  # 当前周期的过滤器key
+        self.new_count = 0  # 距离上次写stats新增的指纹数量
+
+    @classmethod
+    def from_settings(cls, settings):
+        """ 搭配scrapy默认调度器使用 """
+        server = get_redis_from_settings(settings)
+        dupefilter = cls(server, key='dupefilter:bloom:{}'.format(int(time.time())),
+                         debug=settings.getbool('DUPEFILTER_DEBUG'))
+        dupefilter.set_options(settings)
+        return dupefilter
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        dupefilter = cls.from_settings(crawler.settings)
+        dupefilter.stats = crawler.stats
+        return dupefilter
+
+    def set_options(self, settings, stats=None):
+        """ 按爬虫配置设置参数，需要在第一次使用之前调用 """
+        self.capacity = settings.getint('BLOOM_DUPEFILTER_CAPACITY', self.capacity)
+        self.error_rate = settings.getfloat('BLOOM_DUPEFILTER_ERROR_RATE', self.error_rate)
+        self.cycle_days = settings.getint('BLOOM_DUPEFILTER_CYCLE_DAYS', self.cycle_days)
+        recent_size = settings.getint('BLOOM_DUPEFILTER_RECENT_SIZE', 100000)
+        self.recent = LRUSet(recent_size) if recent_size > 0 else None
+        if stats is not None:
+            self.stats = stats
+
+    def open(self):
+        """ 第一次使用和跨过周期时读取当前周期的过滤器 """
+        if self.bloomfilter is None:
+            self.bloomfilter = CycleBloomFilter(self.server, self.key, days=self.cycle_days,
+                                                capacity=self.capacity, error_rate=self.error_rate)
+        active = self.bloomfilter.current()
+        if active.key == self.active_key:
+            return
+        if self.active_key is not None and self.recent is not None:
+            # 新周期重新抓取，本地窗口中的旧指纹不再有效
+            self.recent = LRUSet(self.recent.capacity)
+        self.active_key = active.key
+        active.load()
+        estimate = active.estimate()
+        logger.info('布隆过滤器去重--{}--层数:{}--已有:{}'.format(active.key, len(estimate['layers']), estimate['cardinality']))
+        self.record_stats()
+
+    def request_seen(self, request):
+        return self.fingerprints_seen([self.request_fingerprint(request)])[0]
+
+    def requests_seen(self, requests):
+        """ 批量判断并记录，返回和requests顺序一致的bool列表 """
+        return self.fingerprints_seen([self.request_fingerprint(request) for request in requests])
+
+    def fingerprints_seen(self, fingerprints):
+        self.open()
+        results = [False] * len(fingerprints)
+        unknown = []  # 最近窗口中没有的指纹，需要查布隆过滤器
+        for index, fp in enumerate(fingerprints):
+            if self.recent is not None and fp in self.recent:
+                results[index] = True
+                self.inc_stats('dupefilter/recent_hits')
+            else:
+                unknown.append(index)
+        if unknown:
+            seen = self.bloomfilter.add_many([fingerprints[index] for index in unknown])
+            for index, existed in zip(unknown, seen):
+                results[index] = existed
+                if self.recent is not None:
+                    self.recent.add(fingerprints[index])
+                if existed:
+                    self.inc_stats('dupefilter/bloom_hits')
+                else:
+                    self.new_count += 1
+        if self.new_count >= 1000:
+            self.record_stats()
+        return results
+
+    def record_stats(self):
+        self.new_count = 0
+        if self.stats is not None:
+            self.bloomfilter.current().record_stats(self.stats, 'dupefilter/bloom')
+
+    def inc_stats(self, key):
+        if self.stats is not None:
+            self.stats.inc_value(key)
+
+    def close(self, reason=''):
+        """ 过滤器持久保存，刷新过期时间并记录stats """
+        if self.bloomfilter is not None:
+            self.bloomfilter.refresh_expire(force=True)
+            self.record_stats()
+
+    def clear(self):
+        """ 删除全部层，下次使用时重新创建 """
+        self.open()
+        self.bloomfilter.current().delete()
+        if self.recent is not None:
+            self.recent = LRUSet(self.recent.capacity)
+        self.new_count = 0
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import redis
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+from twisted.internet import task
+
+from custom_crawler.utils.dead_letter import DeadLetterQueue, dead_letter_key, record_to_request
+
+logger = logging.getLogger(__name__)
+
+
+class DeadLetterReplay(object):
+    """
+    死信重放模式-把 <spider>:dead_letter 中的请求分批放回调度器
+    scrapy crawl baidu_xin -s DEAD_LETTER_REPLAY=1
+    每DEAD_LETTER_REPLAY_INTERVAL秒最多放回DEAD_LETTER_REPLAY_BATCH个请求，调度器中积压超过
+    DEAD_LETTER_REPLAY_MAX_PENDING时暂停，死信没有放完前不关闭爬虫
+    """
+    def __init__(self, crawler, server):
+        self.crawler = crawler
+        self.server = server
+        self.batch = crawler.settings.getint('DEAD_LETTER_REPLAY_BATCH', 100)
+        self.interval = crawler.settings.getfloat('DEAD_LETTER_REPLAY_INTERVAL', 10)
+        self.max_pending = crawler.settings.getint('DEAD_LETTER_REPLAY_MAX_PENDING', 1000)
+        self.queue = None
+        self.replay_task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('DEAD_LETTER_REPLAY'):
+            raise NotConfigured
+        server = redis.StrictRedis(
+            host=crawler.settings.get('REDIS_HOST'),
+            port=crawler.settings.get('REDIS_PORT'),
+            password=crawler.settings.get('REDIS_PASSWORD'),
+            db=crawler.settings.get('REDIS_DB'),
+        )
+        extension = cls(crawler, server)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.spider_idle, signal=signals.spider_idle)
+        return extension
+
+    def spider_opened(self, spider):
+        self.queue = DeadLetterQueue(self.server, dead_letter_key(spider.name))
+        logger.info('死信重放--待重放:{}'.format(len(self.queue)))
+        self.replay_task = task.LoopingCall(self.replay, spider)
+        self.replay_task.start(self.interval, now=True)
+
+    def spider_closed(self, spider):
+        if self.replay_task and self.replay_task.running:
+            self.replay_task.stop()
+
+    def replay(self, spider):
+        pending = len(self.crawler.engine.slot.scheduler)
+        if pending >= self.max_pending:
+            return
+        records = self.queue.pop_many(min(self.batch, self.max_pending - pending))
+        for record in records:
+            try:
+                request = record_to_request(record, spider)
+            except ValueError as e:
+                # 回调方法已经不存在
+                logger.error('死信无法还原--{}--{}'.format(record['request'].get('url'), e))
+                self.crawler.stats.inc_value('dead_letter/replay_error')
+                continue
+            self.crawler.engine.crawl(request, spider)
+            self.crawler.stats.inc_value('dead_letter/replayed')
+        if records:
+            logger.info('死信重放--本批:{}--剩余:{}'.format(len(records), len(self.queue)))
+
+    def spider_idle(self, spider):
+        if self.queue is not None and len(self.queue):
+            raise DontCloseSpider
@@ -5,10 +5,475 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
 
+import logging
+
 import scrapy
+from scrapy.item import BaseItem
+
+logger = logging.getLogger(__name__)
 
 
 class CustomCrawlerItem(scrapy.Item):
     # define the fields for your item here like:
     # name = scrapy.Field()
     pass
+
+
+class SlotItem(BaseItem):
+    """
+    定长字段数据基类-字段固定、值保存在__slots__中，不像scrapy.Item那样每条数据另外带一个_values字典
+    (Scrapy 1.7的BaseItem没有定义__slots__，实例仍然带__dict__，节省的只是字段字典)
+    写入字段时按建表模型截断超长字符串、转换整数，避免插入MySQL时才失败；
+    业务主键和url(untruncated_fields)不截断，截断或超长的字段记录在实例上，由CustomCrawlerPipeline写日志和stats
+    用法和dict一致: item['ent_name']、item.get('url')、dict(item)，collection为表名(类属性)
+    """
+    __slots__ = ('_truncated',)
+    collection = None
+    fields = frozenset()
+    max_lengths = {}
+    int_fields = frozenset()
+    untruncated_fields = frozenset()
+
+    def __init__(self, *args, **kwargs):
+        """ 按顺序合并多个字典，后面的覆盖前面的 """
+        for values in args + (kwargs,):
+            for key, value in values.items():
+                if key != 'collection':
+                    self[key] = value
+
+    def __setitem__(self, key, value):
+        if key not in self.fields:
+            raise KeyError("{} does not support field: {}".format(self.__class__.__name__, key))
+        if value is not None:
+            if key in self.int_fields:
+                value = int(value)
+            elif key in self.max_lengths:
+                if not isinstance(value, str):
+                    value = str(value)
+                max_length = self.max_lengths[key]
+                if len(value) > max_length:
+                    truncate = key not in self.untruncated_fields
+                    self.record_truncation(key, len(value), truncate)
+                    if truncate:
+                        value = value[:max_length]
+        setattr(self, key, value)
+
+    def record_truncation(self, key, length, truncated):
+        try:
+            records = self._truncated
+        except AttributeError:
+            records = self._truncated = []
+        records.append((key, length, truncated))
+
+    def truncations(self):
+        """ :return: [(字段, 原长度, 是否截断)]，业务主键和url超长时不截断 """
+        try:
+            return self._truncated
+        except AttributeError:
+            return []
+
+    def __getitem__(self, key):
+        if key == 'collection':
+            return self.collection
+        if key in self.fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __delitem__(self, key):
+        if key not in self.fields:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key == 'collection' or (key in self.fields and hasattr(self, key))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        if key != 'collection':
+            del self[key]
+        return value
+
+    def keys(self):
+        """ collection + 已经赋值的字段 """
+        return ['collection'] + [key for key in self.__slots__ if hasattr(self, key)]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def copy(self):
+        return self.__class__(self)
+
+
+# ---- 以下代码由 work_utils/creat_items.py 根据建表模型生成，不要手动修改 ----
+
+
+class BusinessInformationItem(SlotItem):
+    """ 百度企业信用-工商信息表 """
+    collection = 'business_information'
+    __slots__ = (
+        'ent_name', 'reg_capital', 'real_capital', 'legal_person', 'open_status', 'prev_ent_name', 'industry',
+        'unified_code', 'tax_number', 'reg_number', 'license_number', 'org_number', 'authority', 'estiblish_time',
+        'ent_type', 'open_time', 'district', 'annual_date', 'scope', 'reg_addr', 'telephone', 'email', 'description',
+        'old_ent_name', 'contents', 'url', 'content_hash', 'spider_time', 'xxly', 'process_status', 'upload_status',
+        'alter_status',
+    )
+    fields = frozenset(__slots__)
+    max_lengths = {
+        'ent_name': 128,
+        'reg_capital': 64,
+        'real_capital': 64,
+        'legal_person': 64,
+        'open_status': 32,
+        'prev_ent_name': 128,
+        'industry': 32,
+        'unified_code': 64,
+        'tax_number': 64,
+        'reg_number': 64,
+        'license_number': 64,
+        'org_number': 64,
+        'authority': 64,
+        'estiblish_time': 16,
+        'ent_type': 32,
+        'open_time': 32,
+        'district': 128,
+        'annual_date': 16,
+        'reg_addr': 256,
+        'telephone': 20,
+        'email': 32,
+        'old_ent_name': 128,
+        'url': 128,
+        'content_hash': 32,
+        'xxly': 20,
+    }
+    int_fields = frozenset(('process_status', 'upload_status', 'alter_status'))
+    untruncated_fields = frozenset(('url',))
+
+
+class ShareInformationItem(SlotItem):
+    """ 百度企业信用-股东信息表 """
+    collection = 'share_information'
+    __slots__ = (
+        'ent_name', 'gd_name', 'gd_type', 'sub_rate', 'sub_money', 'paidin_money', 'contents', 'url', 'content_hash',
+        'spider_time', 'xxly', 'process_status', 'upload_status', 'alter_status',
+    )
+    fields = frozenset(__slots__)
+    max_lengths = {
+        'ent_name': 128,
+        'gd_name': 128,
+        'gd_type': 64,
+        'sub_rate': 64,
+        'sub_money': 128,
+        'paidin_money': 128,
+        'url': 128,
+        'content_hash': 32,
+        'xxly': 20,
+    }
+    int_fields = frozenset(('process_status', 'upload_status', 'alter_status'))
+    untruncated_fields = frozenset(('url', 'ent_name', 'gd_name'))
+
+
+class WenshuInformationItem(SlotItem):
+    """ 百度企业信用-裁判文书表 """
+    collection = 'wenshu_information'
+    __slots__ = (
+        'ent_name', 'legal_person', 'open_status', 'unified_code', 'license_number', 'org_number', 'reg_addr',
+        'wenshu_name', 'case_number', 'role', 'ws_type', 'verdict_date', 'procedure_name', 'replace_content',
+        'content_node', 'contents', 'url', 'content_hash', 'spider_time', 'xxly', 'process_status', 'upload_status',
+        'alter_status',
+    )
+    fields = frozenset(__slots__)
+    max_lengths = {
+        'ent_name': 128,
+        'legal_person': 64,
+        'open_status': 32,
+        'unified_code': 64,
+        'license_number': 64,
+        'org_number': 64,
+        'reg_addr': 256,
+        'wenshu_name': 256,
+        'case_number': 256,
+        'role': 16,
+        'ws_type': 64,
+        'verdict_date': 20,
+        'procedure_name': 16,
+        'replace_content': 16,
+        'url': 128,
+        'content_hash': 32,
+        'xxly': 20,
+    }
+    int_fields = frozenset(('process_status', 'upload_status', 'alter_status'))
+    untruncated_fields = frozenset(('url',))
+
+
+class DiscreditInformationItem(SlotItem):
+    """ 百度企业信用-失信被执行人表 """
+    collection = 'discredit_information'
+    __slots__ = (
+        'ent_name', 'legal_person', 'open_status', 'unified_code', 'license_number', 'org_number', 'reg_addr', 'fb_rq',
+        'cf_xzjg', 'pname', 'verdict_number', 'org_number_info', 'verdict_date', 'province', 'implement_number',
+        'implement_court', 'perform_status', 'perform_situation', 'duty', 'perform_content', 'unperform_content',
+        'url', 'content_hash', 'spider_time', 'xxly', 'process_status', 'upload_status', 'alter_status',
+    )
+    fields = frozenset(__slots__)
+    max_lengths = {
+        'ent_name': 128,
+        'legal_person': 64,
+        'open_status': 32,
+        'unified_code': 64,
+        'license_number': 64,
+        'org_number': 64,
+        'reg_addr': 256,
+        'fb_rq': 16,
+        'cf_xzjg': 64,
+        'pname': 64,
+        'verdict_number': 64,
+        'org_number_info': 64,
+        'verdict_date': 16,
+        'province': 16,
+        'implement_number': 64,
+        'implement_court': 64,
+        'perform_status': 21845,
+        'perform_situation': 21845,
+        'duty': 21845,
+        'perform_content': 21845,
+        'unperform_content': 21845,
+        'url': 128,
+        'content_hash': 32,
+        'xxly': 20,
+    }
+    int_fields = frozenset(('process_status', 'upload_status', 'alter_status'))
+    untruncated_fields = frozenset(('url', 'implement_number'))
+
+
+class AbnormalInformationItem(SlotItem):
+    """ 百度企业信用-经营异常表 """
+    collection = 'abnormal_information'
+    __slots__ = (
+        'ent_name', 'legal_person', 'open_status', 'unified_code', 'license_number', 'org_number', 'reg_addr',
+        'enter_date', 'enter_reason', 'authority', 'leave_date', 'leave_reason', 'leave_authority', 'contents', 'url',
+        'content_hash', 'spider_time', 'xxly', 'process_status', 'upload_status', 'alter_status',
+    )
+    fields = frozenset(__slots__)
+    max_lengths = {
+        'ent_name': 128,
+        'legal_person': 64,
+        'open_status': 32,
+        'unified_code': 64,
+        'license_number': 64,
+        'org_number': 64,
+        'reg_addr': 256,
+        'enter_date': 16,
+        'enter_reason': 21845,
+        'authority': 64,
+        'leave_date': 16,
+        'leave_reason': 21845,
+        'leave_authority': 64,
+        'url': 128,
+        'content_hash': 32,
+        'xxly': 20,
+    }
+    int_fields = frozenset(('process_status', 'upload_status', 'alter_status'))
+    untruncated_fields = frozenset(('url', 'ent_name', 'enter_date', 'authority'))
+
+
+class PenaltiesInformationItem(SlotItem):
+    """ 百度企业信用-行政处罚表 """
+    collection = 'penalties_information'
+    __slots__ = (
+        'ent_name', 'legal_person', 'open_status', 'unified_code', 'license_number', 'org_number', 'reg_addr', 'oname',
+        'cf_wsh', 'cf_type', 'cf_sy', 'cf_yj', 'cf_jg', 'cf_jdrq', 'fb_rq', 'cf_status', 'cf_xzjg', 'contents', 'url',
+        'content_hash', 'spider_time', 'xxly', 'process_status', 'upload_status', 'alter_status',
+    )
+    fields = frozenset(__slots__)
+    max_lengths = {
+        'ent_name': 128,
+        'legal_person': 64,
+        'open_status': 32,
+        'unified_code': 64,
+        'license_number': 64,
+        'org_number': 64,
+        'reg_addr': 256,
+        'oname': 128,
+        'cf_wsh': 64,
+        'cf_type': 64,
+        'cf_sy': 21845,
+        'cf_yj': 21845,
+        'cf_jg': 21845,
+        'cf_jdrq': 16,
+        'fb_rq': 16,
+        'cf_status': 32,
+        'cf_xzjg': 64,
+        'url': 128,
+        'content_hash': 32,
+        'xxly': 20,
+    }
+    int_fields = frozenset(('process_status', 'upload_status', 'alter_status'))
+    untruncated_fields = frozenset(('url', 'cf_wsh'))
+
+
+class FreezeInfomationItem(SlotItem):
+    """ 百度企业信用-股权冻结表 """
+    collection = 'freeze_infomation'
+    __slots__ = (
+        'ent_name', 'legal_person', 'open_status', 'unified_code', 'license_number', 'org_number', 'reg_addr',
+        'executed_person', 'equality_amount', 'notification_number', 'type_and_status', 'enforcement_number',
+        'executed_court', 'executed_matters', 'executed_type', 'executed_number', 'freeze_period_from',
+        'freeze_period_end', 'freeze_period', 'publicity_date', 'invalid_date', 'invalid_reason', 'unfreeze',
+        'continuation_freeze', 'url', 'content_hash', 'spider_time', 'xxly', 'process_status', 'upload_status',
+        'alter_status',
+    )
+    fields = frozenset(__slots__)
+    max_lengths = {
+        'ent_name': 128,
+        'legal_person': 64,
+        'open_status': 32,
+        'unified_code': 64,
+        'license_number': 64,
+        'org_number': 64,
+        'reg_addr': 256,
+        'executed_person': 256,
+        'equality_amount': 128,
+        'notification_number': 64,
+        'type_and_status': 64,
+        'enforcement_number': 64,
+        'executed_court': 64,
+        'executed_matters': 256,
+        'executed_type': 128,
+        'executed_number': 128,
+        'freeze_period_from': 32,
+        'freeze_period_end': 32,
+        'freeze_period': 32,
+        'publicity_date': 32,
+        'invalid_date': 16,
+        'invalid_reason': 21845,
+        'unfreeze': 256,
+        'continuation_freeze': 256,
+        'url': 128,
+        'content_hash': 32,
+        'xxly': 20,
+    }
+    int_fields = frozenset(('process_status', 'upload_status', 'alter_status'))
+    untruncated_fields = frozenset(('url',))
+
+
+class IllegalInfomationItem(SlotItem):
+    """ 百度企业信用-严重违法表 """
+    collection = 'illegal_infomation'
+    __slots__ = (
+        'ent_name', 'legal_person', 'open_status', 'unified_code', 'license_number', 'org_number', 'reg_addr',
+        'enter_date', 'enter_reason', 'authority', 'leave_date', 'leave_reason', 'leave_authority', 'contents', 'url',
+        'content_hash', 'spider_time', 'xxly', 'process_status', 'upload_status', 'alter_status',
+    )
+    fields = frozenset(__slots__)
+    max_lengths = {
+        'ent_name': 128,
+        'legal_person': 64,
+        'open_status': 32,
+        'unified_code': 64,
+        'license_number': 64,
+        'org_number': 64,
+        'reg_addr': 256,
+        'enter_date': 16,
+        'enter_reason': 21845,
+        'authority': 64,
+        'leave_date': 16,
+        'leave_reason': 21845,
+        'leave_authority': 64,
+        'url': 128,
+        'content_hash': 32,
+        'xxly': 20,
+    }
+    int_fields = frozenset(('process_status', 'upload_status', 'alter_status'))
+    untruncated_fields = frozenset(('url', 'ent_name', 'enter_date', 'authority'))
+
+
+class GsxtBusinessInformationItem(SlotItem):
+    """ 国家企业公示系统-工商信息表 """
+    collection = 'gsxt_business_information'
+    __slots__ = (
+        'ent_name', 'unified_code', 'ent_type', 'legal_person', 'estiblish_time', 'operate_from', 'operate_to',
+        'authority', 'approve_date', 'open_status', 'reg_addr', 'scope', 'reg_capital', 'reg_capital_unit', 'reg_cap',
+        'contents', 'url', 'content_hash', 'spider_time', 'xxly', 'process_status', 'upload_status', 'alter_status',
+    )
+    fields = frozenset(__slots__)
+    max_lengths = {
+        'ent_name': 128,
+        'unified_code': 64,
+        'ent_type': 32,
+        'legal_person': 64,
+        'estiblish_time': 16,
+        'operate_from': 32,
+        'operate_to': 32,
+        'authority': 64,
+        'approve_date': 16,
+        'open_status': 32,
+        'reg_addr': 256,
+        'reg_capital': 64,
+        'reg_capital_unit': 64,
+        'reg_cap': 64,
+        'url': 512,
+        'content_hash': 32,
+        'xxly': 20,
+    }
+    int_fields = frozenset(('process_status', 'upload_status', 'alter_status'))
+    untruncated_fields = frozenset(('url',))
+
+
+class GsxtAbnormalInformationItem(SlotItem):
+    """ 国家企业公示系统-经营异常表 """
+    collection = 'gsxt_abnormal_information'
+    __slots__ = (
+        'ent_name', 'unified_code', 'legal_person', 'reg_addr', 'enter_reason', 'authority', 'enter_date',
+        'leave_reason', 'leave_authority', 'leave_date', 'contents', 'url', 'content_hash', 'spider_time', 'xxly',
+        'process_status', 'upload_status', 'alter_status',
+    )
+    fields = frozenset(__slots__)
+    max_lengths = {
+        'ent_name': 128,
+        'unified_code': 64,
+        'legal_person': 64,
+        'reg_addr': 256,
+        'enter_reason': 21845,
+        'authority': 64,
+        'enter_date': 16,
+        'leave_reason': 21845,
+        'leave_authority': 64,
+        'leave_date': 16,
+        'url': 512,
+        'content_hash': 32,
+        'xxly': 20,
+    }
+    int_fields = frozenset(('process_status', 'upload_status', 'alter_status'))
+    untruncated_fields = frozenset(('url', 'ent_name', 'enter_date', 'authority'))
+
+
+# ---- 生成代码结束 ----
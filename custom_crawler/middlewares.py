@@ -1,56 +1,111 @@
 # -*- coding: utf-8 -*-
+import random
+import re
 import time
 
 import redis
 import logging
-from fake_useragent import UserAgent
+from scrapy import signals
 from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest, NotConfigured
+from scrapy.utils.misc import load_object
 from scrapy.utils.python import global_object_name
 from scrapy.utils.response import response_status_message
+from twisted.internet import reactor, task
 
 from custom_crawler import settings
+from custom_crawler.utils.concurrency import AimdController
+from custom_crawler.utils.dead_letter import DeadLetterQueue, dead_letter_key
+from custom_crawler.utils.proxy_pool import ProxyPool, domain_of, proxy_of
+from custom_crawler.utils.user_agents import DATA_PATH as UA_DATA_PATH, PinnedUserAgents, UserAgentPool
 
 logger = logging.getLogger(__name__)
 
 
 class RandomUserAgentMiddleware(object):
-    """ 利用fake_useragent生成随机请求头 """
-    def __init__(self, ua_type):
-        self.ua_type = ua_type
-        self.ua = UserAgent()
+    """
+    从离线User-Agent池中按浏览器/平台占比随机取请求头
+    RANDOM_UA_PER_PROXY开启时同一个代理固定使用同一个UA，需要放在代理中间件之后
+    """
+    def __init__(self, pool, per_proxy=False):
+        self.pool = pool
+        self.pinned = PinnedUserAgents(pool) if per_proxy else None
 
     @classmethod
     def from_crawler(cls, crawler):
+        pool = UserAgentPool.load(
+            path=crawler.settings.get('RANDOM_UA_FILE') or UA_DATA_PATH,
+            browser=crawler.settings.get('RANDOM_UA_TYPE', 'random'),
+            platforms=crawler.settings.getlist('RANDOM_UA_PLATFORMS'),
+        )
+        logger.info('User-Agent池--版本:{}--数量:{}'.format(pool.version, len(pool)))
         return cls(
-            ua_type=crawler.settings.get('RANDOM_UA_TYPE', 'random')
+            pool=pool,
+            per_proxy=crawler.settings.getbool('RANDOM_UA_PER_PROXY'),
         )
 
     def process_request(self, request, spider):
-        def get_user_agent():
-            return getattr(self.ua, self.ua_type)
-        request.headers.setdefault(b'User-Agent', get_user_agent())
+        proxy = proxy_of(request)
+        if self.pinned is not None and proxy:
+            # 换了代理的重试请求也要换成新代理对应的UA
+            request.headers[b'User-Agent'] = self.pinned.get(proxy)
+        else:
+            request.headers.setdefault(b'User-Agent', self.pool.get())
+
+
+class BanDetector(object):
+    """
+    判断响应是否表示IP被封，代理中间件和自适应并发中间件共用
+    RETRY_BAN_HTTP_CODES中的状态码，以及url匹配ADAPTIVE_CONCURRENCY_JSON_URLS但不是json的200响应(IP不行)
+    """
+    def __init__(self, ban_http_codes=(), json_urls=()):
+        self.ban_http_codes = set(int(code) for code in ban_http_codes)
+        self.json_urls = [re.compile(pattern) for pattern in json_urls]
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.getlist('RETRY_BAN_HTTP_CODES'), settings.getlist('ADAPTIVE_CONCURRENCY_JSON_URLS'))
+
+    def is_ban_status(self, response):
+        return response.status in self.ban_http_codes
+
+    def __call__(self, response):
+        if response.status in self.ban_http_codes:
+            return True
+        if response.status == 200 and any(pattern.search(response.url) for pattern in self.json_urls):
+            return response.body[:64].lstrip()[:1] not in (b'{', b'[')
+        return False
 
 
 class RandomProxyMiddlerware(object):
-    """ 拨号代理池 """
-    def __init__(self, proxy_redis_host, proxy_redis_port, proxy_redis_password, proxy_redis_db):
-        self.redis_proxy = redis.StrictRedis(host=proxy_redis_host, port=proxy_redis_port, password=proxy_redis_password, db=proxy_redis_db)
+    """
+    拨号代理池-从本地代理缓存中按得分取代理，缓存由ProxyPool后台同步
+    PROXY_SESSION_ENABLED开启时，meta中proxy_session相同的请求使用同一个代理(复用长连接)，代理被封后整组更换
+    """
+    def __init__(self, proxy_pool, session_enabled=False, is_banned=None):
+        self.proxy_pool = proxy_pool
+        self.session_enabled = session_enabled
+        self.is_banned = is_banned or BanDetector()
 
     @classmethod
     def from_crawler(cls, crawler):
         return cls(
-            proxy_redis_host=crawler.settings.get('REDIS_PROXIES_HOST'),
-            proxy_redis_port=crawler.settings.get('REDIS_PROXIES_PORT'),
-            proxy_redis_password=crawler.settings.get('REDIS_PROXIES_PASSWORD'),
-            proxy_redis_db=crawler.settings.get('REDIS_PROXIES_DB'),
+            proxy_pool=ProxyPool.from_crawler(crawler),
+            session_enabled=crawler.settings.getbool('PROXY_SESSION_ENABLED'),
+            is_banned=BanDetector.from_settings(crawler.settings),
         )
 
     def process_request(self, request, spider):
-        ip_port = self.redis_proxy.srandmember('proxies')
+        request.meta.pop('proxy_ban_recorded', None)
+        session = request.meta.get('proxy_session') if self.session_enabled else None
+        if session is not None:
+            ip_port = self.proxy_pool.get_session(session, domain_of(request))
+        else:
+            ip_port = self.proxy_pool.get(domain_of(request))
         if ip_port:
             proxies = {
-                'http': 'http://{}'.format(ip_port.decode('utf-8')),
-                'https': 'https://{}'.format(ip_port.decode('utf-8')),
+                'http': 'http://{}'.format(ip_port),
+                'https': 'https://{}'.format(ip_port),
             }
             if request.url.startswith('http://'):
                 request.meta['proxy'] = proxies.get("http")
@@ -59,43 +114,166 @@ class RandomProxyMiddlerware(object):
                 request.meta['proxy'] = proxies.get('https')
                 logger.debug('https链接,ip:{}'.format(request.meta.get('proxy')))
         else:
+            # 不阻塞reactor，请求挂起等待下次同步到代理后继续
             logger.info('代理池枯竭--IP数量不足--等待重新拨号')
-            time.sleep(10)
+            d = self.proxy_pool.wait()
+            d.addCallback(lambda _: self.process_request(request, spider))
+            return d
+
+    def process_response(self, request, response, spider):
+        """
+        被封的响应一般已经被重试中间件隔离代理并重试，不会到这里；
+        重试中间件没有处理的被封响应(dont_retry等)在这里隔离代理，其他记录为成功
+        """
+        proxy = proxy_of(request)
+        if proxy:
+            if self.is_banned(response):
+                if not request.meta.get('proxy_ban_recorded'):
+                    self.proxy_pool.record_ban(proxy, domain_of(request))
+            else:
+                self.proxy_pool.record_success(proxy, domain_of(request), request.meta.get('download_latency'))
+        return response
 
 
-class LocalRetryMiddlerware(RetryMiddleware):
-    """  百度企业信用--重新定义重试中间件--搭配拨号代理  """
+class DelayedRetryMixin(object):
+    """
+    延迟重试-按原因指数退避加随机抖动，到时间后交给engine重新调度
+    等待期间不占用下载并发，也不阻塞reactor
+    """
+    def init_delayed_retry(self, crawler):
+        self.crawler = crawler
+        self.backoff_base = crawler.settings.getfloat('RETRY_BACKOFF_BASE', 1)
+        self.backoff_max = crawler.settings.getfloat('RETRY_BACKOFF_MAX', 60)
+        self.backoff_reasons = crawler.settings.getdict('RETRY_BACKOFF_REASONS')  # 按原因单独设置退避基数
+        self.delayed_calls = set()
+        crawler.signals.connect(self.delayed_spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(self.delayed_spider_closed, signal=signals.spider_closed)
+
+    def backoff_delay(self, request, reason_key):
+        """ 同一原因第n次重试等待 base * 2^(n-1) 秒，乘以0.5~1.5的随机抖动 """
+        reason_key = str(reason_key)
+        reason_times = dict(request.meta.get('retry_reason_times', {}))
+        reason_times[reason_key] = reason_times.get(reason_key, 0) + 1
+        request.meta['retry_reason_times'] = reason_times
+        base = float(self.backoff_reasons.get(reason_key, self.backoff_base))
+        delay = min(base * 2 ** (reason_times[reason_key] - 1), self.backoff_max)
+        return delay * random.uniform(0.5, 1.5)
+
+    def retry_later(self, request, reason, reason_key, spider):
+        """ 超过重试次数返回None，否则延迟调度重试请求并忽略当前请求 """
+        retryreq = self._retry(request, reason, spider)
+        if retryreq is None:
+            return None
+        delay = self.backoff_delay(retryreq, reason_key)
+        call = reactor.callLater(delay, self.fire_retry, retryreq, spider, time.time())
+        self.delayed_calls.add(call)
+        self.crawler.stats.inc_value('retry/delayed_count')
+        self.crawler.stats.set_value('retry/delayed_pending', len(self.delayed_calls))
+        raise IgnoreRequest('延迟{:.1f}秒重试--{}'.format(delay, reason))
+
+    def fire_retry(self, request, spider, start_time):
+        self.delayed_calls = {call for call in self.delayed_calls if call.active()}
+        stats = self.crawler.stats
+        wait_time = time.time() - start_time
+        stats.inc_value('retry/wait_time_total', wait_time)
+        stats.max_value('retry/wait_time_max', wait_time)
+        stats.set_value('retry/delayed_pending', len(self.delayed_calls))
+        self.crawler.engine.crawl(request, spider)
+
+    def delayed_spider_idle(self, spider):
+        """ 还有等待中的重试请求时不关闭爬虫 """
+        if any(call.active() for call in self.delayed_calls):
+            raise DontCloseSpider
+
+    def delayed_spider_closed(self, spider):
+        pending = [call for call in self.delayed_calls if call.active()]
+        for call in pending:
+            call.cancel()
+        if pending:
+            logger.info('爬虫关闭--丢弃{}个等待中的重试请求'.format(len(pending)))
+
+
+class ProxyRetryMiddlerware(DelayedRetryMixin, RetryMiddleware):
+    """
+    通用重试中间件--搭配拨号代理，每个爬虫在config.py中配置
+    RETRY_BAN_HTTP_CODES: 表示IP被封的状态码，隔离代理后延迟重试
+    ADAPTIVE_CONCURRENCY_JSON_URLS: json接口返回非json页面(IP不行)同样隔离代理后延迟重试，重试次数用完时忽略请求(已进入死信队列)
+    RETRY_EXCEPTION_ACTIONS: 按异常类型处理 rotate(隔离代理立即重试) retry(立即重试) backoff(延迟重试) giveup(不重试)
+    所有重试都受RETRY_TIMES限制，重试次数用完和不重试的请求保存到死信队列 <spider>:dead_letter
+    """
     redis_client = redis.StrictRedis(
         host=settings.REDIS_HOST,
         port=settings.REDIS_PORT,
         password=settings.REDIS_PASSWORD,
         db=settings.REDIS_DB,
     )
-    redis_proxy = redis.StrictRedis(
-        host=settings.REDIS_PROXIES_HOST,
-        port=settings.REDIS_PROXIES_PORT,
-        password=settings.REDIS_PROXIES_PASSWORD,
-        db=settings.REDIS_PROXIES_DB,
-    )
+    ACTIONS = ('rotate', 'retry', 'backoff', 'giveup')
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.is_banned = BanDetector.from_settings(settings)
+        self.exception_actions = {}
+        for path, action in settings.getdict('RETRY_EXCEPTION_ACTIONS').items():
+            if action not in self.ACTIONS:
+                raise ValueError('未知的重试方式:{}--{}'.format(path, action))
+            self.exception_actions[load_object(path)] = action
+        self.default_action = settings.get('RETRY_EXCEPTION_DEFAULT', 'giveup')
 
-    def delete_proxy(self, proxy):
-        """ 删除代理，公司拨号代理是set """
-        self.redis_proxy.srem("proxies", proxy)
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = super().from_crawler(crawler)
+        middleware.proxy_pool = ProxyPool.from_crawler(crawler)
+        middleware.dead_letter = DeadLetterQueue(cls.redis_client, dead_letter_key(crawler.spider.name))
+        middleware.init_delayed_retry(crawler)
+        return middleware
+
+    def save_dead_letter(self, request, reason, retries, spider):
+        if isinstance(reason, Exception):
+            reason = global_object_name(reason.__class__)
+        try:
+            self.dead_letter.push(request, spider, reason, retries)
+        except Exception as e:
+            # 保存失败时在日志中记录url
+            logger.error('保存死信失败--{}--{}'.format(request.url, repr(e)))
+            return
+        spider.crawler.stats.inc_value('dead_letter/count')
+        spider.crawler.stats.inc_value('dead_letter/reason/{}'.format(reason))
+
+    def ban_proxy(self, request):
+        """ 被封的代理在该域名上隔离一段时间，不再从共享代理池删除 """
+        proxy = proxy_of(request)
+        if proxy:
+            self.proxy_pool.record_ban(proxy, domain_of(request))
+            request.meta['proxy_ban_recorded'] = True  # 代理中间件不再重复记录
+        return proxy
+
+    def fail_proxy(self, request):
+        proxy = proxy_of(request)
+        if proxy:
+            self.proxy_pool.record_failure(proxy, domain_of(request))
+
+    def classify(self, exception):
+        """ 按异常类型(包括父类)查找处理方式，子类配置优先 """
+        for exception_class in type(exception).__mro__:
+            if exception_class in self.exception_actions:
+                return self.exception_actions[exception_class]
+        return self.default_action
 
     def process_response(self, request, response, spider):
         if request.meta.get('dont_retry', False):
             return response
+        if self.is_banned(response):
+            """  单独处理封IP的情况，隔离代理，延迟重新请求(不阻塞reactor)  """
+            self.ban_proxy(request)
+            if self.is_banned.is_ban_status(response):
+                reason = response_status_message(response.status)
+                return self.retry_later(request, reason, response.status, spider) or response
+            # json接口返回的非json页面，重试次数用完时不交给爬虫解析
+            self.retry_later(request, 'non_json_response', 'non_json_response', spider)
+            raise IgnoreRequest('非json响应--重试次数用完--{}'.format(request.url))
         if response.status in self.retry_http_codes:
             reason = response_status_message(response.status)
-            return self._retry(request, reason, spider) or response
-        if response.status in [302, 403]:
-            """  单独处理封IP的情况，删除代理重新请求  """
-            proxy_spider = request.meta.get('proxy')
-            proxy_redis = proxy_spider.split("//")[1]
-            time.sleep(1)
-            self.delete_proxy(proxy_redis)
-            reason = response_status_message(response.status)
-            return self._retry(request, reason, spider) or response
+            return self.retry_later(request, reason, response.status, spider) or response
 
         return response
 
@@ -124,144 +302,107 @@ class LocalRetryMiddlerware(RetryMiddleware):
             stats.inc_value('retry/reason_count/%s' % reason)
             return retryreq
         else:
-            # 全部重试错误，要保存错误的url和参数 - start
-            error_request = spider.name + ":error_urls"
-            self.redis_client.sadd(error_request, request.url)
-            # 全部重试错误，要保存错误的url和参数 - en
+            # 全部重试错误，完整保存请求到死信队列
+            self.save_dead_letter(request, reason, retries, spider)
             stats.inc_value('retry/max_reached')
             logger.debug("Gave up retrying %(request)s (failed %(retries)d times): %(reason)s",
                          {'request': request, 'retries': retries, 'reason': reason},
                          extra={'spider': spider})
 
     def process_exception(self, request, exception, spider):
-        if "ConnectionRefusedError" in repr(exception):
-            proxy_spider = request.meta.get('proxy')
-            proxy_redis = proxy_spider.split("//")[1]
-            self.delete_proxy(proxy_redis)
-            logger.info('目标计算机积极拒绝，删除代理-{}-请求url-{}开始重新请求'.format(proxy_redis, request.url))
-            return request
-
-        elif "TCPTimedOutError" in repr(exception):
-            logger.debug('连接方在一段时间后没有正确答复或连接的主机没有反应')
-            return request
-
-        elif "ConnectionError" in repr(exception):
-            logger.debug("连接出错，无网络")
-            return request
-
-        elif "TimeoutError" in repr(exception):
-            logger.debug('请求超时-请求url-{}-重新请求'.format(request.url))
-            return request
-
-        elif "ConnectionResetError" in repr(exception):
-            logger.debug('远程主机强迫关闭了一个现有的连接')
-            return request
-
-        elif "ResponseNeverReceived" in repr(exception):
-            logger.debug('可能是请求头无法使用，没有正确的响应内容')
-            return request
-
+        if request.meta.get('dont_retry', False):
+            return None
+        action = self.classify(exception)
+        spider.crawler.stats.inc_value('retry/exception_action/{}'.format(action))
+        if action == 'giveup':
+            logger.error('出现其他异常:{}--不再重试'.format(repr(exception)))
+            self.save_dead_letter(request, exception, request.meta.get('retry_times', 0), spider)
+            return None
+        if action == 'rotate':
+            proxy = self.ban_proxy(request)
+            logger.debug('{}--隔离代理-{}-请求url-{}开始重新请求'.format(global_object_name(exception.__class__), proxy, request.url))
         else:
-            logger.error('出现其他异常:{}--等待处理'.format(repr(exception)))
+            self.fail_proxy(request)
+        if action == 'backoff':
+            return self.retry_later(request, exception, global_object_name(exception.__class__), spider)
+        return self._retry(request, exception, spider)
+
+
+class AdaptiveConcurrencyMiddleware(object):
+    """
+    按下载slot(域名)自适应调整并发-AIMD: 被封增多时并发减半，成功率和延迟正常时并发加一
+    被封的判断见BanDetector
+    需要放在重试中间件之后(优先级数字更大)，才能在重试之前看到原始响应
+    """
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.controller = AimdController(
+            start=settings.getint('ADAPTIVE_CONCURRENCY_START', 4),
+            minimum=settings.getint('ADAPTIVE_CONCURRENCY_MIN', 1),
+            maximum=settings.getint('ADAPTIVE_CONCURRENCY_MAX', 16),
+            increase_step=settings.getint('ADAPTIVE_CONCURRENCY_INCREASE', 1),
+            decrease_factor=settings.getfloat('ADAPTIVE_CONCURRENCY_DECREASE', 0.5),
+            ban_threshold=settings.getfloat('ADAPTIVE_CONCURRENCY_BAN_THRESHOLD', 0.05),
+            success_threshold=settings.getfloat('ADAPTIVE_CONCURRENCY_SUCCESS_THRESHOLD', 0.95),
+            target_latency=settings.getfloat('ADAPTIVE_CONCURRENCY_TARGET_LATENCY', 3.0),
+            min_samples=settings.getint('ADAPTIVE_CONCURRENCY_MIN_SAMPLES', 10),
+        )
+        self.interval = settings.getfloat('ADAPTIVE_CONCURRENCY_INTERVAL', 5)
+        self.is_banned = BanDetector.from_settings(settings)
+        self.adjust_task = None
 
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
 
-class GsxcxRetryMiddlerware(RetryMiddleware):
-    """  国家企业公示系统--重试中间件 """
-    redis_client = redis.StrictRedis(
-        host=settings.REDIS_HOST,
-        port=settings.REDIS_PORT,
-        password=settings.REDIS_PASSWORD,
-        db=settings.REDIS_DB,
-    )
-    redis_proxy = redis.StrictRedis(
-        host=settings.REDIS_PROXIES_HOST,
-        port=settings.REDIS_PROXIES_PORT,
-        password=settings.REDIS_PROXIES_PASSWORD,
-        db=settings.REDIS_PROXIES_DB,
-    )
+    def spider_opened(self, spider):
+        self.adjust_task = task.LoopingCall(self.adjust)
+        self.adjust_task.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.adjust_task and self.adjust_task.running:
+            self.adjust_task.stop()
 
-    def delete_proxy(self, proxy):
-        """ 删除代理，公司拨号代理是set """
-        self.redis_proxy.srem("proxies", proxy)
+    def apply(self, key):
+        """ 下载器的slot空闲一段时间后会被回收重建，每次都检查并发是否一致 """
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is not None:
+            slot.concurrency = self.controller.get_concurrency(key)
 
     def process_response(self, request, response, spider):
-        if request.meta.get('dont_retry', False):
+        key = request.meta.get('download_slot')
+        if key is None:
             return response
-        if response.status in self.retry_http_codes:
-            reason = response_status_message(response.status)
-            return self._retry(request, reason, spider) or response
-        if response.status in [403, 569, 565]:
-            """  单独处理封IP的情况，删除代理重新请求  """
-            proxy_spider = request.meta.get('proxy')
-            proxy_redis = proxy_spider.split("//")[1]
-            time.sleep(1)
-            self.delete_proxy(proxy_redis)
-            reason = response_status_message(response.status)
-            return self._retry(request, reason, spider) or response
-
-        return response
-
-    def _retry(self, request, reason, spider):
-        retries = request.meta.get('retry_times', 0) + 1
-
-        retry_times = self.max_retry_times
-
-        if 'max_retry_times' in request.meta:
-            retry_times = request.meta['max_retry_times']
-
-        stats = spider.crawler.stats
-        if retries <= retry_times:
-            logger.debug("Retrying %(request)s (failed %(retries)d times): %(reason)s",
-                         {'request': request, 'retries': retries, 'reason': reason},
-                         extra={'spider': spider})
-            retryreq = request.copy()
-            retryreq.meta['retry_times'] = retries
-            retryreq.dont_filter = True
-            retryreq.priority = request.priority + self.priority_adjust
-
-            if isinstance(reason, Exception):
-                reason = global_object_name(reason.__class__)
-
-            stats.inc_value('retry/count')
-            stats.inc_value('retry/reason_count/%s' % reason)
-            return retryreq
+        if self.is_banned(response):
+            self.controller.record_ban(key)
+            self.stats.inc_value('adaptive_concurrency/ban/{}'.format(key))
         else:
-            # 全部重试错误，要保存错误的url和参数 - start
-            error_request = spider.name + ":error_urls"
-            self.redis_client.sadd(error_request, request.url)
-            # 全部重试错误，要保存错误的url和参数 - en
-            stats.inc_value('retry/max_reached')
-            logger.debug("Gave up retrying %(request)s (failed %(retries)d times): %(reason)s",
-                         {'request': request, 'retries': retries, 'reason': reason},
-                         extra={'spider': spider})
+            self.controller.record_success(key, request.meta.get('download_latency'))
+        self.apply(key)
+        return response
 
     def process_exception(self, request, exception, spider):
-        if "ConnectionRefusedError" in repr(exception):
-            proxy_spider = request.meta.get('proxy')
-            proxy_redis = proxy_spider.split("//")[1]
-            self.delete_proxy(proxy_redis)
-            logger.info('目标计算机积极拒绝，删除代理-{}-请求url-{}开始重新请求'.format(proxy_redis, request.url))
-            return request
-
-        elif "TCPTimedOutError" in repr(exception):
-            logger.debug('连接方在一段时间后没有正确答复或连接的主机没有反应')
-            return request
-
-        elif "ConnectionError" in repr(exception):
-            logger.debug("连接出错，无网络")
-            return request
-
-        elif "TimeoutError" in repr(exception):
-            logger.debug('请求超时-请求url-{}-重新请求'.format(request.url))
-            return request
-
-        elif "ConnectionResetError" in repr(exception):
-            logger.debug('远程主机强迫关闭了一个现有的连接')
-            return request
-
-        elif "ResponseNeverReceived" in repr(exception):
-            logger.debug('可能是请求头无法使用，没有正确的响应内容')
-            return request
-
-        else:
-            logger.error('出现其他异常:{}--等待处理'.format(repr(exception)))
\ No newline at end of file
+        key = request.meta.get('download_slot')
+        if key is not None:
+            self.controller.record_failure(key)
+
+    def adjust(self):
+        for key in list(self.controller.windows):
+            previous = self.controller.get_concurrency(key)
+            decision, concurrency, window = self.controller.decide(key)
+            if decision == 'wait':
+                continue
+            self.apply(key)
+            self.stats.inc_value('adaptive_concurrency/decision/{}/{}'.format(decision, key))
+            self.stats.set_value('adaptive_concurrency/concurrency/{}'.format(key), concurrency)
+            self.stats.max_value('adaptive_concurrency/concurrency_max/{}'.format(key), concurrency)
+            if concurrency != previous:
+                logger.info('调整并发--{}--{}->{}--成功:{} 失败:{} 被封:{}'.format(
+                    key, previous, concurrency, window.success, window.failure, window.ban))
@@ -1,22 +1,82 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import json
+import os
 import time
 
 import pymongo
+from pymongo import InsertOne, ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
 import pymysql
 import redis
 import logging
 from scrapy.exceptions import DropItem
 from twisted.enterprise import adbapi
+from twisted.internet import defer, task, threads
 
 from custom_crawler import settings
+from custom_crawler.utils.content_store import LRUSet, compress, content_key, is_reference, reference
+from custom_crawler.utils.item_log import ItemLogWriter
 
 logger = logging.getLogger(__name__)
 
+# upsert时不直接覆盖的字段: 状态字段保持原值，抓取时间只在内容变化时更新
+UPSERT_SKIP_FIELDS = ('spider_time', 'process_status', 'upload_status', 'alter_status', 'content_hash')
+
+
+def content_hash(item):
+    """ 数据内容哈希，优先使用contents原始数据，没有contents的表使用全部业务字段 """
+    payload = item.get('contents')
+    if payload is None:
+        payload = json.dumps({k: v for k, v in dict(item).items() if k not in UPSERT_SKIP_FIELDS and k != 'collection'}, ensure_ascii=False, sort_keys=True)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def upsert_assignments(fields):
+    """ on duplicate key update 赋值语句，内容哈希变化时才更新抓取时间、标记数据变更 """
+    changed = "not (content_hash <=> values(content_hash))"
+    assignments = []
+    if 'content_hash' in fields:
+        if 'spider_time' in fields:
+            assignments.append("spider_time = if({}, values(spider_time), spider_time)".format(changed))
+        assignments.append("alter_status = if({}, 1, alter_status)".format(changed))
+    assignments.extend("{0} = values({0})".format(field) for field in fields if field not in UPSERT_SKIP_FIELDS)
+    if 'content_hash' in fields:
+        assignments.append("content_hash = values(content_hash)")
+    return assignments
+
+
+# load data 默认转义规则: 反斜杠转义制表符、换行等特殊字符，\N 表示NULL
+TSV_ESCAPE_TABLE = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+
+
+def escape_tsv(value):
+    """ 转义暂存文件中的字段值 """
+    if value is None:
+        return '\\N'
+    return str(value).translate(TSV_ESCAPE_TABLE)
+
+
+def build_insert_sql(table, fields, row_count=1, upsert=False):
+    """ 拼接(多行)insert语句，upsert模式追加on duplicate key update """
+    sub_char = "({})".format(", ".join(["%s"] * len(fields)))
+    sql = "insert into {}({}) values {}".format(table, ", ".join(fields), ", ".join([sub_char] * row_count))
+    if upsert:
+        sql += " on duplicate key update " + ", ".join(upsert_assignments(fields))
+    return sql
+
 
 class CustomCrawlerPipeline(object):
-    """ 简单数据清洗-添加必要字段 """
+    """ 简单数据清洗-添加必要字段，记录超长字段 """
+    def __init__(self, stats=None):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(stats=crawler.stats)
+
     def process_item(self, item, spider):
+        self.record_truncations(item)
         # 抓取时间
         item['spider_time'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
         item['process_status'] = 0
@@ -24,17 +84,167 @@ class CustomCrawlerPipeline(object):
         item['alter_status'] = 0
         return item
 
+    def record_truncations(self, item):
+        truncations = getattr(item, 'truncations', None)
+        if truncations is None:
+            return
+        table = item.get('collection')
+        for field, length, truncated in truncations():
+            if truncated:
+                logger.info('字段超长截断--{}.{}--长度:{}'.format(table, field, length))
+                self.inc_stats('item/truncated/{}/{}'.format(table, field))
+            else:
+                # 业务主键/url不截断，超过字段长度时写库可能失败，需要加大字段长度
+                logger.warning('主键字段超长--没有截断--{}.{}--长度:{}--{}'.format(table, field, length, item.get(field)))
+                self.inc_stats('item/overlength/{}/{}'.format(table, field))
+
+    def inc_stats(self, key):
+        if self.stats is not None:
+            self.stats.inc_value(key)
+
+
+class ContentStorePipeline(object):
+    """ 内容存储-大字段压缩后按sha1去重存入content_store表，数据表中只保存 content:<sha1> 引用 """
+    def __init__(self, dbpool, fields, codec='zstd', min_size=256, cache_size=100000, stats=None):
+        self.dbpool = dbpool
+        self.fields = fields
+        self.codec = codec
+        self.min_size = min_size
+        self.stored = LRUSet(cache_size)  # 最近已经存储的内容，不再重复发送
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        dbparms = dict(
+            host=crawler.settings.get('DB_HOST'),
+            db=crawler.settings.get('DB_NAME'),
+            user=crawler.settings.get('DB_USER'),
+            passwd=crawler.settings.get('DB_PASSWORD'),
+            charset=crawler.settings.get('DB_CHARSET'),
+            cursorclass=pymysql.cursors.Cursor,
+            use_unicode=True,
+            connect_timeout=600,
+        )
+        dbpool = adbapi.ConnectionPool('pymysql', **dbparms)
+        return cls(
+            dbpool,
+            fields=crawler.settings.getlist('CONTENT_STORE_FIELDS'),
+            codec=crawler.settings.get('CONTENT_STORE_CODEC', 'zstd'),
+            min_size=crawler.settings.getint('CONTENT_STORE_MIN_SIZE', 256),
+            cache_size=crawler.settings.getint('CONTENT_STORE_CACHE_SIZE', 100000),
+            stats=crawler.stats,
+        )
+
+    def process_item(self, item, spider):
+        originals = {}
+        payloads = {}
+        for field in self.fields:
+            payload = item.get(field)
+            if not isinstance(payload, str) or len(payload) < self.min_size or is_reference(payload):
+                continue
+            key = content_key(payload)
+            originals[field] = payload
+            item[field] = reference(key)
+            if key in self.stored:
+                self.stats.inc_value('content_store/dedup')
+                continue
+            payloads[key] = payload
+        if not payloads:
+            return item
+        d = self.dbpool.runInteraction(self.do_store, payloads)
+        d.addCallbacks(self.store_success, self.store_failure, errbackArgs=(item, originals))
+        d.addCallback(lambda _: item)
+        return d
+
+    def do_store(self, cursor, payloads):
+        """ 线程中压缩并写入，相同内容已经存在时忽略 """
+        now = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
+        rows = []
+        for key, payload in payloads.items():
+            codec, data = compress(payload, self.codec)
+            rows.append((key, codec, len(payload.encode('utf-8')), data, now))
+        sql = "insert ignore into content_store(content_key, codec, raw_size, data, create_time) values {}".format(
+            ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows)))
+        cursor.execute(sql, tuple(value for row in rows for value in row))
+        return rows
+
+    def store_success(self, rows):
+        for key, codec, raw_size, data, _ in rows:
+            self.stored.add(key)
+            self.stats.inc_value('content_store/raw_bytes', raw_size)
+            self.stats.inc_value('content_store/compressed_bytes', len(data))
+        self.stats.inc_value('content_store/stored', len(rows))
+
+    def store_failure(self, failure, item, originals):
+        """ 内容存储失败时恢复原始内容，保证数据不丢 """
+        logger.error('内容存储失败--{}'.format(failure.getErrorMessage()))
+        self.stats.inc_value('content_store/failed')
+        for field, payload in originals.items():
+            item[field] = payload
+
+
+class ItemLogPipeline(object):
+    """ 本地预写日志-每条数据追加写入分段文件，再由work_utils/load_item_log.py导入数据库 """
+    def __init__(self, log_dir, segment_size, segment_seconds, stats=None):
+        self.log_dir = log_dir
+        self.segment_size = segment_size
+        self.segment_seconds = segment_seconds
+        self.stats = stats
+        self.writer = None
+        self.flush_task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            log_dir=crawler.settings.get('ITEM_LOG_DIR'),
+            segment_size=crawler.settings.getint('ITEM_LOG_SEGMENT_SIZE'),
+            segment_seconds=crawler.settings.getint('ITEM_LOG_SEGMENT_SECONDS'),
+            stats=crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        self.writer = ItemLogWriter(self.log_dir, spider.name, self.segment_size, self.segment_seconds)
+        # 每秒刷一次盘，同时检查分段是否超时需要切换
+        self.flush_task = task.LoopingCall(self.writer.flush)
+        self.flush_task.start(1, now=False)
+
+    def close_spider(self, spider):
+        if self.flush_task and self.flush_task.running:
+            self.flush_task.stop()
+        self.writer.close()
+
+    def process_item(self, item, spider):
+        size = self.writer.write(dict(item))
+        self.stats.inc_value('item_log/count')
+        self.stats.inc_value('item_log/bytes', size)
+        return item
+
 
 class MysqlTwistedPipeline(object):
     """ 异步存储到MySQL """
-    def __init__(self, dbpool):
+    def __init__(self, dbpool, stats=None, batch_size=1, batch_timeout=5, upsert=False, upsert_keys=None, max_inflight=4):
         self.dbpool = dbpool
+        self.stats = stats
         self.redis_client = redis.StrictRedis(
             host=settings.REDIS_HOST,
             port=settings.REDIS_PORT,
             password=settings.REDIS_PASSWORD,
             db=settings.REDIS_DB,
         )
+        # 批量写入: 按(表名, 字段)分组缓存，达到条数或者超时后一次性写入
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.buffers = {}
+        self.buffer_times = {}
+        self.flush_task = None
+        # upsert模式: 按业务主键 insert ... on duplicate key update，内容哈希写入content_hash字段，
+        # 由MySQL在同一条语句中对比，没有变化的行不更新(affected rows为0)，不再另外保存哈希
+        self.upsert = upsert
+        self.upsert_keys = upsert_keys or {}
+        # 背压: 每张表同时进行的写入数量有上限，超过时process_item的Deferred等待，爬虫自然降速
+        self.max_inflight = max_inflight
+        self.semaphores = {}
+        self.pending = {}
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -49,22 +259,129 @@ class MysqlTwistedPipeline(object):
             connect_timeout=600,  # 分钟，默认十分钟不操作断开
         )
         dbpool = adbapi.ConnectionPool('pymysql', **dbparms)  # 连接
-        return cls(dbpool)
+        return cls(
+            dbpool,
+            stats=crawler.stats,
+            batch_size=crawler.settings.getint('MYSQL_BATCH_SIZE', 1),
+            batch_timeout=crawler.settings.getfloat('MYSQL_BATCH_TIMEOUT', 5),
+            upsert=crawler.settings.getbool('MYSQL_UPSERT', False),
+            upsert_keys=crawler.settings.getdict('MYSQL_UPSERT_KEYS'),
+            max_inflight=crawler.settings.getint('MYSQL_MAX_INFLIGHT', 4),
+        )
+
+    def open_spider(self, spider):
+        if self.batch_size > 1:
+            self.flush_task = task.LoopingCall(self.flush_expired)
+            self.flush_task.start(1, now=False)
+
+    def close_spider(self, spider):
+        """ 爬虫关闭时把缓存的数据全部写入 """
+        if self.flush_task and self.flush_task.running:
+            self.flush_task.stop()
+        deferreds = [self.flush(key) for key in list(self.buffers)]
+        return defer.DeferredList(deferreds)
 
     def process_item(self, item, spider):
-        self.dbpool.runInteraction(self.do_insert, item)  # 调用twisted进行异步的插入操作
+        if self.upsert and self.upsert_keys.get(item.get('collection')):
+            item['content_hash'] = content_hash(item)
+        if self.batch_size > 1:
+            d = self.buffer_item(item)
+        else:
+            d = self.run_write(item.get('collection'), self.do_insert, item)  # 调用twisted进行异步的插入操作
+        d.addCallback(lambda _: item)
+        return d
+
+    def run_write(self, table, interaction, *args):
+        """ 按表限制同时写入数量，并记录排队深度 """
+        if table not in self.semaphores:
+            self.semaphores[table] = defer.DeferredSemaphore(self.max_inflight)
+            self.pending[table] = 0
+        self.pending[table] += 1
+        self.stats.set_value('mysql/queue_depth/{}'.format(table), self.pending[table])
+        self.stats.max_value('mysql/queue_depth_max/{}'.format(table), self.pending[table])
+        d = self.semaphores[table].run(self.timed_interaction, interaction, *args)
+        d.addErrback(lambda failure: logger.error('写入MySQL失败--{}--{}'.format(table, failure.getErrorMessage())))
+        d.addBoth(self.write_finished, table)
+        return d
+
+    def timed_interaction(self, interaction, *args):
+        """ 记录单次写入耗时(不含排队时间) """
+        start_time = time.time()
+        d = self.dbpool.runInteraction(interaction, *args)
+
+        def record_latency(result):
+            latency = int((time.time() - start_time) * 1000)
+            self.stats.inc_value('mysql/write_count')
+            self.stats.inc_value('mysql/write_latency_ms_total', latency)
+            self.stats.max_value('mysql/write_latency_ms_max', latency)
+            if isinstance(result, int):
+                # upsert时新插入的行计1，更新的行计2，内容没变化的行计0
+                self.stats.inc_value('mysql/affected_rows', result)
+            return result
+        d.addBoth(record_latency)
+        return d
+
+    def write_finished(self, result, table):
+        self.pending[table] -= 1
+        self.stats.set_value('mysql/queue_depth/{}'.format(table), self.pending[table])
+        return result
+
+    def build_sql(self, table, fields, row_count=1):
+        return build_insert_sql(table, fields, row_count, upsert=self.upsert and table in self.upsert_keys)
+
+    def buffer_item(self, item):
+        """ 缓存数据，够一批就写入 """
+        row = dict(item)
+        table = row.pop('collection')
+        key = (table, tuple(row.keys()))
+        if key not in self.buffers:
+            self.buffers[key] = []
+            self.buffer_times[key] = time.time()
+        self.buffers[key].append(row)
+        if len(self.buffers[key]) >= self.batch_size:
+            return self.flush(key)
+        return defer.succeed(None)
+
+    def flush_expired(self):
+        """ 定时检查，超时的批次直接写入 """
+        now = time.time()
+        for key, start_time in list(self.buffer_times.items()):
+            if now - start_time >= self.batch_timeout:
+                self.flush(key)
+
+    def flush(self, key):
+        rows = self.buffers.pop(key, [])
+        self.buffer_times.pop(key, None)
+        if not rows:
+            return defer.succeed(None)
+        table, fields = key
+        return self.run_write(table, self.do_batch_insert, table, fields, rows)
+
+    def do_batch_insert(self, cursor, table, fields, rows):
+        """ 多行insert一次写入，整批失败时退回逐条写入 """
+        sql = self.build_sql(table, fields, len(rows))
+        values = tuple(value for row in rows for value in row.values())
+        try:
+            cursor.execute(sql, values)
+            logger.debug('批量插入成功--{}条'.format(len(rows)))
+            return cursor.rowcount
+        except Exception as e:
+            logger.debug('批量插入失败--{}--改为逐条插入'.format(repr(e)))
+            return sum(self.insert_row(cursor, table, row) for row in rows)
 
     def do_insert(self, cursor, item):
-        table = item.get('collection')
-        item.pop('collection')
-        fields = ", ".join(list(item.keys()))
-        sub_char = ", ".join(["%s"] * len(item))
+        row = dict(item)
+        table = row.pop('collection')
+        return self.insert_row(cursor, table, row)
+
+    def insert_row(self, cursor, table, item):
         values = tuple(list(item.values()))
-        sql = "insert into {}({}) values ({})".format(table, fields, sub_char)
+        sql = self.build_sql(table, list(item.keys()))
         # sql = "insert into %s(%s) values (%s)" % (table, fields, sub_char)
         try:
             cursor.execute(sql, values)
             logger.debug('插入成功')
+            return cursor.rowcount
         except Exception as e:
             if "Duplicate" in repr(e):
                 logger.info("数据重复--删除")
@@ -72,29 +389,261 @@ class MysqlTwistedPipeline(object):
             else:
                 logger.info('插入失败--{}'.format(repr(e)))
                 self.redis_client.sadd("baidu_xin:error_items", json.dumps(dict(item), ensure_ascii=False))
+            return 0
+
+
+class MysqlBulkLoadPipeline(object):
+    """
+    大批量首次导入-按表写TSV暂存文件，达到大小/时间后 load data local infile 导入MySQL
+    字段顺序和work_utils中建表模型一致，local导入时重复数据会被忽略
+    """
+    def __init__(self, dbpool, stage_dir, load_size, load_seconds, charset, stats=None):
+        self.dbpool = dbpool
+        self.stage_dir = stage_dir
+        self.load_size = load_size
+        self.load_seconds = load_seconds
+        self.charset = charset
+        self.stats = stats
+        self.columns = {}
+        self.stages = {}
+        self.seq = 0
+        self.load_task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        dbparms = dict(
+            host=crawler.settings.get('DB_HOST'),
+            db=crawler.settings.get('DB_NAME'),
+            user=crawler.settings.get('DB_USER'),
+            passwd=crawler.settings.get('DB_PASSWORD'),
+            charset=crawler.settings.get('DB_CHARSET'),
+            cursorclass=pymysql.cursors.Cursor,
+            use_unicode=True,
+            local_infile=True,  # 允许 load data local infile
+            connect_timeout=600,
+        )
+        dbpool = adbapi.ConnectionPool('pymysql', **dbparms)
+        return cls(
+            dbpool,
+            stage_dir=crawler.settings.get('MYSQL_BULK_LOAD_DIR'),
+            load_size=crawler.settings.getint('MYSQL_BULK_LOAD_SIZE'),
+            load_seconds=crawler.settings.getint('MYSQL_BULK_LOAD_SECONDS'),
+            charset=crawler.settings.get('DB_CHARSET'),
+            stats=crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        from custom_crawler.utils.table_models import table_columns  # 依赖sqlalchemy，用到时再导入
+        os.makedirs(self.stage_dir, exist_ok=True)
+        self.columns = table_columns()
+        self.load_task = task.LoopingCall(self.load_expired)
+        self.load_task.start(1, now=False)
+
+    def close_spider(self, spider):
+        """ 爬虫关闭时把暂存文件全部导入 """
+        if self.load_task and self.load_task.running:
+            self.load_task.stop()
+        deferreds = [self.load(table) for table in list(self.stages)]
+        return defer.DeferredList(deferreds)
+
+    def process_item(self, item, spider):
+        table = item.get('collection')
+        columns = self.columns.get(table)
+        if not columns:
+            logger.info('没有建表模型，无法导入--{}'.format(table))
+            return item
+        stage = self.stages.get(table)
+        if not stage:
+            stage = self.open_stage(table)
+        line = '\t'.join(escape_tsv(item.get(column)) for column in columns) + '\n'
+        stage['file'].write(line)
+        stage['size'] += len(line)
+        stage['rows'] += 1
+        if stage['size'] >= self.load_size:
+            d = self.load(table)
+            d.addCallback(lambda _: item)
+            return d
+        return item
+
+    def open_stage(self, table):
+        self.seq += 1
+        path = os.path.join(self.stage_dir, '{}-{}-{}-{:06d}.tsv'.format(table, time.strftime('%Y%m%d%H%M%S'), os.getpid(), self.seq))
+        stage = dict(file=open(path, 'w', encoding='utf-8', newline=''), path=path, size=0, rows=0, time=time.time())
+        self.stages[table] = stage
+        return stage
+
+    def load_expired(self):
+        """ 定时检查，超时的暂存文件直接导入 """
+        now = time.time()
+        for table, stage in list(self.stages.items()):
+            if now - stage['time'] >= self.load_seconds:
+                self.load(table)
+
+    def load(self, table):
+        stage = self.stages.pop(table, None)
+        if not stage:
+            return defer.succeed(None)
+        stage['file'].close()
+        d = self.dbpool.runInteraction(self.do_load, table, stage['path'])
+        d.addCallbacks(self.load_success, self.load_failure, callbackArgs=(stage,), errbackArgs=(stage,))
+        return d
+
+    def do_load(self, cursor, table, path):
+        sql = (
+            "load data local infile %s into table {} character set {} "
+            "fields terminated by '\\t' escaped by '\\\\' lines terminated by '\\n' ({})"
+        ).format(table, self.charset, ", ".join(self.columns[table]))
+        cursor.execute(sql, (path,))
+        return cursor.rowcount
+
+    def load_success(self, loaded, stage):
+        logger.info('导入完成--{}--写入{}条/共{}条'.format(stage['path'], loaded, stage['rows']))
+        self.stats.inc_value('mysql_bulk_load/files')
+        self.stats.inc_value('mysql_bulk_load/rows', stage['rows'])
+        self.stats.inc_value('mysql_bulk_load/loaded', loaded)
+        os.remove(stage['path'])
+
+    def load_failure(self, failure, stage):
+        """ 导入失败保留暂存文件，方便手工重新导入 """
+        logger.error('导入失败--{}--{}'.format(stage['path'], failure.getErrorMessage()))
+        self.stats.inc_value('mysql_bulk_load/failed_files')
+        os.rename(stage['path'], stage['path'] + '.failed')
 
 
 class MongodbIndexPipeline(object):
-    """ 存储到mongodb数据库并且创建索引 """
-    def __init__(self, mongo_uri, mongo_db):
+    """
+    存储到mongodb数据库并且创建索引
+    索引在线程中创建，不阻塞reactor；业务主键唯一索引是部分索引，只包含主键字段都是字符串的文档(缺少字段或为null的不参与)
+    已有集合中有重复数据时唯一索引创建失败，只记录日志和stats，数据仍然按业务主键upsert写入
+    有业务主键的集合按主键ReplaceOne(upsert)写入，重新抓取时更新已有文档；没有业务主键的直接插入
+    """
+    def __init__(self, mongo_uri, mongo_db, stats=None, collections=None, unique_keys=None, batch_size=100, batch_timeout=5):
         self.client = pymongo.MongoClient(mongo_uri)
         self.db = self.client[mongo_db]
+        self.stats = stats
+        # 索引只在爬虫启动(或第一次遇到新集合)时创建一次，失败也不再重试
+        self.collections = collections or []
+        self.unique_keys = unique_keys or {}
+        self.indexed = set()
+        # 按集合缓存，批量无序写入
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.buffers = {}
+        self.buffer_times = {}
+        self.flush_task = None
 
     @classmethod
     def from_crawler(cls, crawler):
         return cls(
             mongo_uri=crawler.settings.get('MONGO_URI'),
-            mongo_db=crawler.settings.get('MONGO_DATA_BASE')
+            mongo_db=crawler.settings.get('MONGO_DATA_BASE'),
+            stats=crawler.stats,
+            collections=crawler.settings.getlist('MONGO_COLLECTIONS'),
+            unique_keys=crawler.settings.getdict('MYSQL_UPSERT_KEYS'),  # 业务主键和MySQL共用
+            batch_size=crawler.settings.getint('MONGO_BATCH_SIZE', 100),
+            batch_timeout=crawler.settings.getfloat('MONGO_BATCH_TIMEOUT', 5),
         )
 
-    def process_item(self, item, spider):
-        collection_name = item.get('collection')
+    def open_spider(self, spider):
+        for collection_name in self.collections:
+            self.ensure_index(collection_name)
+        self.flush_task = task.LoopingCall(self.flush_expired)
+        self.flush_task.start(1, now=False)
+
+    def close_spider(self, spider):
+        """ 爬虫关闭时把缓存的数据全部写入 """
+        if self.flush_task and self.flush_task.running:
+            self.flush_task.stop()
+        deferreds = [self.flush(name) for name in list(self.buffers)]
+        return defer.DeferredList(deferreds)
+
+    def ensure_index(self, collection_name):
+        """ 每个集合只创建一次，在线程中执行 """
+        if collection_name in self.indexed:
+            return
+        self.indexed.add(collection_name)
+        d = threads.deferToThread(self.create_indexes, collection_name)
+        d.addErrback(self.index_failed, collection_name)
+        return d
+
+    def create_indexes(self, collection_name):
         collection = self.db[collection_name]
         collection.create_index([('ent_name', 1), ('spider_time', -1)])  # 1表示升序，-1降序
+        keys = self.unique_keys.get(collection_name)
+        if keys:
+            collection.create_index(
+                [(key, 1) for key in keys], unique=True, name='uk_natural_key',
+                partialFilterExpression={key: {'$type': 'string'} for key in keys},
+            )
+
+    def index_failed(self, failure, collection_name):
+        failure.trap(PyMongoError)
+        logger.error('mongodb创建索引失败--{}--{}--已有重复数据时需要先去重'.format(collection_name, failure.getErrorMessage()))
+        self.stats.inc_value('mongo/index_error')
+
+    def process_item(self, item, spider):
+        collection_name = item.get('collection')
+        self.ensure_index(collection_name)
+        document = dict(item)
+        document.pop('collection')
+        if collection_name not in self.buffers:
+            self.buffers[collection_name] = []
+            self.buffer_times[collection_name] = time.time()
+        self.buffers[collection_name].append(document)
+        if len(self.buffers[collection_name]) >= self.batch_size:
+            d = self.flush(collection_name)
+            d.addCallback(lambda _: item)
+            return d
+        return item
+
+    def flush_expired(self):
+        """ 定时检查，超时的批次直接写入 """
+        now = time.time()
+        for collection_name, start_time in list(self.buffer_times.items()):
+            if now - start_time >= self.batch_timeout:
+                self.flush(collection_name)
+
+    def flush(self, collection_name):
+        documents = self.buffers.pop(collection_name, [])
+        self.buffer_times.pop(collection_name, None)
+        if not documents:
+            return defer.succeed(None)
+        d = threads.deferToThread(self.do_write_many, collection_name, documents)
+        d.addCallback(self.record_result)
+        d.addErrback(lambda failure: logger.error('写入mongodb失败--{}--{}'.format(collection_name, failure.getErrorMessage())))
+        return d
+
+    def record_result(self, result):
+        inserted, updated, duplicates, errors = result
+        self.stats.inc_value('mongo/inserted', inserted)
+        if updated:
+            self.stats.inc_value('mongo/updated', updated)
+        if duplicates:
+            self.stats.inc_value('mongo/duplicate', duplicates)
+        if errors:
+            self.stats.inc_value('mongo/write_error', errors)
+
+    def write_request(self, keys, document):
+        """ 业务主键都是字符串时按主键替换(没有时插入)，否则直接插入 """
+        if keys and all(isinstance(document.get(key), str) for key in keys):
+            return ReplaceOne({key: document[key] for key in keys}, document, upsert=True)
+        return InsertOne(document)
+
+    def do_write_many(self, collection_name, documents):
+        """ 无序批量写入(线程中执行)，返回(新增, 更新, 重复, 错误)条数 """
+        keys = self.unique_keys.get(collection_name)
+        requests = [self.write_request(keys, document) for document in documents]
         try:
-            item.pop('collection')
-            collection.insert(dict(item))
-        except:
-            from scrapy import log
-            log.msg(message="dup key: {}".format(item["url"]), level=log.INFO)
-        return item
\ No newline at end of file
+            result = self.db[collection_name].bulk_write(requests, ordered=False)
+            return result.inserted_count + result.upserted_count, result.modified_count, 0, 0
+        except BulkWriteError as e:
+            details = e.details
+            write_errors = details.get('writeErrors', [])
+            # 同一批中主键相同的文档同时upsert时也会重复
+            duplicates = len([error for error in write_errors if error.get('code') == 11000])
+            errors = len(write_errors) - duplicates
+            if errors:
+                logger.info('mongodb批量写入部分失败--{}--{}'.format(collection_name, write_errors[0].get('errmsg')))
+            logger.debug('mongodb批量写入重复数据{}条'.format(duplicates))
+            inserted = details.get('nInserted', 0) + details.get('nUpserted', 0)
+            return inserted, details.get('nModified', 0), duplicates, errors
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from scrapy_redis.scheduler import Scheduler
+
+
+class BloomScheduler(Scheduler):
+    """
+    scrapy_redis调度器-创建去重器时只传入server、key、debug，
+    这里在去重器第一次使用之前把爬虫配置和stats交给它(BloomDupeFilter)，关闭时保存去重器的状态
+    """
+    def open(self, spider):
+        flush_on_start, self.flush_on_start = self.flush_on_start, False
+        super().open(spider)
+        self.flush_on_start = flush_on_start
+        if hasattr(self.df, 'set_options'):
+            self.df.set_options(spider.settings, self.stats)
+        if self.flush_on_start:
+            self.flush()
+
+    def close(self, reason):
+        self.df.close(reason)
+        super().close(reason)
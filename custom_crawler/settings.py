@@ -12,12 +12,74 @@ scrapy 基本配置
 ROBOTSTXT_OBEY = False
 LOG_LEVEL = 'INFO'
 
+# 随机请求头(RandomUserAgentMiddleware): 离线UA数据文件(为空时使用data/user_agents.json)，
+# 浏览器(random 或 chrome/edge/firefox/safari)，平台(为空不限)，同一代理是否固定UA
+RANDOM_UA_FILE = ''
+RANDOM_UA_TYPE = 'random'
+RANDOM_UA_PLATFORMS = []
+RANDOM_UA_PER_PROXY = False
+
+# 重试中间件(ProxyRetryMiddlerware): 按异常类型处理，rotate(隔离代理立即重试) retry(立即重试) backoff(延迟重试) giveup(不重试)
+RETRY_EXCEPTION_ACTIONS = {
+    'twisted.internet.error.ConnectionRefusedError': 'rotate',
+    'scrapy.core.downloader.handlers.http11.TunnelError': 'rotate',
+    'twisted.internet.error.TCPTimedOutError': 'retry',
+    'twisted.internet.error.TimeoutError': 'retry',
+    'twisted.internet.defer.TimeoutError': 'retry',
+    'twisted.internet.error.ConnectError': 'retry',
+    'twisted.internet.error.ConnectionLost': 'retry',
+    'twisted.internet.error.ConnectionDone': 'retry',
+    'twisted.web._newclient.ResponseNeverReceived': 'retry',
+    'twisted.web._newclient.ResponseFailed': 'retry',
+    'twisted.internet.error.DNSLookupError': 'backoff',
+    'builtins.ConnectionError': 'retry',
+    'builtins.IOError': 'retry',
+}
+RETRY_EXCEPTION_DEFAULT = 'giveup'
+# 延迟重试: 同一原因第n次重试等待 RETRY_BACKOFF_BASE * 2^(n-1) 秒(加随机抖动)，最长 RETRY_BACKOFF_MAX 秒
+RETRY_BACKOFF_BASE = 1
+RETRY_BACKOFF_MAX = 60
+RETRY_BACKOFF_REASONS = {}  # 按原因(状态码)单独设置退避基数，如 {'403': 2}
+# 自适应并发(AdaptiveConcurrencyMiddleware): 每个域名从START开始，每INTERVAL秒按窗口内结果调整一次
+# 被封比例>=BAN_THRESHOLD时并发乘以DECREASE，成功率>=SUCCESS_THRESHOLD且平均延迟<=TARGET_LATENCY时并发加INCREASE
+# 并发上限同时受CONCURRENT_REQUESTS限制
+ADAPTIVE_CONCURRENCY_ENABLED = False
+ADAPTIVE_CONCURRENCY_START = 4
+ADAPTIVE_CONCURRENCY_MIN = 1
+ADAPTIVE_CONCURRENCY_MAX = 16
+ADAPTIVE_CONCURRENCY_INCREASE = 1
+ADAPTIVE_CONCURRENCY_DECREASE = 0.5
+ADAPTIVE_CONCURRENCY_BAN_THRESHOLD = 0.05
+ADAPTIVE_CONCURRENCY_SUCCESS_THRESHOLD = 0.95
+ADAPTIVE_CONCURRENCY_TARGET_LATENCY = 3.0
+ADAPTIVE_CONCURRENCY_MIN_SAMPLES = 10
+ADAPTIVE_CONCURRENCY_INTERVAL = 5
+ADAPTIVE_CONCURRENCY_JSON_URLS = []  # 返回json的接口url(正则)，这些接口返回的不是json时算作IP被封(自适应并发降速、隔离代理并延迟重试)
+
+# 死信队列: 重试次数用完的请求完整保存在redis <spider>:dead_letter
+# 重放模式(scrapy crawl <spider> -s DEAD_LETTER_REPLAY=1): 每INTERVAL秒最多放回BATCH个请求，调度器积压超过MAX_PENDING时暂停
+EXTENSIONS = {
+    'custom_crawler.extensions.DeadLetterReplay': 500,
+}
+DEAD_LETTER_REPLAY = False
+DEAD_LETTER_REPLAY_BATCH = 100
+DEAD_LETTER_REPLAY_INTERVAL = 10
+DEAD_LETTER_REPLAY_MAX_PENDING = 1000
+
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 数据存储 相关配置
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 # 存储到mongodb
 MONGO_URI = '127.0.0.1'
 MONGO_DATA_BASE = 'custom_crawler'
+# mongodb 启动时创建索引的集合，批量写入条数和批次最长等待秒数
+MONGO_COLLECTIONS = [
+    'business_information', 'share_information', 'wenshu_information', 'discredit_information',
+    'abnormal_information', 'penalties_information', 'freeze_infomation', 'illegal_infomation',
+    'gsxt_business_information', 'gsxt_abnormal_information',
+]
+MONGO_BATCH_SIZE = 100
+MONGO_BATCH_TIMEOUT = 5
 # 存储到MySQL
 DB_HOST = "127.0.0.1"
 DB_PORT = 3306
@@ -25,6 +87,39 @@ DB_USER = 'root'
 DB_PASSWORD = '123456'
 DB_NAME = 'custom_crawler'
 DB_CHARSET = 'utf8'
+# MySQL 批量写入: 每批条数(<=1 逐条写入)，批次最长等待秒数
+MYSQL_BATCH_SIZE = 1
+MYSQL_BATCH_TIMEOUT = 5
+# MySQL 每张表同时写入的最大数量，超过后阻塞item处理(背压)
+MYSQL_MAX_INFLIGHT = 4
+# MySQL 大批量导入(MysqlBulkLoadPipeline): 暂存目录，单个暂存文件达到字节数或秒数后 load data 导入
+MYSQL_BULK_LOAD_DIR = 'bulk_load'
+MYSQL_BULK_LOAD_SIZE = 256 * 1024 * 1024
+MYSQL_BULK_LOAD_SECONDS = 600
+# MySQL upsert: 按业务主键(唯一索引uk_natural_key)更新数据，内容哈希没变化的行不更新
+# 已有的表需要先运行 work_utils/migrate_upsert.py --apply 添加content_hash字段、去重并建唯一索引
+MYSQL_UPSERT = False
+MYSQL_UPSERT_KEYS = {
+    'business_information': ('url',),
+    'share_information': ('ent_name', 'gd_name'),
+    'wenshu_information': ('url',),
+    'discredit_information': ('url', 'implement_number'),
+    'abnormal_information': ('ent_name', 'enter_date', 'authority'),
+    'penalties_information': ('url', 'cf_wsh'),
+    'freeze_infomation': ('url',),
+    'illegal_infomation': ('ent_name', 'enter_date', 'authority'),
+    'gsxt_business_information': ('url',),
+    'gsxt_abnormal_information': ('ent_name', 'enter_date', 'authority'),
+}
+# 内容存储(ContentStorePipeline): 需要压缩去重存储的大字段，压缩方式(zstd不可用时用zlib)，最小字节数，本地去重缓存条数
+CONTENT_STORE_FIELDS = ['contents', 'content_node']
+CONTENT_STORE_CODEC = 'zstd'
+CONTENT_STORE_MIN_SIZE = 256
+CONTENT_STORE_CACHE_SIZE = 100000
+# 本地预写日志(ItemLogPipeline): 目录，单个分段最大字节数，单个分段最长写入秒数
+ITEM_LOG_DIR = 'item_log'
+ITEM_LOG_SEGMENT_SIZE = 64 * 1024 * 1024
+ITEM_LOG_SEGMENT_SECONDS = 300
 
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 redis 相关配置
@@ -38,8 +133,59 @@ REDIS_PARAMS = {
     "password": "",
     "db": 4,
 }
+# 布隆过滤器去重(BloomDupeFilter): 第0层容量(超过后自动扩容)，总误判率，本地精确保存的最近指纹数量(0为关闭)
+BLOOM_DUPEFILTER_CAPACITY = 100000000
+BLOOM_DUPEFILTER_ERROR_RATE = 0.0001
+BLOOM_DUPEFILTER_RECENT_SIZE = 100000
+# 请求去重按天数分桶轮换(0为不轮换，一直去重)，过滤器在最后一次写入一个周期后过期
+BLOOM_DUPEFILTER_CYCLE_DAYS = 0
+# 百度企业信用没有结果的关键词布隆过滤器: 第0层容量，总误判率
+KEYWORD_BLOOM_CAPACITY = 10000000
+KEYWORD_BLOOM_ERROR_RATE = 0.0001
+# 百度企业信用关键词: 调度器中的请求少于THRESHOLD时每INTERVAL秒从redis取一批，每批最多BATCH个
+KEYWORD_FEED_BATCH = 100
+KEYWORD_FEED_THRESHOLD = 500
+KEYWORD_FEED_INTERVAL = 5
+# 百度企业信用关键词优先级: 按去掉省份后的前PREFIX_LENGTH个字分族，族的优先级 = 族中最高score * (FLOOR + 收益率)
+# 收益 = 新企业比例 * min(1, ln(1+结果数)/ln(1+SATURATION))，按ALPHA做指数滑动平均，没有观测时为DEFAULT
+KEYWORD_FAMILY_PREFIX_LENGTH = 2
+KEYWORD_YIELD_DEFAULT = 0.5
+KEYWORD_YIELD_ALPHA = 0.2
+KEYWORD_YIELD_FLOOR = 0.1
+KEYWORD_YIELD_SATURATION = 1000
+# 实体去重(百度pid/公示系统pripid): 本周期已经抓取过详情(解析成功)的企业不再请求，是否跳过，
+# 周期天数(按天数自动分桶换周期，过滤器在最后一次写入CYCLE_DAYS天后过期，0为不分周期、不过期)，
+# 手动指定的周期名(为空时按天数分桶)，第0层容量，总误判率
+ENTITY_DEDUP_ENABLED = True
+ENTITY_DEDUP_CYCLE_DAYS = 7
+ENTITY_DEDUP_CYCLE = ''
+ENTITY_DEDUP_CAPACITY = 50000000
+ENTITY_DEDUP_ERROR_RATE = 0.0001
+# 新鲜度索引(百度企业信用): 重新抓取企业时基本信息没变化的只请求超过TTL(秒)的子模块，索引保留RETENTION秒
+FRESHNESS_ENABLED = False
+FRESHNESS_DEFAULT_TTL = 7 * 24 * 3600
+FRESHNESS_TTL = {
+    'shares': 30 * 24 * 3600,
+    'wenshu': 7 * 24 * 3600,
+    'discredit': 7 * 24 * 3600,
+    'abnormal': 15 * 24 * 3600,
+    'penalties': 15 * 24 * 3600,
+    'stock_freeze': 15 * 24 * 3600,
+    'illegal': 30 * 24 * 3600,
+}
+FRESHNESS_RETENTION = 180 * 24 * 3600
+# 百度企业信用搜索最多翻SEARCH_PAGE_CAP页，结果超出时按筛选项、省份拆分，最多拆分SEARCH_PARTITION_MAX_DEPTH层
+SEARCH_PAGE_CAP = 100
+SEARCH_PARTITION_MAX_DEPTH = 4
 # redis 代理池配置
 REDIS_PROXIES_HOST = '117.78.35.12'
 REDIS_PROXIES_PORT = 6379
 REDIS_PROXIES_PASSWORD = ''
-REDIS_PROXIES_DB = 15
\ No newline at end of file
+REDIS_PROXIES_DB = 15
+REDIS_PROXIES_KEY = 'proxies'
+PROXY_REFRESH_INTERVAL = 5  # 本地代理缓存同步间隔(秒)
+PROXY_BAN_COOLDOWN = 60  # 代理被封后在该域名上的隔离秒数，连续被封时翻倍
+PROXY_BAN_MAX_COOLDOWN = 1800
+# 代理会话: meta中proxy_session相同的请求(同一个企业的各个模块)固定使用一个代理，最多记录的会话数量
+PROXY_SESSION_ENABLED = False
+PROXY_SESSION_CAPACITY = 10000
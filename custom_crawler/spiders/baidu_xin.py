@@ -8,12 +8,26 @@ import jsonpath
 import redis
 import scrapy
 import logging
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from twisted.internet import task
 
 from custom_crawler import config, settings
-from custom_crawler.utils.redis_bloomfilter import BloomFilter
+from custom_crawler.items import (
+    AbnormalInformationItem, BusinessInformationItem, DiscreditInformationItem, FreezeInfomationItem,
+    IllegalInfomationItem, PenaltiesInformationItem, ShareInformationItem, WenshuInformationItem,
+)
+from custom_crawler.utils.entity_filter import EntitySeenFilter
+from custom_crawler.utils.freshness import FreshnessIndex, payload_hash
+from custom_crawler.utils.keyword_queue import KeywordQueue
+from custom_crawler.utils.partition import Partition, PartitionPlanner, freeze_condition
+from custom_crawler.utils.redis_bloomfilter import ScalableBloomFilter
 
 logger = logging.getLogger(__name__)
 
+# 详情页的子模块，新鲜度索引按模块记录和设置TTL
+DETAIL_MODULES = ('shares', 'wenshu', 'discredit', 'abnormal', 'penalties', 'stock_freeze', 'illegal')
+
 
 class BaiduXinSpider(scrapy.Spider):
     name = 'baidu_xin'
@@ -29,113 +43,204 @@ class BaiduXinSpider(scrapy.Spider):
         password=settings.REDIS_PASSWORD,
         db=settings.REDIS_DB
     )
-    reids_name = name + ':keywords'
-
-    # 布隆过滤器-用来过滤关键词(该关键词没有搜索结果，可以抛弃)
-    bloomfilter_client = BloomFilter(
-        host=settings.REDIS_HOST,
-        port=settings.REDIS_PORT,
-        password=settings.REDIS_PASSWORD,
-        db=settings.REDIS_DB,
-        blockNum=1,
-        key=name + ":bloomfilter"
+    # 按收益排序的关键词队列，由 work_utils/get_keyword.py 导入
+    keyword_queue = KeywordQueue(
+        redis_keyword,
+        key=name + ':keyword_queue',
+        prefix_length=settings.KEYWORD_FAMILY_PREFIX_LENGTH,
+        default_yield=settings.KEYWORD_YIELD_DEFAULT,
+        alpha=settings.KEYWORD_YIELD_ALPHA,
+        floor=settings.KEYWORD_YIELD_FLOOR,
+        saturation=settings.KEYWORD_YIELD_SATURATION,
     )
 
+    # 布隆过滤器-用来过滤关键词(该关键词没有搜索结果，可以抛弃)，数量超过容量时自动扩容
+    # 旧的过滤器数据用 work_utils/bloomfilter_admin.py adopt 接入
+    bloomfilter_client = ScalableBloomFilter(
+        redis_keyword,
+        key=name + ":bloomfilter",
+        capacity=settings.KEYWORD_BLOOM_CAPACITY,
+        error_rate=settings.KEYWORD_BLOOM_ERROR_RATE,
+    )
     base_item = {
         'xxly': '百度企业信用-信息查询系统-数据补充'
     }
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.feed_batch = crawler.settings.getint('KEYWORD_FEED_BATCH', 100)
+        spider.feed_threshold = crawler.settings.getint('KEYWORD_FEED_THRESHOLD', 500)
+        spider.feed_interval = crawler.settings.getfloat('KEYWORD_FEED_INTERVAL', 5)
+        spider.feed_task = None
+        # 实体去重-本周期已经出现过的企业pid，同时用来计算关键词搜索结果中新企业的比例
+        spider.entity_filter = EntitySeenFilter.from_crawler(crawler, spider.name)
+        # 新鲜度索引-重新抓取企业时只请求到期或基本信息变化的子模块
+        spider.freshness = FreshnessIndex.from_crawler(crawler, spider.name)
+        spider.planner = PartitionPlanner(
+            spider.province_list,
+            page_cap=crawler.settings.getint('SEARCH_PAGE_CAP', 100),
+            max_depth=crawler.settings.getint('SEARCH_PARTITION_MAX_DEPTH', 4),
+        )
+        crawler.signals.connect(spider.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        return spider
+
     def start_requests(self):
-        """ 关键词搜索入口 """
-        # keyword = '深圳市明星康桥投资有限公司'
-        while True:
-            keyword = self.redis_keyword.rpop(self.reids_name)
-            if not keyword:
-                break
-            keyword = keyword.decode()
-            url = 'https://xin.baidu.com/s/l?q={}&t=0&p=1&s=10&o=0&f=undefined&fl=1&castk=LTE%3d'.format(keyword)
-            yield scrapy.Request(
-                url=url,
-                meta={'keyword': keyword},
-            )
+        """ 关键词搜索入口-由feed_keywords按调度器积压情况分批从redis取关键词，这里不再一次取完 """
+        return []
+
+    def keyword_request(self, keyword):
+        return self.search_request(Partition(keyword), yield_feedback=True)
+
+    def spider_opened(self, spider):
+        self.feed_task = task.LoopingCall(self.feed_keywords)
+        self.feed_task.start(self.feed_interval, now=True)
+
+    def feed_keywords(self):
+        """
+        调度器中的请求少于KEYWORD_FEED_THRESHOLD时才取关键词，每次最多KEYWORD_FEED_BATCH个，多个节点公平分享
+        按关键词族的收益从高到低取
+        """
+        try:
+            pending = len(self.crawler.engine.slot.scheduler)
+            if pending >= self.feed_threshold:
+                return 0
+            count = min(self.feed_batch, self.feed_threshold - pending)
+            keywords = self.keyword_queue.pop_many(count)
+        except Exception as e:
+            logger.error('获取关键词失败--{}'.format(repr(e)))
+            return 0
+        for keyword in keywords:
+            self.crawler.engine.crawl(self.keyword_request(keyword), self)
+        if keywords:
+            self.crawler.stats.inc_value('keyword/fed', len(keywords))
+            logger.info('获取关键词--{}个--调度器积压:{}'.format(len(keywords), pending))
+        return len(keywords)
+
+    def spider_idle(self, spider):
+        """ 没有关键词时也不关闭爬虫，等待新的关键词 """
+        self.feed_keywords()
+        raise DontCloseSpider
+
+    def closed(self, reason):
+        """ 关键词布隆过滤器的估算、实体去重命中率、搜索分区的覆盖率写入stats """
+        if self.feed_task and self.feed_task.running:
+            self.feed_task.stop()
+        self.bloomfilter_client.record_stats(self.crawler.stats, 'keyword_bloom')
+        self.entity_filter.record_stats()
+        covered = self.crawler.stats.get_value('partition/covered_results', 0)
+        lost = (self.crawler.stats.get_value('partition/truncated_results', 0) +
+                self.crawler.stats.get_value('partition/uncovered_results', 0))
+        if covered + lost:
+            self.crawler.stats.set_value('partition/coverage', round(float(covered) / (covered + lost), 4))
+
+    def record_yield(self, keyword, results, exists):
+        """ 关键词第一页的结果数和新企业比例(exists为每个pid本周期是否出现过)反馈到关键词族的优先级 """
+        totalNumFound = jsonpath.jsonpath(results, expr='$..data.totalNumFound')
+        total_count = totalNumFound[0] if totalNumFound else 0
+        new_ratio = float(exists.count(False)) / len(exists) if exists else 0.0
+        try:
+            family, family_yield = self.keyword_queue.record_yield(keyword, total_count, new_ratio)
+        except redis.RedisError as e:
+            logger.error('关键词收益更新失败--{}--{}'.format(keyword, repr(e)))
+            return
+        self.crawler.stats.inc_value('keyword/yield/observed')
+        if new_ratio == 0:
+            self.crawler.stats.inc_value('keyword/yield/no_new')
+        logger.debug('关键词收益--{}--结果数:{}--新企业比例:{:.2f}--族:{}--族收益:{:.3f}'.format(
+            keyword, total_count, new_ratio, family, family_yield))
+
+    def search_request(self, partition, page=1, priority=0, yield_feedback=False):
+        """ 分区的搜索列表页请求，过滤条件使用分区自己的不可变条件 """
+        condition = partition.condition_dict()
+        f = quote(json.dumps(condition)) if condition else 'undefined'
+        url = 'https://xin.baidu.com/s/l?q={}&t=0&p={}&s=10&o=0&f={}&fl=1&castk=LTE%3d'.format(partition.keyword, page, f)
+        meta = {
+            'keyword': partition.keyword, 'filter_condition': partition.condition,
+            'partition_depth': partition.depth, 'page': page,
+        }
+        if yield_feedback:
+            meta['yield_feedback'] = True
+        return scrapy.Request(url=url, meta=meta, priority=priority)
 
     def parse(self, response):
         """ 解析搜索列表页 """
         # 基础信息
         keyword = response.meta.get('keyword')
-        base_url = 'https://xin.baidu.com/s/l?q={}&t=0&p={}&s=10&o=0&f={}&fl=1&castk=LTE%3d'
         results = json.loads(response.text)
 
-        # 列表页解析--请求详情页
+        # 列表页解析--请求详情页，本周期已经抓取过的企业(其他关键词搜到过)跳过
         resultList = results.get('data').get('resultList')
-        if not resultList:
-            return
-        for result in resultList:
-            pid = result.get('pid')  # 详情页参数
+        pids = [result.get('pid') for result in resultList or [] if result.get('pid')]  # 详情页参数
+        exists = self.entity_filter.seen_many(pids)
+        if response.meta.get('yield_feedback'):
+            self.record_yield(keyword, results, exists)
+        for pid, existed in zip(pids, exists):
+            if self.entity_filter.skip(existed):
+                continue
             detail_url = "https://xin.baidu.com/detail/basicAjax?pid={}&fl=1&castk=LTE%3D".format(pid)
             yield scrapy.Request(
                 url=detail_url,
                 callback=self.parse_details,
-                meta={'pid': pid},
+                meta={'pid': pid, 'proxy_session': pid},
                 priority=3,
             )
 
-        # 添加搜索关键词
-        msg = results.get('msg', '')
-        if msg and '+' not in msg and '搜索词过于宽泛' in msg:
-            for province in self.province_list:
-                new_keyword = province + '+' + keyword
-                url = base_url.format(new_keyword, 1, 'undefined')
-                yield scrapy.Request(
-                    url=url,
-                    meta={'keyword': new_keyword},
-                    priority=1,
-                )
-
-        # 翻页请求--最大翻页只能是100页
-        filter_condition = response.meta.get('filter_condition', {})  # 用来添加过滤条件使用
+        # 翻页和拆分只在分区的第一页做
+        if response.meta.get('page', 1) > 1:
+            return
+        condition = freeze_condition(response.meta.get('filter_condition'))
+        partition = Partition(keyword, condition, response.meta.get('partition_depth', 0))
 
         totalNumFound = jsonpath.jsonpath(results, expr='$..data.totalNumFound')  # 搜索词总结果数
         total_count = totalNumFound[0] if totalNumFound else 0
-        if total_count <= 0:
+        msg = results.get('msg', '')
+        too_broad = bool(msg) and '搜索词过于宽泛' in msg
+        if too_broad:
+            # 搜索词过于宽泛，由分区规划按筛选项、省份拆分，无法拆分时只按真实结果数翻页
+            self.crawler.stats.inc_value('partition/too_broad')
+        elif total_count <= 0:
+            if partition.condition:
+                return
             # 把搜索词添加到bloomfilter过滤掉
             if self.bloomfilter_client.is_exist(keyword):
                 logger.info(f"{keyword}--- 被过滤了")
-                return
             else:
                 logger.info(f"该搜索词没有搜索结果--{keyword}--添加到布隆过滤器")
                 self.bloomfilter_client.add(keyword)
-        else:
-            # 翻页页码总数--如果总页数不大于100直接翻页完成--大于100继续添加条件
-            totalPageNum = results.get('data').get('totalPageNum')
-            if totalPageNum:
-                for page in range(2, int(totalPageNum) + 1):
-                    if filter_condition:
-                        url = base_url.format(keyword, page, quote(json.dumps(filter_condition)))
-                    else:
-                        url = base_url.format(keyword, page, 'undefined')
+            return
 
-                    yield scrapy.Request(
-                        url=url,
-                        meta={'keyword': keyword},
-                        priority=2,
-                    )
-            # 添加搜索条件
-            if total_count > 100:
-                # logger.debug(f'信息总数超过100条--查询关键词:{keyword}')
-                filter_dict = results.get('data').get('facets')
-                if filter_dict:
-                    for key, value in filter_dict.items():
-                        filter_value_list = value.get('values')
-                        for filter_value_dict in filter_value_list:
-                            filter_condition[key] = filter_value_dict.get("value")
-                            url = base_url.format(keyword, 1, quote(json.dumps(filter_condition)))
-                            meta_data = {'keyword': keyword, 'filter_condition': filter_condition}
-                            yield scrapy.Request(
-                                url=url,
-                                meta=meta_data,
-                            )
-                        break
+        # 最大翻页只能是100页--超过时按筛选项、省份拆分成多个分区，每个分区各自翻页
+        plan = self.planner.plan(partition, total_count, results.get('data').get('facets'),
+                                 results.get('data').get('totalPageNum'), too_broad=too_broad)
+        for page in range(2, plan.pages + 1):
+            yield self.search_request(partition, page=page, priority=2)
+        for child in plan.children:
+            yield self.search_request(child, priority=1, yield_feedback=plan.split == 'province' and not child.condition)
+        self.record_partition(partition, total_count, plan)
+
+    def record_partition(self, partition, total_count, plan):
+        """ 分区覆盖情况写入stats: 叶子分区覆盖的结果数、超出翻页上限丢失的结果数、筛选项没有覆盖的结果数 """
+        stats = self.crawler.stats
+        if plan.split:
+            stats.inc_value('partition/split/' + plan.split.split(':')[0])
+            stats.inc_value('partition/children', len(plan.children))
+            if plan.uncovered:
+                stats.inc_value('partition/uncovered')
+                stats.inc_value('partition/uncovered_results', plan.uncovered)
+            return
+        if plan.too_broad:
+            # 过于宽泛又无法拆分的分区单独统计，按真实结果数翻页
+            stats.inc_value('partition/too_broad_leaf')
+        stats.inc_value('partition/leaf')
+        stats.inc_value('partition/pages', plan.pages)
+        stats.inc_value('partition/covered_results', total_count - plan.truncated)
+        if plan.truncated:
+            stats.inc_value('partition/truncated')
+            stats.inc_value('partition/truncated_results', plan.truncated)
+            logger.info('分区无法继续拆分--{}--条件:{}--超出翻页上限:{}条'.format(
+                partition.keyword, partition.condition_dict(), plan.truncated))
 
     def parse_details(self, response):
         """ 解析搜索详情页 """
@@ -146,6 +251,7 @@ class BaiduXinSpider(scrapy.Spider):
         all_data = results.get('data')
         # 携带基本信息
         base_info = {}
+        share_info = {}
         if all_data:
             entName = all_data.get('entName', '').replace("-", "")  # 企业名称
             regCapital = all_data.get('regCapital', '').replace("-", "")  # 注册资本
@@ -182,14 +288,15 @@ class BaiduXinSpider(scrapy.Spider):
                 authority=authority, estiblish_time=startDate, ent_type=entType, open_time=openTime,
                 district=district, annual_date=annualDate, scope=scope, reg_addr=regAddr, email=email,
                 telephone=telephone, description=description, old_ent_name=oldEntName, url=response.url,
-                contents=json.dumps(all_data, ensure_ascii=False), collection='business_information',
+                contents=json.dumps(all_data, ensure_ascii=False),
             )
-            base_item = {**business_item, **self.base_item}
+            base_item = BusinessInformationItem(business_item, self.base_item)
             # print(f'基本工商:{base_item}')
             yield base_item
+            # 基本信息解析成功后才记录，详情请求失败的企业下次搜到时仍然请求
+            self.entity_filter.mark(pid)
 
             # 解析股东信息
-            share_info = {}
             shares_list = all_data.get('shares')  # 股东
             if shares_list:
                 for share in shares_list:
@@ -199,9 +306,6 @@ class BaiduXinSpider(scrapy.Spider):
                         'gd_type': share.get('type'),  # 类型
                     }
                     share_info[share.get("name", "")] = share_item
-            # 请求股东信息页
-            gd_url = "https://xin.baidu.com/detail/sharesAjax?pid={}&p=1&fl=1&castk=LTE%3D".format(pid)
-            yield scrapy.Request(url=gd_url, callback=self.parse_shares, meta={'share_info': share_info}, priority=3)
             # 变更信息
 
             # print(f'详情url:{response.url}--公司名:{entName}')
@@ -209,42 +313,56 @@ class BaiduXinSpider(scrapy.Spider):
         else:
             logger.info(f'获取基本工商信息失败--{results}')
 
+        # 按新鲜度策略只请求到期的子模块(基本信息变化时全部请求)
+        due = set(self.freshness.due_modules(pid, payload_hash(all_data) if all_data else None, DETAIL_MODULES))
+        # 股东信息页
+        if all_data and 'shares' in due:
+            gd_url = "https://xin.baidu.com/detail/sharesAjax?pid={}&p=1&fl=1&castk=LTE%3D".format(pid)
+            yield scrapy.Request(url=gd_url, callback=self.parse_shares, meta={'share_info': share_info, 'pid': pid, 'proxy_session': pid}, priority=3)
+
         # 请求行政处罚-经营异常-裁判文书信息
         meta['base_info'] = base_info
         # 裁判文书
-        cpws_url = "https://xin.baidu.com/detail/lawWenshuAjax?pid={}&p=1&&fl=1&castk=LTE%3D".format(pid)
-        # print(f'裁判文书:{cpws_url}')
-        yield scrapy.Request(url=cpws_url, callback=self.parse_wenshu_list, meta=meta, priority=7)
+        if 'wenshu' in due:
+            cpws_url = "https://xin.baidu.com/detail/lawWenshuAjax?pid={}&p=1&&fl=1&castk=LTE%3D".format(pid)
+            # print(f'裁判文书:{cpws_url}')
+            yield scrapy.Request(url=cpws_url, callback=self.parse_wenshu_list, meta=meta, priority=7)
         # 失信被执行人
-        sx_url = "https://xin.baidu.com/detail/discreditAjax?pid={}&p=1&fl=1&castk=LTE%3D".format(pid)
-        # print(f'失信被执行人:{sx_url}')
-        yield scrapy.Request(url=sx_url, callback=self.parse_discredit, meta=meta, priority=7)
+        if 'discredit' in due:
+            sx_url = "https://xin.baidu.com/detail/discreditAjax?pid={}&p=1&fl=1&castk=LTE%3D".format(pid)
+            # print(f'失信被执行人:{sx_url}')
+            yield scrapy.Request(url=sx_url, callback=self.parse_discredit, meta=meta, priority=7)
         # 经营异常url
-        jyyc_url = "https://xin.baidu.com/detail/abnormalAjax?pid={}&p=1&fl=1&castk=LTE%3D".format(pid)
-        # print(f'经营异常:{jyyc_url}')
-        yield scrapy.Request(url=jyyc_url, callback=self.parse_abnormal, meta=meta, priority=7)
+        if 'abnormal' in due:
+            jyyc_url = "https://xin.baidu.com/detail/abnormalAjax?pid={}&p=1&fl=1&castk=LTE%3D".format(pid)
+            # print(f'经营异常:{jyyc_url}')
+            yield scrapy.Request(url=jyyc_url, callback=self.parse_abnormal, meta=meta, priority=7)
         # 行政处罚url
-        xzcf_url = "https://xin.baidu.com/detail/penaltiesAjax?pid={}&p=1&fl=1&castk=LTE%3D".format(pid)
-        # print(f'行政处罚:{xzcf_url}')
-        yield scrapy.Request(url=xzcf_url, callback=self.parse_penalties, meta=meta, priority=7)
+        if 'penalties' in due:
+            xzcf_url = "https://xin.baidu.com/detail/penaltiesAjax?pid={}&p=1&fl=1&castk=LTE%3D".format(pid)
+            # print(f'行政处罚:{xzcf_url}')
+            yield scrapy.Request(url=xzcf_url, callback=self.parse_penalties, meta=meta, priority=7)
         # 知识产权出质
         # zscq_url = "https://xin.baidu.com/detail/KnowledgePledgeAjax?pid={}&p=1&fl=1&castk=LTE%3D".format(pid)
         # print(f'知识产权出质:{zscq_url}')
         # yield scrapy.Request(url=zscq_url, callback=self.parse_knowledge, meta=meta, priority=7)
         # 股权冻结
-        gqdj_url = "https://xin.baidu.com/Stockfreeze/stockFreezeAjax?pid={}&p=1&fl=1&castk=LTE%3D".format(pid)
-        # print(f'股权出质:{gqdj_url}')
-        yield scrapy.Request(url=gqdj_url, callback=self.parse_stock_freeze, meta=meta, priority=7)
+        if 'stock_freeze' in due:
+            gqdj_url = "https://xin.baidu.com/Stockfreeze/stockFreezeAjax?pid={}&p=1&fl=1&castk=LTE%3D".format(pid)
+            # print(f'股权出质:{gqdj_url}')
+            yield scrapy.Request(url=gqdj_url, callback=self.parse_stock_freeze, meta=meta, priority=7)
         # 严重违法
-        yzwf_url = "https://xin.baidu.com/detail/illegalAjax?pid={}&p=1&fl=1&castk=LTE%3D".format(pid)
-        # print(f'严重违法:{yzwf_url}')
-        yield scrapy.Request(url=yzwf_url, callback=self.parse_illegal, meta=meta, priority=7)
+        if 'illegal' in due:
+            yzwf_url = "https://xin.baidu.com/detail/illegalAjax?pid={}&p=1&fl=1&castk=LTE%3D".format(pid)
+            # print(f'严重违法:{yzwf_url}')
+            yield scrapy.Request(url=yzwf_url, callback=self.parse_illegal, meta=meta, priority=7)
 
     def parse_shares(self, response):
         """ 解析股东信息 """
         share_info = response.meta.get('share_info', {})
         # 解析股东详情信息
         results = json.loads(response.text)
+        self.freshness.mark(response.meta.get('pid'), 'shares', results.get('data'))
         gd_list = results.get('data').get('list')
         if gd_list:
             for data in gd_list:
@@ -256,9 +374,8 @@ class BaiduXinSpider(scrapy.Spider):
                     "paidin_money": data.get("paidinMoney", "").replace("-", ""),  # 实际出资额
                     "url": response.url,
                     'contents': json.dumps(data, ensure_ascii=False),
-                    "collection": "share_information"
                 }
-                gd_last_item = {**share_info.get(gd_name), **gd_item, **self.base_item}
+                gd_last_item = ShareInformationItem(share_info.get(gd_name, {}), gd_item, self.base_item)
                 # print(f'基本股东:{gd_last_item}')
                 yield gd_last_item
 
@@ -268,6 +385,8 @@ class BaiduXinSpider(scrapy.Spider):
         pid = response.meta.get('pid')
         # 列表解析
         results = json.loads(response.text)
+        if response.meta.get('is_first', True):
+            self.freshness.mark(pid, 'wenshu', results.get('data'))
         wenshu_list = results.get('data')
         if wenshu_list:
             wenshu_list = wenshu_list.get('list')
@@ -296,7 +415,7 @@ class BaiduXinSpider(scrapy.Spider):
 
             wenshuId = data.get('wenshuId')  # 详情ID
             wenshu_url = "https://xin.baidu.com/wenshu?wenshuId={}&fl=1&castk=LTE%3D".format(wenshuId)
-            yield scrapy.Request(url=wenshu_url, callback=self.parse_wenshu_detail, meta={"wenshu": last_wenshu}, priority=9)
+            yield scrapy.Request(url=wenshu_url, callback=self.parse_wenshu_detail, meta={"wenshu": last_wenshu, 'proxy_session': pid}, priority=9)
 
         # 翻页请求
         is_first = response.meta.get("is_first", True)
@@ -306,7 +425,7 @@ class BaiduXinSpider(scrapy.Spider):
                 max_page_count = 1000 if max_page_count > 1000 else max_page_count
                 for page in range(2, int(max_page_count) + 1):
                     url = "https://xin.baidu.com/detail/lawWenshuAjax?pid={}&p={}&fl=1&castk=LTE%3D".format(pid, page)
-                    meta_data = {'pid': pid, 'is_first': False, "base_info": base_info}
+                    meta_data = {'pid': pid, 'proxy_session': pid, 'is_first': False, "base_info": base_info}
                     yield scrapy.Request(url=url, callback=self.parse_wenshu_list, meta=meta_data, priority=5)
 
     def parse_wenshu_detail(self, response):
@@ -317,11 +436,8 @@ class BaiduXinSpider(scrapy.Spider):
         re_com = re.compile(r'\r|\n|\t|\s')
         content_list = selector.xpath('//div[@class="zx-content"]//text()').getall()
         contents = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
-        wenshu['contents'] = contents
-        wenshu['url'] = response.url
-        wenshu['content_node'] = selector.css('div[class=wenshu-article]').get('').replace('\n', '')
-        wenshu['collection'] = 'wenshu_information'
-        wenshu_item = {**wenshu, **self.base_item}
+        content_node = selector.css('div[class=wenshu-article]').get('').replace('\n', '')
+        wenshu_item = WenshuInformationItem(wenshu, self.base_item, contents=contents, url=response.url, content_node=content_node)
         # print(f'裁判文书信息:{wenshu_item}')
         yield wenshu_item
 
@@ -331,13 +447,15 @@ class BaiduXinSpider(scrapy.Spider):
         pid = response.meta.get('pid')
         # 列表页解析，请求详情
         results = json.loads(response.text)
+        if response.meta.get('is_first', True):
+            self.freshness.mark(pid, 'discredit', results.get('data'))
         discred_list = results.get('data').get('list')
         if not discred_list:
             return
         for data in discred_list:
             discreditId = data.get('discreditId')  # 详情页参数
             detail_url = 'https://xin.baidu.com/discredit?discreditid={}&fl=1&castk=LTE%3D'.format(discreditId)
-            yield scrapy.Request(url=detail_url, callback=self.parse_discredit_detail, meta={"shixin": base_info}, priority=9)
+            yield scrapy.Request(url=detail_url, callback=self.parse_discredit_detail, meta={"shixin": base_info, 'proxy_session': pid}, priority=9)
 
         # 翻页请求
         is_first = response.meta.get("is_first", True)
@@ -346,7 +464,7 @@ class BaiduXinSpider(scrapy.Spider):
             if max_page_count > 1:
                 for page in range(2, int(max_page_count) + 1):
                     url = 'https://xin.baidu.com/detail/discreditAjax?pid={}&p={}&fl=1&castk=LTE%3D'.format(pid, page)
-                    meta_data = {'pid': pid, 'is_first': False, 'base_info': base_info}
+                    meta_data = {'pid': pid, 'proxy_session': pid, 'is_first': False, 'base_info': base_info}
                     yield scrapy.Request(url=url, callback=self.parse_discredit, meta=meta_data, priority=7)
 
     def parse_discredit_detail(self, response):
@@ -376,9 +494,9 @@ class BaiduXinSpider(scrapy.Spider):
                 implement_number=implement_number, implement_court=implement_court,
                 perform_status=perform_status, perform_situation=perform_situation, duty=duty,
                 perform_content=perform_content, unperform_content=unperform_content,
-                url=response.url, collection='discredit_information',
+                url=response.url,
                                )
-            last_item_shixin = {**shixin, **shixin_info, **self.base_item}
+            last_item_shixin = DiscreditInformationItem(shixin, shixin_info, self.base_item)
             # print(f'失信被执行人:{last_item_shixin}')
             yield last_item_shixin
 
@@ -388,6 +506,8 @@ class BaiduXinSpider(scrapy.Spider):
         pid = response.meta.get('pid')
         # 列表解析
         results = json.loads(response.text)
+        if response.meta.get('is_first', True):
+            self.freshness.mark(pid, 'abnormal', results.get('data'))
         discred_list = results.get('data').get('list')
         if not discred_list:
             return
@@ -402,9 +522,8 @@ class BaiduXinSpider(scrapy.Spider):
                 enter_date=enterDate, enter_reason=enterReason, authority=authority,
                 leave_date=leaveDate, leave_reason=leaveReason, leave_authority=leaveAuthority,
                 url=response.url, contents=json.dumps(data, ensure_ascii=False),
-                collection='abnormal_information',
             )
-            abnormal_last_data = {**base_info, **abnormal_item, **self.base_item}
+            abnormal_last_data = AbnormalInformationItem(base_info, abnormal_item, self.base_item)
             # print(f'经营异常:{abnormal_last_data}')
             yield abnormal_last_data
 
@@ -415,7 +534,7 @@ class BaiduXinSpider(scrapy.Spider):
             if max_page_count > 1:
                 for page in range(2, int(max_page_count) + 1):
                     url = 'https://xin.baidu.com/detail/abnormalAjax?pid={}&p={}&fl=1&castk=LTE%3D'.format(pid, page)
-                    meta_data = {'pid': pid, 'is_first': False, 'base_info': base_info}
+                    meta_data = {'pid': pid, 'proxy_session': pid, 'is_first': False, 'base_info': base_info}
                     yield scrapy.Request(url=url, callback=self.parse_abnormal, meta=meta_data, priority=7)
 
     def parse_penalties(self, response):
@@ -424,13 +543,15 @@ class BaiduXinSpider(scrapy.Spider):
         pid = response.meta.get('pid')
         # 列表解析
         results = json.loads(response.text)
+        if response.meta.get('is_first', True):
+            self.freshness.mark(pid, 'penalties', results.get('data'))
         xzcf_list = results.get('data').get('list')
         if not xzcf_list:
             return
         for data in xzcf_list:
             penaltiesId = data.get('penaltiesId')  # 详情页参数
             url = 'https://xin.baidu.com/penalty?penaltyid={}&fl=1&castk=LTE%3D'.format(penaltiesId)
-            yield scrapy.Request(url=url, callback=self.parse_penalties_detail, meta={"xzcf": base_info}, priority=9)
+            yield scrapy.Request(url=url, callback=self.parse_penalties_detail, meta={"xzcf": base_info, 'proxy_session': pid}, priority=9)
 
         # 列表翻页
         is_first = response.meta.get("is_first", True)
@@ -439,7 +560,7 @@ class BaiduXinSpider(scrapy.Spider):
             if max_page_count > 1:
                 for page in range(2, int(max_page_count) + 1):
                     url = 'https://xin.baidu.com/detail/penaltiesAjax?pid={}&p={}&fl=1&castk=LTE%3D'.format(pid, page)
-                    meta_data = {'pid': pid, 'is_first': False, "base_info": base_info}
+                    meta_data = {'pid': pid, 'proxy_session': pid, 'is_first': False, "base_info": base_info}
                     yield scrapy.Request(
                         url=url,
                         callback=self.parse_penalties,
@@ -467,9 +588,8 @@ class BaiduXinSpider(scrapy.Spider):
             xzcf_item = dict(
                 oname=oname, cf_wsh=cf_wsh, cf_type=cf_type, cf_sy=cf_sy, cf_yj=cf_yj, cf_jg=cf_jg,
                 cf_jdrq=cf_jdrq, fb_rq=fb_rq, cf_status=cf_status, cf_xzjg=cf_xzjg, url=response.url,
-                collection='penalties_information',
             )
-            last_item = {**xzcf, **xzcf_item, **self.base_item}
+            last_item = PenaltiesInformationItem(xzcf, xzcf_item, self.base_item)
             # print(last_item)
             yield last_item
 
@@ -479,6 +599,8 @@ class BaiduXinSpider(scrapy.Spider):
         pid = response.meta.get('pid')
         # 列表解析
         results = json.loads(response.text)
+        if response.meta.get('is_first', True):
+            self.freshness.mark(pid, 'stock_freeze', results.get('data'))
         stock_list = results.get('data').get('list')
         if not stock_list:
             return
@@ -494,7 +616,7 @@ class BaiduXinSpider(scrapy.Spider):
                 notification_number=notificationNumber, type_and_status=typeAndStatus,
             )
             base_item = {**list_info, **base_info}
-            yield scrapy.Request(url=detail_url, callback=self.parse_stock_freeze_detail, meta={"stock_freeze": base_item}, priority=9)
+            yield scrapy.Request(url=detail_url, callback=self.parse_stock_freeze_detail, meta={"stock_freeze": base_item, 'proxy_session': pid}, priority=9)
 
         # 翻页请求
         is_first = response.meta.get("is_first", True)
@@ -503,7 +625,7 @@ class BaiduXinSpider(scrapy.Spider):
             if max_page_count > 1:
                 for page in range(2, int(max_page_count) + 1):
                     url = 'https://xin.baidu.com/Stockfreeze/stockFreezeAjax?pid={}&p={}&fl=1&castk=LTE%3D'.format(pid, page)
-                    meta_data = {'pid': pid, 'is_first': False, "base_info": base_info}
+                    meta_data = {'pid': pid, 'proxy_session': pid, 'is_first': False, "base_info": base_info}
                     yield scrapy.Request(
                         url=url,
                         callback=self.parse_stock_freeze,
@@ -551,10 +673,10 @@ class BaiduXinSpider(scrapy.Spider):
             # print(f'第二张表:{second_table}')
             item['second_table'] = second_table
 
-        first_dict = item.get('first_table')
-        second_dict = item.get('second_table')
-        third_dict = dict(unfreeze=unfreeze, continuation_freeze=continuation_freeze, url=response.url, collection='freeze_infomation')
-        last_dict = {**stock_freeze, **first_dict, **second_dict, **third_dict, **self.base_item}
+        first_dict = item.get('first_table', {})
+        second_dict = item.get('second_table', {})
+        third_dict = dict(unfreeze=unfreeze, continuation_freeze=continuation_freeze, url=response.url)
+        last_dict = FreezeInfomationItem(stock_freeze, first_dict, second_dict, third_dict, self.base_item)
         # print(last_dict)
         yield last_dict
 
@@ -564,6 +686,8 @@ class BaiduXinSpider(scrapy.Spider):
         pid = response.meta.get('pid')
         # 列表解析
         results = json.loads(response.text)
+        if response.meta.get('is_first', True):
+            self.freshness.mark(pid, 'illegal', results.get('data'))
         illegal_list = results.get('data').get('list')
         if not illegal_list:
             return
@@ -583,9 +707,8 @@ class BaiduXinSpider(scrapy.Spider):
                 leave_authority=leaveAuthority,
                 contents=json.dumps(data, ensure_ascii=False),
                 url=response.url,
-                collection='illegal_infomation',
             )
-            illegal_info = {**base_info, **illegal_item, **self.base_item}
+            illegal_info = IllegalInfomationItem(base_info, illegal_item, self.base_item)
             # print(illegal_info)
             yield illegal_info
 
@@ -596,7 +719,7 @@ class BaiduXinSpider(scrapy.Spider):
             if max_page_count > 1:
                 for page in range(2, int(max_page_count) + 1):
                     url = 'https://xin.baidu.com/detail/illegalAjax?pid={}&p={}&fl=1&castk=LTE%3D'.format(pid, page)
-                    meta_data = {'pid': pid, 'is_first': False, 'base_info': base_info}
+                    meta_data = {'pid': pid, 'proxy_session': pid, 'is_first': False, 'base_info': base_info}
                     yield scrapy.Request(
                         url=url,
                         callback=self.parse_illegal,
@@ -7,6 +7,8 @@ import scrapy
 import logging
 
 from custom_crawler import config
+from custom_crawler.items import GsxtAbnormalInformationItem, GsxtBusinessInformationItem
+from custom_crawler.utils.entity_filter import EntitySeenFilter
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +20,16 @@ class GsxtAppletsSpider(scrapy.Spider):
 
     custom_settings = config.search_custom_settings
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        # 实体去重-本周期已经请求过的企业pripid
+        spider.entity_filter = EntitySeenFilter.from_crawler(crawler, spider.name)
+        return spider
+
+    def closed(self, reason):
+        self.entity_filter.record_stats()
+
     def parse(self, response):
         """ 请求搜索接口 """
         search_url = 'https://app.gsxt.gov.cn/gsxt/corp-query-app-search-1.html'
@@ -46,14 +58,18 @@ class GsxtAppletsSpider(scrapy.Spider):
                 result_list = {}
             if not result_list:
                 return
-            # 列表解析--请求详情
-            for data in result_list:
+            # 列表解析--请求详情，本周期已经抓取过的企业(其他关键词搜到过)跳过
+            result_list = [data for data in result_list if data.get('pripid')]
+            exists = self.entity_filter.seen_many([data.get('pripid') for data in result_list])
+            for data, existed in zip(result_list, exists):
+                if self.entity_filter.skip(existed):
+                    continue
                 # entName = data.get("entName").replace("<font color=red>", "").replace("</font>", "").replace("&nbsp;", "").strip()
                 entType = data.get('entType')  # 必要参数
                 nodeNum = data.get('nodeNum')  # 必要参数
                 pripid = data.get('pripid')  # 公司唯一参数
                 url = 'https://app.gsxt.gov.cn/gsxt/corp-query-entprise-info-primaryinfoapp-entbaseInfo-{}.html?nodeNum={}&entType={}&sourceType=W'.format(pripid, nodeNum, entType)
-                yield scrapy.Request(url=url, callback=self.parse_business_detail, priority=5)
+                yield scrapy.Request(url=url, callback=self.parse_business_detail, meta={'pripid': pripid, 'proxy_session': pripid}, priority=5)
 
             # 列表翻页请求
             is_first = response.meta.get('is_first', True)
@@ -100,16 +116,17 @@ class GsxtAppletsSpider(scrapy.Spider):
             regCaption = results.get('regCaption', '')  # 注册资本
             regCapCurCN = results.get('regCapCurCN', '')  # 注册资本单位
             regCap = results.get('regCap', '')  # 注册资本大写
-            first_item = dict(
+            first_item = GsxtBusinessInformationItem(
                 ent_name=entName, unified_code=uniscId, ent_type=entType_CN, legal_person=name,
                 estiblish_time=estDate, operate_from=opFrom, operate_to=opTo, authority=regOrg_CN,
                 approve_date=apprDate, open_status=regState_CN, reg_addr=dom, scope=opScope,
                 reg_capital=regCaption, reg_capital_unit=regCapCurCN, reg_cap=regCap,
                 url=response.url, contents=json.dumps(result, ensure_ascii=False),
-                collection='gsxt_business_information',
             )
             # print(first_item)
             yield first_item
+            # 工商信息解析成功后才记录，详情请求失败的企业下次搜到时仍然请求
+            self.entity_filter.mark(response.meta.get('pripid'))
             pripId = result.get('pripId')
             nodeNum = result.get('nodeNum')
             entType = result.get('entType')
@@ -117,13 +134,13 @@ class GsxtAppletsSpider(scrapy.Spider):
             # 行政处罚
             xzcf_url = 'https://app.gsxt.gov.cn/gsxt/corp-query-entprise-info-punishmentdetail-{}.html?nodeNum={}&entType={}&sourceType=W'.format(pripId, nodeNum, entType)
             print(f'行政处罚url:{xzcf_url}')
-            yield scrapy.Request(url=xzcf_url, callback=self.parse_punishment, meta={'base_item': meta_data}, priority=7)
+            yield scrapy.Request(url=xzcf_url, callback=self.parse_punishment, meta={'base_item': meta_data, 'proxy_session': pripId}, priority=7)
             # 经营异常
             jyyc_url = 'https://app.gsxt.gov.cn/gsxt/corp-query-entprise-info-entBusExcep-{}.html?nodeNum={}&entType={}&sourceType=W'.format(pripId, nodeNum, entType)
-            yield scrapy.Request(url=jyyc_url, callback=self.parse_abnormal, meta={'base_item': meta_data}, priority=7)
+            yield scrapy.Request(url=jyyc_url, callback=self.parse_abnormal, meta={'base_item': meta_data, 'proxy_session': pripId}, priority=7)
             # 严重违法失信黑名单
             yzwf_url = 'https://app.gsxt.gov.cn/gsxt/corp-query-entprise-info-illInfo-{}.html?nodeNum={}&entType={}&sourceType=W'.format(pripId, nodeNum, entType)
-            # yield scrapy.Request(url=yzwf_url, callback=self.parse_serious_violation, meta={'base_item': meta_data}, priority=7)
+            # yield scrapy.Request(url=yzwf_url, callback=self.parse_serious_violation, meta={'base_item': meta_data, 'proxy_session': pripId}, priority=7)
         except JSONDecodeError:
             # logger.info(f'工商详情请求出错--响应结果不是json--{response.text}')
             logger.info(f'工商详情请求出错--响应结果不是json--IP坏了')
@@ -164,9 +181,9 @@ class GsxtAppletsSpider(scrapy.Spider):
                 abnormal_item = dict(
                     enter_reason=speCause_CN, enter_date=abntime, authority=decOrg_CN,
                     leave_reason=remExcpRes_CN, leave_date=remDate, leave_authority=reDecOrg_CN,
-                    url=response.url, collection='gsxt_abnormal_information',
+                    url=response.url,
                 )
-                item = {**base_item, **abnormal_item}
+                item = GsxtAbnormalInformationItem(base_item, abnormal_item)
                 # print(item)
                 yield item
 
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+
+class SlotWindow(object):
+    """ 一个下载slot在当前统计窗口内的请求结果 """
+    __slots__ = ('success', 'failure', 'ban', 'latency')
+
+    def __init__(self):
+        self.success = 0
+        self.failure = 0
+        self.ban = 0
+        self.latency = 0.0  # 成功请求的下载耗时之和
+
+    @property
+    def total(self):
+        return self.success + self.failure + self.ban
+
+
+class AimdController(object):
+    """
+    AIMD并发控制: 被封比例超过阈值时并发乘以decrease_factor(快速下降)，
+    成功率和平均延迟都正常时并发加increase_step(缓慢上升)，其余情况保持不变
+    只负责计算，不依赖scrapy，由AdaptiveConcurrencyMiddleware定时调用decide
+    """
+    def __init__(self, start=4, minimum=1, maximum=16, increase_step=1, decrease_factor=0.5,
+                 ban_threshold=0.05, success_threshold=0.95, target_latency=3.0, min_samples=10):
+        self.start = start
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.ban_threshold = ban_threshold
+        self.success_threshold = success_threshold
+        self.target_latency = target_latency
+        self.min_samples = min_samples
+        self.windows = {}  # {slot_key: SlotWindow}
+        self.concurrency = {}  # {slot_key: 当前并发}
+
+    def get_concurrency(self, key):
+        return self.concurrency.setdefault(key, self.start)
+
+    def window(self, key):
+        if key not in self.windows:
+            self.windows[key] = SlotWindow()
+        return self.windows[key]
+
+    def record_success(self, key, latency=None):
+        window = self.window(key)
+        window.success += 1
+        if latency is not None:
+            window.latency += latency
+
+    def record_failure(self, key):
+        self.window(key).failure += 1
+
+    def record_ban(self, key):
+        self.window(key).ban += 1
+
+    def decide(self, key):
+        """
+        根据窗口内的结果调整并发，并开始新的窗口
+        :return: (decision, concurrency, window) decision 为 increase/decrease/hold/wait(样本不足，窗口继续累计)
+        """
+        window = self.window(key)
+        current = self.get_concurrency(key)
+        if window.total == 0 or (window.total < self.min_samples and not window.ban):
+            return 'wait', current, window
+        ban_rate = float(window.ban) / window.total
+        success_rate = float(window.success) / window.total
+        latency = window.latency / window.success if window.success else None
+        if window.ban and ban_rate >= self.ban_threshold:
+            decision = 'decrease'
+            concurrency = max(self.minimum, int(current * self.decrease_factor))
+        elif window.total < self.min_samples:
+            # 有被封但比例还不能确定，继续累计
+            return 'wait', current, window
+        elif success_rate >= self.success_threshold and latency is not None and latency <= self.target_latency:
+            decision = 'increase'
+            concurrency = min(self.maximum, current + self.increase_step)
+        else:
+            decision = 'hold'
+            concurrency = current
+        self.concurrency[key] = concurrency
+        self.windows[key] = SlotWindow()
+        return decision, concurrency, window
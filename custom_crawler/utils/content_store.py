@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import zlib
+from collections import OrderedDict
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+TABLE_NAME = 'content_store'
+REFERENCE_PREFIX = 'content:'  # 数据表中原字段改为保存 content:<sha1>
+
+
+def content_key(payload):
+    """ 内容寻址: 原始内容的sha1 """
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def reference(key):
+    return REFERENCE_PREFIX + key
+
+
+def is_reference(value):
+    return isinstance(value, str) and value.startswith(REFERENCE_PREFIX) and len(value) == len(REFERENCE_PREFIX) + 40
+
+
+def compress(payload, codec='zstd'):
+    """ 压缩内容，没有安装zstandard时使用zlib，返回(codec, data) """
+    data = payload.encode('utf-8')
+    if codec == 'zstd' and zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=3).compress(data)
+    return 'zlib', zlib.compress(data, 6)
+
+
+def decompress(codec, data):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    return zlib.decompress(data).decode('utf-8')
+
+
+class LRUSet(object):
+    """ 最近写入过的内容key，避免重复发送相同内容 """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.keys = OrderedDict()
+
+    def __contains__(self, key):
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            return True
+        return False
+
+    def add(self, key):
+        self.keys[key] = None
+        self.keys.move_to_end(key)
+        if len(self.keys) > self.capacity:
+            self.keys.popitem(last=False)
+
+
+class ContentReader(object):
+    """
+    读取帮助类-把数据表中的内容引用还原成原始内容
+    reader = ContentReader(pymysql_connection)
+    contents = reader.inflate(row['contents'])
+    """
+    def __init__(self, connection, cache_size=1024):
+        self.connection = connection
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def inflate(self, value):
+        """ 不是引用的值原样返回 """
+        if not is_reference(value):
+            return value
+        key = value[len(REFERENCE_PREFIX):]
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        with self.connection.cursor() as cursor:
+            cursor.execute("select codec, data from {} where content_key = %s".format(TABLE_NAME), (key,))
+            row = cursor.fetchone()
+        if not row:
+            raise KeyError('内容不存在--{}'.format(key))
+        payload = decompress(row[0], row[1])
+        self.cache[key] = payload
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return payload
+
+    def inflate_row(self, row, fields=('contents', 'content_node')):
+        """ 还原一行数据(dict)中的全部内容引用 """
+        for field in fields:
+            if field in row:
+                row[field] = self.inflate(row[field])
+        return row
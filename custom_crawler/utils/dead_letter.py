@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import pickle
+import time
+
+from scrapy.utils.reqser import request_from_dict, request_to_dict
+
+# 只和本次下载有关的meta，重放时去掉，让请求重新取代理、重新计算重试次数
+TRANSIENT_META_KEYS = (
+    'proxy', 'download_slot', 'download_latency', 'download_timeout', 'retry_times', 'retry_reason_times',
+    '_auth_proxy',
+)
+
+
+def dead_letter_key(spider_name):
+    return spider_name + ':dead_letter'
+
+
+class DeadLetterQueue(object):
+    """
+    死信队列-重试次数用完的请求完整保存到redis列表(url、method、body、callback、priority、meta)，
+    每条记录带失败原因、重试次数和时间，可以由DeadLetterReplay扩展分批重放
+    """
+    def __init__(self, server, key):
+        self.server = server
+        self.key = key
+
+    def push(self, request, spider, reason, retries):
+        data = request_to_dict(request, spider)
+        data['meta'] = {key: value for key, value in data['meta'].items() if key not in TRANSIENT_META_KEYS}
+        record = {
+            'request': data,
+            'reason': reason,
+            'retries': retries,
+            'failed_time': time.time(),
+        }
+        self.server.rpush(self.key, pickle.dumps(record, protocol=-1))
+
+    def pop_many(self, count):
+        """ 从队头原子地取出最多count条记录 """
+        pipe = self.server.pipeline()
+        pipe.lrange(self.key, 0, count - 1)
+        pipe.ltrim(self.key, count, -1)
+        values, _ = pipe.execute()
+        return [pickle.loads(value) for value in values]
+
+    def __len__(self):
+        return self.server.llen(self.key)
+
+
+def record_to_request(record, spider):
+    """ 还原请求，重放的请求跳过去重 """
+    request = request_from_dict(record['request'], spider)
+    request.dont_filter = True
+    request.meta['dead_letter_reason'] = record['reason']
+    return request
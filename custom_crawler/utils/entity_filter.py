@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import redis
+from scrapy_redis.connection import get_redis_from_settings
+
+from custom_crawler.utils.redis_bloomfilter import CycleBloomFilter
+
+logger = logging.getLogger(__name__)
+
+
+class EntitySeenFilter(object):
+    """
+    实体级去重-不同关键词搜到的同一个企业(百度pid/公示系统pripid)在一个抓取周期内只抓取一次详情
+    列表页用seen_many判断，详情解析成功后才用mark记录
+    多个节点共用redis中按周期轮换的布隆过滤器 <spider>:entities:<周期>(CycleBloomFilter)
+    周期: ENTITY_DEDUP_CYCLE(手动指定)，为空时按ENTITY_DEDUP_CYCLE_DAYS天自动分桶，不停止的爬虫跨过分桶后自动换周期
+    ENTITY_DEDUP_CYCLE_DAYS大于0时过滤器在最后一次写入一个周期后过期，最多同时保留两个周期
+    ENTITY_DEDUP_ENABLED为False时只判断不跳过(搜索收益统计仍然需要是否新企业)
+    """
+    def __init__(self, server, key, capacity=50000000, error_rate=0.0001, enabled=True, days=0, cycle='', stats=None):
+        self.enabled = enabled
+        self.stats = stats
+        self.bloomfilter = CycleBloomFilter(server, key, days=days, cycle=cycle, capacity=capacity, error_rate=error_rate)
+
+    @classmethod
+    def from_crawler(cls, crawler, spider_name):
+        settings = crawler.settings
+        return cls(
+            get_redis_from_settings(settings), spider_name + ':entities',
+            capacity=settings.getint('ENTITY_DEDUP_CAPACITY', 50000000),
+            error_rate=settings.getfloat('ENTITY_DEDUP_ERROR_RATE', 0.0001),
+            enabled=settings.getbool('ENTITY_DEDUP_ENABLED', True),
+            days=settings.getint('ENTITY_DEDUP_CYCLE_DAYS', 7),
+            cycle=settings.get('ENTITY_DEDUP_CYCLE') or '',
+            stats=crawler.stats,
+        )
+
+    @property
+    def key(self):
+        return self.bloomfilter.key
+
+    def seen_many(self, entity_ids):
+        """
+        批量判断(不记录)，返回和entity_ids顺序一致的bool列表(True为本周期已经抓取过)
+        企业只在详情解析成功后用mark记录，请求失败、进入死信队列的企业下次搜到时仍然请求
+        redis出错时全部按新企业处理，宁可重复抓取也不漏
+        """
+        if not entity_ids:
+            return []
+        try:
+            exists = self.bloomfilter.contains_many([str(entity_id) for entity_id in entity_ids])
+        except redis.RedisError as e:
+            logger.error('实体去重失败--{}--{}'.format(self.key, repr(e)))
+            self.inc_stats('entity_dedup/error')
+            return [False] * len(entity_ids)
+        hits = exists.count(True)
+        self.inc_stats('entity_dedup/checked', len(entity_ids))
+        if hits:
+            self.inc_stats('entity_dedup/hits', hits)
+        return exists
+
+    def mark(self, entity_id):
+        """ 详情解析成功后记录企业，本周期内不再请求 """
+        if not entity_id:
+            return
+        try:
+            self.bloomfilter.add_many([str(entity_id)])
+        except redis.RedisError as e:
+            logger.error('实体去重记录失败--{}--{}--{}'.format(self.key, entity_id, repr(e)))
+            self.inc_stats('entity_dedup/error')
+            return
+        self.inc_stats('entity_dedup/marked')
+
+    def skip(self, existed):
+        """ 已经出现过且开启了去重时跳过 """
+        if existed and self.enabled:
+            self.inc_stats('entity_dedup/skipped')
+            return True
+        return False
+
+    def inc_stats(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
+
+    def record_stats(self):
+        """ 刷新过期时间，命中率和布隆过滤器估算写入stats """
+        try:
+            self.bloomfilter.refresh_expire(force=True)
+        except redis.RedisError as e:
+            logger.error('实体去重设置过期时间失败--{}--{}'.format(self.key, repr(e)))
+        if self.stats is None:
+            return
+        checked = self.stats.get_value('entity_dedup/checked', 0)
+        if checked:
+            self.stats.set_value('entity_dedup/hit_rate',
+                                 round(float(self.stats.get_value('entity_dedup/hits', 0)) / checked, 4))
+        try:
+            active = self.bloomfilter.active
+            if active is not None:
+                self.stats.set_value('entity_dedup/cycle', self.bloomfilter.cycle)
+                active.record_stats(self.stats, 'entity_dedup/bloom')
+        except redis.RedisError as e:
+            logger.error('实体去重统计失败--{}--{}'.format(self.key, repr(e)))
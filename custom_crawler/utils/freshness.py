@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import time
+
+import redis
+from scrapy_redis.connection import get_redis_from_settings
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 3600
+
+
+def payload_hash(data):
+    """ 接口返回数据的内容哈希，按key排序后计算，和字段顺序无关 """
+    payload = json.dumps(data, ensure_ascii=False, sort_keys=True)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+class FreshnessIndex(object):
+    """
+    实体新鲜度索引-每个企业一个redis hash <spider>:freshness:<实体id>
+        basic:hash / basic:time        基本信息(百度basicAjax)的内容哈希和抓取时间
+        <模块>:hash / <模块>:time      各子模块第一页的内容哈希和抓取时间
+    重新抓取基本信息时按策略决定要请求的子模块:
+        没有记录、基本信息的哈希变化 -> 全部子模块
+        否则只请求距离上次抓取超过该模块TTL(FRESHNESS_TTL，没有配置的用FRESHNESS_DEFAULT_TTL)的子模块
+    子模块只在第一页解析时记录，请求失败的模块下次仍然到期；记录保留FRESHNESS_RETENTION秒
+    FRESHNESS_ENABLED为False或redis出错时全部子模块都请求
+    """
+    def __init__(self, server, prefix, ttl=None, default_ttl=7 * DAY, retention=180 * DAY, enabled=True, stats=None):
+        self.server = server
+        self.prefix = prefix
+        self.ttl = ttl or {}
+        self.default_ttl = default_ttl
+        self.retention = retention
+        self.enabled = enabled
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler, spider_name):
+        settings = crawler.settings
+        return cls(
+            get_redis_from_settings(settings), spider_name + ':freshness',
+            ttl=settings.getdict('FRESHNESS_TTL'),
+            default_ttl=settings.getint('FRESHNESS_DEFAULT_TTL', 7 * DAY),
+            retention=settings.getint('FRESHNESS_RETENTION', 180 * DAY),
+            enabled=settings.getbool('FRESHNESS_ENABLED'),
+            stats=crawler.stats,
+        )
+
+    def key(self, entity_id):
+        return '{}:{}'.format(self.prefix, entity_id)
+
+    def module_ttl(self, module):
+        return int(self.ttl.get(module, self.default_ttl))
+
+    def due_modules(self, entity_id, basic_hash, modules, now=None):
+        """
+        记录基本信息并返回需要请求的子模块列表
+        :param basic_hash: 基本信息的内容哈希，None(没有取到基本信息)时不记录，全部子模块都请求
+        """
+        if not self.enabled or basic_hash is None:
+            return list(modules)
+        now = int(now or time.time())
+        key = self.key(entity_id)
+        try:
+            record = {name.decode(): value.decode() for name, value in self.server.hgetall(key).items()}
+            pipe = self.server.pipeline(transaction=False)
+            pipe.hset(key, mapping={'basic:hash': basic_hash, 'basic:time': now})
+            pipe.expire(key, self.retention)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error('新鲜度索引读取失败--{}--{}'.format(key, repr(e)))
+            self.inc_stats('freshness/error')
+            return list(modules)
+        self.inc_stats('freshness/checked')
+        if record.get('basic:hash') != basic_hash:
+            # 新企业或基本信息变化，全部子模块重新抓取
+            self.inc_stats('freshness/basic_changed' if record else 'freshness/new')
+            return list(modules)
+        due = []
+        for module in modules:
+            last = int(record.get(module + ':time', 0))
+            if now - last >= self.module_ttl(module):
+                due.append(module)
+                self.inc_stats('freshness/module_due/' + module)
+            else:
+                self.inc_stats('freshness/module_skipped/' + module)
+        return due
+
+    def mark(self, entity_id, module, data, now=None):
+        """ 记录子模块第一页的内容哈希和抓取时间，返回内容是否变化 """
+        if not self.enabled:
+            return True
+        now = int(now or time.time())
+        key = self.key(entity_id)
+        data_hash = payload_hash(data)
+        try:
+            pipe = self.server.pipeline(transaction=False)
+            pipe.hget(key, module + ':hash')
+            pipe.hset(key, mapping={module + ':hash': data_hash, module + ':time': now})
+            pipe.expire(key, self.retention)
+            old_hash = pipe.execute()[0]
+        except redis.RedisError as e:
+            logger.error('新鲜度索引记录失败--{}--{}'.format(key, repr(e)))
+            self.inc_stats('freshness/error')
+            return True
+        changed = old_hash is None or old_hash.decode() != data_hash
+        if changed and old_hash is not None:
+            self.inc_stats('freshness/module_changed/' + module)
+        return changed
+
+    def inc_stats(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+
+OPEN_SUFFIX = '.open'
+SEGMENT_SUFFIX = '.log'
+
+
+class ItemLogWriter(object):
+    """
+    预写日志-按大小/时间切分的只追加文件
+    正在写的分段以.open结尾，切换后改名为.log，一行一条json数据
+    """
+    def __init__(self, log_dir, prefix, segment_size=64 * 1024 * 1024, segment_seconds=300):
+        """
+        :param log_dir: 日志目录
+        :param prefix: 分段文件名前缀，一般是爬虫名
+        :param segment_size: 单个分段最大字节数
+        :param segment_seconds: 单个分段最长写入秒数
+        """
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.segment_size = segment_size
+        self.segment_seconds = segment_seconds
+        self.seq = 0
+        self.file = None
+        self.path = None
+        self.size = 0
+        self.open_time = 0
+        os.makedirs(log_dir, exist_ok=True)
+
+    def open_segment(self):
+        self.seq += 1
+        name = '{}-{}-{}-{:06d}{}'.format(self.prefix, time.strftime('%Y%m%d%H%M%S'), os.getpid(), self.seq, SEGMENT_SUFFIX)
+        self.path = os.path.join(self.log_dir, name)
+        self.file = open(self.path + OPEN_SUFFIX, 'ab')
+        self.size = 0
+        self.open_time = time.time()
+
+    def close_segment(self):
+        if not self.file:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+        if self.size:
+            os.rename(self.path + OPEN_SUFFIX, self.path)
+        else:
+            os.remove(self.path + OPEN_SUFFIX)
+
+    def write(self, record):
+        """ 追加一条数据，返回写入字节数 """
+        if not self.file:
+            self.open_segment()
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        self.file.write(line)
+        self.size += len(line)
+        if self.size >= self.segment_size:
+            self.close_segment()
+        return len(line)
+
+    def flush(self):
+        """ 刷盘，分段超时则切换 """
+        if not self.file:
+            return
+        if time.time() - self.open_time >= self.segment_seconds:
+            self.close_segment()
+        else:
+            self.file.flush()
+
+    def close(self):
+        self.close_segment()
+
+
+def list_segments(log_dir, stale_seconds=3600):
+    """
+    按文件名排序列出分段，返回[(name, path, closed)]
+    长时间没有更新的.open分段(写入进程已退出)按已关闭处理
+    """
+    segments = []
+    if not os.path.isdir(log_dir):
+        return segments
+    now = time.time()
+    for filename in sorted(os.listdir(log_dir)):
+        path = os.path.join(log_dir, filename)
+        if filename.endswith(SEGMENT_SUFFIX):
+            segments.append((filename, path, True))
+        elif filename.endswith(SEGMENT_SUFFIX + OPEN_SUFFIX):
+            closed = now - os.path.getmtime(path) >= stale_seconds
+            segments.append((filename[:-len(OPEN_SUFFIX)], path, closed))
+    return segments
+
+
+def read_records(path, offset, limit=1000):
+    """ 从offset开始读取最多limit条完整的数据，返回(数据列表, 新的offset) """
+    records = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while len(records) < limit:
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                break  # 最后一行还没写完
+            offset += len(line)
+            line = line.strip()
+            if line:
+                records.append(json.loads(line.decode('utf-8')))
+    return records, offset
+
+
+class Checkpoint(object):
+    """ 导入进度-记录每个分段已经导入的位置 """
+    def __init__(self, path):
+        self.path = path
+        self.offsets = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.offsets = json.load(f)
+
+    def get(self, name):
+        return self.offsets.get(name, 0)
+
+    def set(self, name, offset):
+        self.offsets[name] = offset
+        self.save()
+
+    def remove(self, name):
+        self.offsets.pop(name, None)
+        self.save()
+
+    def save(self):
+        """ 先写临时文件再替换，避免写一半断电 """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.offsets, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
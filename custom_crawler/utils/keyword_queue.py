@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import math
+
+# 按族的优先级从高到低取关键词，族中按关键词自己的分数从高到低取，取空的族删除
+POP_SCRIPT = """
+local result = {}
+local count = tonumber(ARGV[1])
+while #result < count do
+    local top = redis.call('ZREVRANGE', KEYS[1], 0, 0)
+    if #top == 0 then
+        break
+    end
+    local family_key = ARGV[2] .. top[1]
+    local items = redis.call('ZREVRANGE', family_key, 0, count - #result - 1)
+    if #items > 0 then
+        redis.call('ZREM', family_key, unpack(items))
+    end
+    for i = 1, #items do
+        result[#result + 1] = items[i]
+    end
+    if redis.call('EXISTS', family_key) == 0 then
+        redis.call('ZREM', KEYS[1], top[1])
+    end
+end
+if #result > 0 then
+    redis.call('DECRBY', KEYS[2], #result)
+end
+return result
+"""
+
+# 族的收益率指数滑动平均，返回新的优先级 = 族的基础分 * (floor + 收益率)
+YIELD_SCRIPT = """
+local old = tonumber(redis.call('HGET', KEYS[1], ARGV[1] .. ':yield') or ARGV[3])
+local new = old * (1 - tonumber(ARGV[4])) + tonumber(ARGV[2]) * tonumber(ARGV[4])
+redis.call('HSET', KEYS[1], ARGV[1] .. ':yield', new)
+redis.call('HINCRBY', KEYS[1], ARGV[1] .. ':observed', 1)
+local base = tonumber(redis.call('HGET', KEYS[1], ARGV[1] .. ':base') or '1')
+local priority = base * (tonumber(ARGV[5]) + new)
+if redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+    redis.call('ZADD', KEYS[2], priority, ARGV[1])
+end
+return tostring(new)
+"""
+
+
+class KeywordQueue(object):
+    """
+    按收益排序的关键词队列-关键词按前缀分族(同一个词根及其加省份的变体属于同一族)
+    <key>:families      zset 族 -> 优先级，初始为族中最高的jieba_cut_words.score乘以默认收益率
+    <key>:family:<族>   zset 关键词 -> jieba_cut_words.score
+    <key>:yield         hash 族的基础分、收益率(指数滑动平均)和观测次数
+    <key>:count         待搜索关键词总数
+    搜索结果的收益 = 新企业比例 * min(1, ln(1+结果数)/ln(1+saturation))，收益低的整族降低优先级
+    """
+    def __init__(self, server, key='baidu_xin:keyword_queue', prefix_length=2, default_yield=0.5, alpha=0.2,
+                 floor=0.1, saturation=1000):
+        self.server = server
+        self.key = key
+        self.families_key = key + ':families'
+        self.family_prefix = key + ':family:'
+        self.yield_key = key + ':yield'
+        self.count_key = key + ':count'
+        self.prefix_length = prefix_length
+        self.default_yield = default_yield
+        self.alpha = alpha
+        self.floor = floor
+        self.saturation = saturation
+        self.pop_script = server.register_script(POP_SCRIPT)
+        self.yield_script = server.register_script(YIELD_SCRIPT)
+
+    def family_of(self, keyword):
+        """ 去掉省份前缀(山东+小米)后取前prefix_length个字符 """
+        return keyword.split('+')[-1][:self.prefix_length]
+
+    def push_many(self, rows):
+        """
+        :param rows: [(keyword, score)]，已经在队列中的关键词不覆盖
+        :return: 新加入的数量
+        """
+        families = {}
+        for keyword, score in rows:
+            families.setdefault(self.family_of(keyword), []).append((keyword, float(score)))
+        pipe = self.server.pipeline(transaction=False)
+        for family, members in families.items():
+            base = max(score for _, score in members)
+            pipe.zadd(self.family_prefix + family, {keyword: score for keyword, score in members}, nx=True)
+            pipe.hsetnx(self.yield_key, family + ':base', base)
+        replies = pipe.execute()
+        added = sum(replies[0::2])
+        # 族的优先级按已有的基础分和收益率计算，族已经在队列中时不变
+        pipe = self.server.pipeline(transaction=False)
+        for family in families:
+            pipe.hmget(self.yield_key, family + ':base', family + ':yield')
+        priorities = {}
+        for family, (base, family_yield) in zip(families, pipe.execute()):
+            family_yield = float(family_yield) if family_yield is not None else self.default_yield
+            priorities[family] = float(base) * (self.floor + family_yield)
+        pipe = self.server.pipeline(transaction=False)
+        pipe.zadd(self.families_key, priorities, nx=True)
+        if added:
+            pipe.incrby(self.count_key, added)
+        pipe.execute()
+        return added
+
+    def pop_many(self, count):
+        keywords = self.pop_script(keys=[self.families_key, self.count_key], args=[count, self.family_prefix])
+        return [keyword.decode('utf-8') for keyword in keywords]
+
+    def observed_yield(self, total_found, new_ratio):
+        if total_found <= 0:
+            return 0.0
+        return new_ratio * min(1.0, math.log1p(total_found) / math.log1p(self.saturation))
+
+    def record_yield(self, keyword, total_found, new_ratio):
+        """ 更新关键词所在族的收益率和优先级，返回(族, 新的收益率) """
+        family = self.family_of(keyword)
+        value = self.observed_yield(total_found, new_ratio)
+        family_yield = self.yield_script(
+            keys=[self.yield_key, self.families_key],
+            args=[family, value, self.default_yield, self.alpha, self.floor],
+        )
+        return family, float(family_yield)
+
+    def __len__(self):
+        return int(self.server.get(self.count_key) or 0)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import math
+
+
+def freeze_condition(condition):
+    """ 过滤条件(dict或元组)转成不可变的元组，每个分区各自持有，不会被其他请求修改 """
+    return tuple(sorted(dict(condition or ()).items()))
+
+
+def facet_count(value_dict):
+    """ 筛选项的结果数，接口没有返回时为None """
+    for name in ('count', 'num', 'total'):
+        count = value_dict.get(name)
+        if count is not None:
+            try:
+                return int(count)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+class Partition(object):
+    """ 一个搜索分区: 关键词 + 过滤条件(不可变) """
+    __slots__ = ('keyword', 'condition', 'depth')
+
+    def __init__(self, keyword, condition=(), depth=0):
+        self.keyword = keyword
+        self.condition = condition
+        self.depth = depth
+
+    def condition_dict(self):
+        return dict(self.condition)
+
+    def __repr__(self):
+        return 'Partition({!r}, {!r})'.format(self.keyword, self.condition)
+
+
+class Plan(object):
+    """
+    分区的抓取计划
+    pages: 需要翻页的页数(第一页已经抓取，只翻2..pages)
+    children: 继续拆分的子分区
+    split: 拆分方式 facet:<筛选项>/province/None
+    truncated: 无法再拆分、超出翻页上限丢失的结果数
+    uncovered: 按筛选项拆分时各个值的结果数之和不到总数，子分区没有覆盖的结果数
+    too_broad: 接口提示搜索词过于宽泛但无法继续拆分，只按真实结果数翻页
+    """
+    __slots__ = ('pages', 'children', 'split', 'truncated', 'uncovered', 'too_broad')
+
+    def __init__(self, pages=1, children=(), split=None, truncated=0, uncovered=0, too_broad=False):
+        self.pages = pages
+        self.children = list(children)
+        self.split = split
+        self.truncated = truncated
+        self.uncovered = uncovered
+        self.too_broad = too_broad
+
+
+class PartitionPlanner(object):
+    """
+    搜索结果分区: 结果数超过翻页上限(page_cap页 * page_size条)时按筛选项拆分，
+    筛选项用完后按省份前缀拆分，直到每个分区都能在翻页上限内翻完
+    筛选项有结果数时选覆盖结果最多、请求数最少的一项；没有结果数时按接口返回的顺序取第一个未使用的筛选项
+    拆分后父分区不再翻页(翻到的结果大多和子分区重复)，筛选项没有覆盖的结果记为uncovered
+    接口提示搜索词过于宽泛(too_broad)时不论结果数都尝试拆分，无法拆分时只按真实结果数翻页
+    """
+    def __init__(self, provinces, page_cap=100, page_size=10, max_depth=4):
+        self.provinces = provinces
+        self.page_cap = page_cap
+        self.page_size = page_size
+        self.max_depth = max_depth
+
+    @property
+    def capacity(self):
+        return self.page_cap * self.page_size
+
+    def pages_for(self, total, total_pages=None):
+        pages = int(math.ceil(float(total) / self.page_size)) if total > 0 else 0
+        if total_pages:
+            pages = min(pages, int(total_pages)) if pages else int(total_pages)
+        return min(pages, self.page_cap)
+
+    def facet_cost(self, total, values):
+        """ :return: (覆盖的结果数, 预计请求数)，结果数未知时返回None """
+        counts = [facet_count(value) for value in values]
+        if not counts or any(count is None for count in counts):
+            return None
+        covered = min(sum(counts), total)
+        requests = sum(max(1, self.pages_for(count)) for count in counts if count > 0)
+        return covered, requests
+
+    def choose_facet(self, partition, total, facets):
+        """ 选择拆分用的筛选项，返回(筛选项, 值列表)或None """
+        used = set(name for name, _ in partition.condition)
+        candidates = []
+        for index, (name, facet) in enumerate((facets or {}).items()):
+            values = [value for value in (facet or {}).get('values') or [] if value.get('value') not in (None, '')]
+            if name in used or len(values) < 2:
+                continue
+            cost = self.facet_cost(total, values)
+            if cost is None:
+                # 没有结果数，排在有结果数的筛选项之后，按接口顺序
+                candidates.append(((1, 0, 0, index), name, values))
+            else:
+                covered, requests = cost
+                candidates.append(((0, -covered, requests, index), name, values))
+        if not candidates:
+            return None
+        _, name, values = min(candidates, key=lambda candidate: candidate[0])
+        return name, values
+
+    def plan(self, partition, total, facets=None, total_pages=None, too_broad=False):
+        if not too_broad:
+            if total <= 0:
+                return Plan(pages=0)
+            if total <= self.capacity:
+                return Plan(pages=self.pages_for(total, total_pages))
+        split = self.split(partition, total, facets) if partition.depth < self.max_depth else None
+        if split:
+            return split
+        if too_broad:
+            return Plan(pages=self.pages_for(total, total_pages) if total > 0 else 0, too_broad=True)
+        return Plan(pages=self.page_cap, truncated=total - self.capacity)
+
+    def split(self, partition, total, facets):
+        """ 按筛选项拆分，筛选项用完后按省份拆分，都不行时返回None """
+        chosen = self.choose_facet(partition, total, facets)
+        if chosen:
+            name, values = chosen
+            children = []
+            covered = 0
+            for value in values:
+                count = facet_count(value)
+                if count == 0:
+                    continue
+                covered += count or 0
+                condition = freeze_condition(dict(partition.condition, **{name: value.get('value')}))
+                children.append(Partition(partition.keyword, condition, partition.depth + 1))
+            uncovered = total - covered if 0 < covered < total else 0
+            return Plan(children=children, split='facet:' + name, uncovered=uncovered)
+        if '+' not in partition.keyword:
+            children = [Partition(province + '+' + partition.keyword, partition.condition, partition.depth + 1)
+                        for province in self.provinces]
+            return Plan(children=children, split='province')
+        return None
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+import logging
+import random
+import time
+from collections import OrderedDict
+
+import redis
+from scrapy import signals
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet import defer, task, threads
+
+logger = logging.getLogger(__name__)
+
+
+class ProxyHealth(object):
+    """ 单个代理在单个目标域名上的健康状况 """
+    __slots__ = ('success', 'failure', 'ban', 'latency', 'ban_streak', 'quarantine_until')
+
+    def __init__(self):
+        self.success = 0
+        self.failure = 0
+        self.ban = 0
+        self.latency = None  # 下载耗时的指数滑动平均
+        self.ban_streak = 0  # 连续被封次数，决定隔离时长
+        self.quarantine_until = 0
+
+    def score(self):
+        """ 成功率(平滑)除以延迟，新代理按成功率0.5、延迟1秒计算 """
+        success_rate = (self.success + 1.0) / (self.success + self.failure + self.ban + 2.0)
+        latency = self.latency if self.latency is not None else 1.0
+        return success_rate / (1.0 + latency)
+
+
+class ProxyPool(object):
+    """
+    本地代理缓存-后台定时从redis拨号代理池(set)同步，取代理只是本地操作
+    按目标域名记录每个代理的成功率、延迟和封禁情况，按得分加权选择，被封的代理隔离一段时间而不是删除
+    会话模式: 同一个会话(如同一个企业pid)的请求固定使用一个代理，代理被封或下线后整组换代理
+    同一个crawler中的中间件共用一个实例
+    """
+    def __init__(self, server, key='proxies', refresh_interval=5, stats=None, cooldown=60, max_cooldown=1800,
+                 session_capacity=10000):
+        self.server = server
+        self.key = key
+        self.refresh_interval = refresh_interval
+        self.stats = stats
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.proxies = []
+        self.proxy_set = set()
+        self.health = {}  # {(proxy, domain): ProxyHealth}
+        self.waiters = []  # 代理池为空时等待的请求
+        self.session_capacity = session_capacity
+        self.sessions = OrderedDict()  # {(session, domain): proxy}
+        self.refresh_task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pool = getattr(crawler, 'proxy_pool', None)
+        if pool is None:
+            server = redis.StrictRedis(
+                host=crawler.settings.get('REDIS_PROXIES_HOST'),
+                port=crawler.settings.get('REDIS_PROXIES_PORT'),
+                password=crawler.settings.get('REDIS_PROXIES_PASSWORD'),
+                db=crawler.settings.get('REDIS_PROXIES_DB'),
+            )
+            pool = cls(
+                server,
+                key=crawler.settings.get('REDIS_PROXIES_KEY', 'proxies'),
+                refresh_interval=crawler.settings.getfloat('PROXY_REFRESH_INTERVAL', 5),
+                stats=crawler.stats,
+                cooldown=crawler.settings.getfloat('PROXY_BAN_COOLDOWN', 60),
+                max_cooldown=crawler.settings.getfloat('PROXY_BAN_MAX_COOLDOWN', 1800),
+                session_capacity=crawler.settings.getint('PROXY_SESSION_CAPACITY', 10000),
+            )
+            crawler.signals.connect(pool.spider_opened, signal=signals.spider_opened)
+            crawler.signals.connect(pool.spider_closed, signal=signals.spider_closed)
+            crawler.proxy_pool = pool
+        return pool
+
+    def spider_opened(self, spider):
+        self.refresh_task = task.LoopingCall(self.refresh)
+        self.refresh_task.start(self.refresh_interval, now=True)
+
+    def spider_closed(self, spider):
+        if self.refresh_task and self.refresh_task.running:
+            self.refresh_task.stop()
+        self.record_scores()
+
+    def refresh(self):
+        """ 在线程中执行smembers，不阻塞reactor """
+        d = threads.deferToThread(self.server.smembers, self.key)
+        d.addCallback(self.update)
+        d.addErrback(lambda failure: logger.error('同步代理池失败--{}'.format(failure.getErrorMessage())))
+        return d
+
+    def update(self, members):
+        self.proxies = [member.decode('utf-8') for member in members]
+        self.stats.set_value('proxy/pool_size', len(self.proxies))
+        # 已经不在代理池中的代理(重新拨号换IP)不再记录
+        self.proxy_set = set(self.proxies)
+        for key in [key for key in self.health if key[0] not in self.proxy_set]:
+            del self.health[key]
+        self.record_scores()
+        if self.proxies and self.waiters:
+            waiters, self.waiters = self.waiters, []
+            for d in waiters:
+                d.callback(None)
+
+    def get(self, domain=None):
+        """ 按得分加权随机取一个没有被隔离的代理，没有可用代理时返回None """
+        now = time.time()
+        candidates = []
+        weights = []
+        for proxy in self.proxies:
+            health = self.health.get((proxy, domain))
+            if health is None:
+                candidates.append(proxy)
+                weights.append(0.25)  # 新代理的默认得分
+            elif health.quarantine_until <= now:
+                candidates.append(proxy)
+                weights.append(health.score())
+        if not candidates:
+            return None
+        return random.choices(candidates, weights)[0]
+
+    def get_session(self, session, domain=None):
+        """ 会话绑定的代理还在代理池中且没有被隔离时继续使用，否则整组换一个代理 """
+        key = (session, domain)
+        proxy = self.sessions.get(key)
+        if proxy is not None:
+            health = self.health.get((proxy, domain))
+            if proxy in self.proxy_set and (health is None or health.quarantine_until <= time.time()):
+                self.sessions.move_to_end(key)
+                self.stats.inc_value('proxy/session/reuse')
+                return proxy
+            self.stats.inc_value('proxy/session/rotate')
+        else:
+            self.stats.inc_value('proxy/session/new')
+        proxy = self.get(domain)
+        if proxy is None:
+            self.sessions.pop(key, None)
+            return None
+        self.sessions[key] = proxy
+        self.sessions.move_to_end(key)
+        if len(self.sessions) > self.session_capacity:
+            self.sessions.popitem(last=False)
+        return proxy
+
+    def get_health(self, proxy, domain):
+        key = (proxy, domain)
+        if key not in self.health:
+            self.health[key] = ProxyHealth()
+        return self.health[key]
+
+    def record_success(self, proxy, domain, latency=None):
+        health = self.get_health(proxy, domain)
+        health.success += 1
+        health.ban_streak = 0
+        if latency is not None:
+            health.latency = latency if health.latency is None else 0.8 * health.latency + 0.2 * latency
+        self.stats.inc_value('proxy/success')
+
+    def record_failure(self, proxy, domain):
+        """ 网络错误，只降低得分 """
+        self.get_health(proxy, domain).failure += 1
+        self.stats.inc_value('proxy/failure')
+
+    def record_ban(self, proxy, domain):
+        """ 被目标网站封禁，在该域名上隔离，连续被封时隔离时间翻倍 """
+        health = self.get_health(proxy, domain)
+        health.ban += 1
+        health.ban_streak += 1
+        cooldown = min(self.cooldown * 2 ** (health.ban_streak - 1), self.max_cooldown)
+        health.quarantine_until = time.time() + cooldown
+        self.stats.inc_value('proxy/ban')
+        self.stats.inc_value('proxy/ban/{}'.format(domain))
+        logger.debug('代理被封--隔离{}秒--{}--{}'.format(cooldown, proxy, domain))
+
+    def record_scores(self):
+        """ 各域名下代理得分和隔离数量写入stats """
+        now = time.time()
+        scores = {}
+        quarantined = {}
+        for (proxy, domain), health in self.health.items():
+            scores.setdefault(domain, {})[proxy] = round(health.score(), 4)
+            if health.quarantine_until > now:
+                quarantined[domain] = quarantined.get(domain, 0) + 1
+        for domain, domain_scores in scores.items():
+            self.stats.set_value('proxy/scores/{}'.format(domain), domain_scores)
+            self.stats.set_value('proxy/quarantined/{}'.format(domain), quarantined.get(domain, 0))
+
+    def wait(self):
+        """ 代理池为空时返回Deferred，下次同步到代理后触发 """
+        d = defer.Deferred()
+        self.waiters.append(d)
+        self.stats.inc_value('proxy/exhausted_wait')
+        return d
+
+
+def proxy_of(request):
+    """ 请求使用的代理 ip:port """
+    proxy = request.meta.get('proxy')
+    if not proxy:
+        return None
+    return proxy.split("//")[-1]
+
+
+def domain_of(request):
+    return urlparse_cached(request).hostname
@@ -1,7 +1,48 @@
 # -*- coding: utf-8 -*-
+import logging
+import math
+import time
+
 import redis
 from hashlib import md5
 
+logger = logging.getLogger(__name__)
+
+MAX_BLOCK_BITS = 1 << 32  # Redis的String类型最大512M
+DAY = 24 * 3600
+
+# 原子创建一层: 只有当前层数等于要创建的序号时才写入参数并把层数加1，读取方不会看到不完整的参数
+# KEYS[1]: <key>:meta  ARGV[1]: 层序号  ARGV[2..]: 字段、值交替
+CREATE_LAYER_SCRIPT = """
+local layers = tonumber(redis.call('HGET', KEYS[1], 'layers') or '0')
+if layers ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('HSET', KEYS[1], 'layers', layers + 1)
+return 1
+"""
+
+
+def bloom_size(capacity, error_rate):
+    """
+    :return: (总位数, 哈希函数个数) m = -n*ln(p)/ln(2)^2, k = m/n*ln(2)
+    """
+    bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+    hash_count = max(1, int(round(float(bits) / capacity * math.log(2))))
+    return bits, hash_count
+
+
+def cycle_name(days, now=None):
+    """ 按天数分桶的周期名: 桶的第一天(UTC)，如 20261015，多个节点算出的周期一致 """
+    bucket = int((now or time.time()) // DAY) // days * days
+    return time.strftime('%Y%m%d', time.gmtime(bucket * DAY))
+
+
+def fill_ratio(bits, hash_count, count):
+    """ 按已添加数量估算置1的比例 1 - e^(-k*n/m) """
+    return 1 - math.exp(-float(hash_count) * count / bits)
+
 
 class SimpleHash(object):
     def __init__(self, cap, seed):
@@ -9,54 +50,406 @@ class SimpleHash(object):
         self.seed = seed
 
     def hash(self, value):
+        # ret += seed * ret + c 即 ret = ret * (seed + 1) + c，cap是2的幂，每一步取模结果不变，避免大整数运算
+        mask = self.cap - 1
+        multiplier = self.seed + 1
         ret = 0
-        for i in range(len(value)):
-            ret += self.seed * ret + ord(value[i])
-        return (self.cap - 1) & ret
+        for char in value:
+            ret = (ret * multiplier + ord(char)) & mask
+        return ret
 
 
 class BloomFilter(object):
     """
     布隆过滤器
+    hash_mode:
+        legacy 每个seed对md5十六进制串做一次SimpleHash，和已有的过滤器数据兼容
+        double 双重哈希，一次md5得到两个64位哈希 h1、h2，第i个位置为 h1 + i * h2，新建的过滤器使用
+    contains_many/add_many 把一批值的全部位置按块合并成BITFIELD命令，一次pipeline往返
     """
-    def __init__(self, host='localhost', port=6379, password="allenshen123", db=0, blockNum=2, key='xcx:bloomfilter'):
+    def __init__(self, host='localhost', port=6379, password="allenshen123", db=0, blockNum=2, key='xcx:bloomfilter',
+                 hash_mode='legacy', hash_count=7, bit_size=1 << 31, server=None):
         """
         :param host: the host of Redis
         :param port: the port of Redis
         :param db: witch db in Redis
         :param blockNum: one blockNum for about 90,000,000; if you have more strings for filtering, increase it.
         :param key: the key's name in Redis
+        :param hash_mode: legacy or double
+        :param hash_count: double模式下的哈希函数个数，legacy模式固定为7个seed
+        :param bit_size: 每个块的位数，legacy模式必须是2的幂
+        :param server: 已有的redis连接，传入时忽略host等参数
         """
-        self.server = redis.Redis(host=host, port=port, password=password, db=db)
-        self.bit_size = 1 << 31  # Redis的String类型最大容量为512M，现使用256M
+        if hash_mode not in ('legacy', 'double'):
+            raise ValueError('未知的hash_mode:{}'.format(hash_mode))
+        self.server = server or redis.Redis(host=host, port=port, password=password, db=db)
+        self.bit_size = bit_size  # Redis的String类型最大容量为512M，现使用256M
         self.seeds = [5, 7, 11, 13, 31, 37, 61]
         self.key = key
         self.blockNum = blockNum
+        self.hash_mode = hash_mode
+        self.hash_count = len(self.seeds) if hash_mode == 'legacy' else hash_count
         self.hashfunc = []
         for seed in self.seeds:
             self.hashfunc.append(SimpleHash(self.bit_size, seed))
 
+    def positions(self, str_input):
+        """
+        :return: (块的key, 位置列表)
+        """
+        digest = md5(str_input.encode()).digest()
+        name = self.key + str(digest[0] % self.blockNum)
+        if self.hash_mode == 'legacy':
+            hex_digest = digest.hex()
+            return name, [f.hash(hex_digest) for f in self.hashfunc]
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return name, [(h1 + i * h2) % self.bit_size for i in range(self.hash_count)]
+
+    def group_positions(self, values):
+        """ 按块分组 {块的key: [(序号, 位置列表)]}，空值不参与 """
+        blocks = {}
+        for index, value in enumerate(values):
+            if not value:
+                continue
+            name, locations = self.positions(value)
+            blocks.setdefault(name, []).append((index, locations))
+        return blocks
+
+    @staticmethod
+    def queue_bitfield(pipe, blocks, operation):
+        """ 每个块一条BITFIELD GET/SET命令加入pipe """
+        for name, entries in blocks.items():
+            args = []
+            for _, locations in entries:
+                for location in locations:
+                    if operation == 'GET':
+                        args.extend(('GET', 'u1', location))
+                    else:
+                        args.extend(('SET', 'u1', location, 1))
+            pipe.execute_command('BITFIELD', name, *args)
+
+    @staticmethod
+    def parse_bitfield(count, blocks, replies):
+        """ replies和blocks顺序一致，返回每个值的全部位置在操作前是否都为1 """
+        results = [False] * count
+        for entries, bits in zip(blocks.values(), replies):
+            offset = 0
+            for index, locations in entries:
+                results[index] = all(bits[offset:offset + len(locations)])
+                offset += len(locations)
+        return results
+
+    def _bitfield_many(self, values, operation):
+        """ 按块把全部位置合并成BITFIELD GET/SET，一次pipeline往返 """
+        blocks = self.group_positions(values)
+        if not blocks:
+            return [False] * len(values)
+        pipe = self.server.pipeline(transaction=False)
+        self.queue_bitfield(pipe, blocks, operation)
+        return self.parse_bitfield(len(values), blocks, pipe.execute())
+
+    def contains_many(self, values):
+        """ 批量判断，返回和values顺序一致的bool列表 """
+        return self._bitfield_many(values, 'GET')
+
+    def add_many(self, values):
+        """
+        批量添加，返回每个值添加之前是否已经存在(同一批中重复的值，后面的返回True)
+        可以直接用来去重: 返回False的就是新值
+        """
+        return self._bitfield_many(values, 'SET')
+
     def is_exist(self, str_input):
         if not str_input:
             return False
-        m5 = md5()
-        m5.update(str_input.encode())
-        str_input = m5.hexdigest()
-        ret = True
-        name = self.key + str(int(str_input[0:2], 16) % self.blockNum)
-        for f in self.hashfunc:
-            loc = f.hash(str_input)
-            ret = ret & self.server.getbit(name, loc)
-        return ret
+        return self.contains_many([str_input])[0]
+
+    def add(self, str_input):
+        self.add_many([str_input])
+
+
+class ScalableBloomFilter(object):
+    """
+    可扩容布隆过滤器-每一层是一个BloomFilter，当前层的估算填充率达到fill_threshold时新建一层，
+    新层容量乘以growth、误判率乘以tightening，总误判率不超过error_rate
+    层的参数和已添加数量保存在 <key>:meta (hash)，多个进程共用，第i层的位保存在 <key>:<i>:<块>
+    每次查询在同一个pipeline中读取层数，其他进程扩容后自动重新读取层参数
+    可以用work_utils/bloomfilter_admin.py把旧的布隆过滤器接入成第0层，或者从数据源重建
+    """
+    def __init__(self, server, key, capacity=1000000, error_rate=0.0001, growth=2, tightening=0.5, fill_threshold=0.5):
+        self.server = server
+        self.key = key
+        self.meta_key = key + ':meta'
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.fill_threshold = fill_threshold
+        self.layers = []  # [(BloomFilter, 层参数dict)]
+        self.create_script = server.register_script(CREATE_LAYER_SCRIPT)
+
+    def layer_params(self, index):
+        """ 第i层: 容量 capacity*growth^i，误判率 error_rate*(1-tightening)*tightening^i """
+        capacity = int(self.capacity * self.growth ** index)
+        error_rate = self.error_rate * (1 - self.tightening) * self.tightening ** index
+        bits, hash_count = bloom_size(capacity, error_rate)
+        return {
+            'key': '{}:{}:'.format(self.key, index),
+            'mode': 'double',
+            'bits': bits,
+            'hash_count': hash_count,
+            'capacity': capacity,
+            'blocks': int(math.ceil(float(bits) / MAX_BLOCK_BITS)),
+        }
+
+    def load(self):
+        """ 从redis读取全部层，没有时创建第0层 """
+        meta = {key.decode(): value.decode() for key, value in self.server.hgetall(self.meta_key).items()}
+        if not int(meta.get('layers', 0)):
+            self.create_layer(0, self.layer_params(0))
+            return self.load()
+        self.layers = []
+        for index in range(int(meta['layers'])):
+            params = {name: meta['{}:{}'.format(index, name)] for name in ('key', 'mode', 'bits', 'hash_count', 'capacity', 'blocks')}
+            for name in ('bits', 'hash_count', 'capacity', 'blocks'):
+                params[name] = int(params[name])
+            params['count'] = int(meta.get('{}:count'.format(index), 0))
+            bloomfilter = BloomFilter(
+                server=self.server,
+                key=params['key'],
+                blockNum=params['blocks'],
+                hash_mode=params['mode'],
+                hash_count=params['hash_count'],
+                bit_size=int(math.ceil(float(params['bits']) / params['blocks'])),
+            )
+            self.layers.append((bloomfilter, params))
+        return self.layers
+
+    def create_layer(self, index, params, count=0):
+        """ 多个进程同时扩容时只有一个能创建成功，其余的重新读取 """
+        mapping = {'{}:{}'.format(index, name): value for name, value in params.items() if name != 'count'}
+        mapping['{}:count'.format(index)] = count
+        args = [index]
+        for field, value in mapping.items():
+            args.extend((field, value))
+        if not self.create_script(keys=[self.meta_key], args=args):
+            return False
+        logger.info('布隆过滤器扩容--{}--第{}层--容量:{}--位数:{}--哈希个数:{}'.format(
+            self.key, index, params['capacity'], params['bits'], params['hash_count']))
+        return True
+
+    def grow(self):
+        index = len(self.layers)
+        self.create_layer(index, self.layer_params(index))
+        self.load()
+
+    def query_layers(self, values, layers):
+        """ 在指定的层中判断，同一个pipeline中读取redis中的层数，返回(结果, 层数) """
+        pipe = self.server.pipeline(transaction=False)
+        pipe.hget(self.meta_key, 'layers')
+        groups = []
+        for bloomfilter, _ in layers:
+            blocks = bloomfilter.group_positions(values)
+            bloomfilter.queue_bitfield(pipe, blocks, 'GET')
+            groups.append(blocks)
+        replies = pipe.execute()
+        layer_count = int(replies[0] or 0)
+        results = [False] * len(values)
+        offset = 1
+        for blocks in groups:
+            layer_results = BloomFilter.parse_bitfield(len(values), blocks, replies[offset:offset + len(blocks)])
+            offset += len(blocks)
+            results = [a or b for a, b in zip(results, layer_results)]
+        return results, layer_count
+
+    def contains_many(self, values):
+        """ 全部层在一次pipeline中判断，层数变化(其他进程扩容)时重新读取后再判断 """
+        if not self.layers:
+            self.load()
+        results, layer_count = self.query_layers(values, self.layers)
+        if layer_count != len(self.layers):
+            self.load()
+            return self.contains_many(values)
+        return results
+
+    def add_many(self, values):
+        """
+        先在旧的层中判断，不存在的值添加到当前层，返回每个值添加之前是否已经存在
+        当前层的数量达到填充阈值时扩容
+        """
+        if not self.layers:
+            self.load()
+        results = self.contains_many(values) if len(self.layers) > 1 else [False] * len(values)
+        candidates = [index for index, existed in enumerate(results) if not existed and values[index]]
+        if not candidates:
+            return results
+        current = len(self.layers)
+        bloomfilter, params = self.layers[-1]
+        blocks = bloomfilter.group_positions([values[index] for index in candidates])
+        pipe = self.server.pipeline(transaction=False)
+        pipe.hget(self.meta_key, 'layers')
+        bloomfilter.queue_bitfield(pipe, blocks, 'SET')
+        replies = pipe.execute()
+        layer_count = int(replies[0] or 0)
+        added = BloomFilter.parse_bitfield(len(candidates), blocks, replies[1:])
+        new_count = 0
+        for index, existed in zip(candidates, added):
+            results[index] = existed
+            new_count += not existed
+        if new_count:
+            count = self.server.hincrby(self.meta_key, '{}:count'.format(current - 1), new_count)
+            params['count'] = count
+        if layer_count != current:
+            # 其他进程已经扩容: 重新读取，刚添加的新值还要在新的层中判断一次
+            self.load()
+            fresh = [index for index in candidates if not results[index]]
+            if fresh and len(self.layers) > current:
+                found, _ = self.query_layers([values[index] for index in fresh], self.layers[current:])
+                for index, existed in zip(fresh, found):
+                    results[index] = existed
+        elif new_count and fill_ratio(params['bits'], params['hash_count'], params['count']) >= self.fill_threshold:
+            self.grow()
+        return results
+
+    def is_exist(self, str_input):
+        if not str_input:
+            return False
+        return self.contains_many([str_input])[0]
+
+    def add(self, str_input):
+        self.add_many([str_input])
+
+    def delete(self):
+        """ 删除全部层和参数，下次使用时重新创建第0层 """
+        if not self.layers:
+            self.load()
+        keys = [self.meta_key]
+        for bloomfilter, _ in self.layers:
+            keys.extend(bloomfilter.key + str(block) for block in range(bloomfilter.blockNum))
+        self.server.delete(*keys)
+        self.layers = []
+
+    def expire(self, seconds):
+        """ 参数和全部层的块设置过期时间，还没有写入过的块不存在，需要在写入后再设置一次 """
+        if not self.layers:
+            self.load()
+        pipe = self.server.pipeline(transaction=False)
+        pipe.expire(self.meta_key, seconds)
+        for bloomfilter, _ in self.layers:
+            for block in range(bloomfilter.blockNum):
+                pipe.expire(bloomfilter.key + str(block), seconds)
+        pipe.execute()
+
+    def bitcount(self, bloomfilter):
+        return sum(self.server.bitcount(bloomfilter.key + str(block)) for block in range(bloomfilter.blockNum))
+
+    def estimate(self, exact_fill=False):
+        """
+        估算基数和误判率
+        :param exact_fill: True时用BITCOUNT统计实际置1的位数(要扫描全部位，离线使用)，
+                           基数按 n = -m/k * ln(1 - x/m) 计算，否则按记录的数量计算
+        """
+        if not self.layers:
+            self.load()
+        layers = []
+        cardinality = 0
+        not_false_positive = 1.0
+        for bloomfilter, params in self.layers:
+            bits, hash_count = params['bits'], params['hash_count']
+            if exact_fill:
+                ratio = float(self.bitcount(bloomfilter)) / bits
+                count = int(-float(bits) / hash_count * math.log(1 - ratio)) if ratio < 1 else float('inf')
+            else:
+                count = params['count']
+                ratio = fill_ratio(bits, hash_count, count)
+            cardinality += count
+            not_false_positive *= 1 - ratio ** hash_count
+            layers.append({'capacity': params['capacity'], 'count': count, 'fill_ratio': round(ratio, 6)})
+        return {
+            'layers': layers,
+            'cardinality': cardinality,
+            'error_rate': 1 - not_false_positive,
+        }
+
+    def record_stats(self, stats, prefix):
+        """ 估算结果写入scrapy stats """
+        estimate = self.estimate()
+        stats.set_value('{}/layers'.format(prefix), len(estimate['layers']))
+        stats.set_value('{}/cardinality'.format(prefix), estimate['cardinality'])
+        stats.set_value('{}/fill_ratio'.format(prefix), estimate['layers'][-1]['fill_ratio'])
+        stats.set_value('{}/error_rate'.format(prefix), estimate['error_rate'])
+
+
+
+class CycleBloomFilter(object):
+    """
+    按周期轮换的可扩容布隆过滤器 <key>:<周期>
+    周期: 指定的周期名cycle，为空时按days天自动分桶，每次使用时检查，长期运行的进程跨过分桶后自动切换到新的过滤器
+    days大于0时设置过期时间(默认一个周期): 写入时每隔refresh_interval秒、层数变化(扩容、过期后重建)时刷新，
+    过滤器在最后一次写入一个周期后过期，最多同时保留两个周期
+    cycle和days都为空时和ScalableBloomFilter一样，不轮换也不过期
+    """
+    def __init__(self, server, key, days=0, cycle='', ttl=None, refresh_interval=600, **options):
+        self.server = server
+        self.base_key = key
+        self.days = days
+        self.fixed_cycle = cycle
+        self.ttl = ttl if ttl is not None else (days * DAY if days > 0 else None)
+        self.refresh_interval = refresh_interval
+        self.options = options
+        self.cycle = None
+        self.active = None
+        self.expired_layers = None  # 上次设置过期时间时的层数
+        self.expired_at = 0
+
+    def cycle_at(self, now=None):
+        if self.fixed_cycle:
+            return self.fixed_cycle
+        return cycle_name(self.days, now) if self.days > 0 else ''
+
+    def current(self, now=None):
+        """ 当前周期的过滤器，跨过周期时切换 """
+        cycle = self.cycle_at(now)
+        if self.active is None or cycle != self.cycle:
+            key = '{}:{}'.format(self.base_key, cycle) if cycle else self.base_key
+            if self.active is not None:
+                logger.info('布隆过滤器切换周期--{}--{}'.format(self.active.key, key))
+            self.cycle = cycle
+            self.active = ScalableBloomFilter(self.server, key, **self.options)
+            self.expired_layers = None
+            self.expired_at = 0
+        return self.active
+
+    @property
+    def key(self):
+        return self.current().key
+
+    def refresh_expire(self, force=False, now=None):
+        if not self.ttl or self.active is None:
+            return
+        now = now or time.time()
+        layers = len(self.active.layers)
+        if force or layers != self.expired_layers or now - self.expired_at >= self.refresh_interval:
+            self.active.expire(self.ttl)
+            self.expired_layers = len(self.active.layers)
+            self.expired_at = now
+
+    def contains_many(self, values):
+        return self.current().contains_many(values)
+
+    def add_many(self, values):
+        results = self.current().add_many(values)
+        self.refresh_expire()
+        return results
+
+    def is_exist(self, str_input):
+        if not str_input:
+            return False
+        return self.contains_many([str_input])[0]
 
     def add(self, str_input):
-        m5 = md5()
-        m5.update(str_input.encode())
-        str_input = m5.hexdigest()
-        name = self.key + str(int(str_input[0:2], 16) % self.blockNum)
-        for f in self.hashfunc:
-            loc = f.hash(str_input)
-            self.server.setbit(name, loc, 1)
+        self.add_many([str_input])
 
 
 if __name__ == '__main__':
@@ -66,4 +459,4 @@ if __name__ == '__main__':
         print('exists!')
     else:
         print('not exists!')
-        bf.add('http://www.baidu.com1')
\ No newline at end of file
+        bf.add('http://www.baidu.com1')
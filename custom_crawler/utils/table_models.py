@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from custom_crawler.work_utils import creat_baidu_table, creat_gsxt_table
+
+
+def load_tables():
+    """
+    :return: work_utils中建表模型定义的全部表 {表名: sqlalchemy Table}
+    """
+    tables = {}
+    for base in (creat_baidu_table.Base, creat_gsxt_table.Base):
+        for table in base.metadata.sorted_tables:
+            tables[table.name] = table
+    return tables
+
+
+def table_columns():
+    """
+    :return: 每张表需要写入的字段(去掉自增主键)，顺序和建表模型一致 {表名: [字段名]}
+    """
+    return {
+        name: [column.name for column in table.columns if not column.primary_key]
+        for name, table in load_tables().items()
+    }
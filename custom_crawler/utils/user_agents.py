@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import bisect
+import json
+import os
+import random
+from collections import OrderedDict
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'user_agents.json')
+
+_cache = {}
+
+
+class UserAgentPool(object):
+    """
+    离线User-Agent池-数据文件(data/user_agents.json)随代码发布，启动时只读取一次
+    按浏览器/平台过滤后保存成紧凑的元组和累计权重，取值为一次二分查找
+    """
+    __slots__ = ('version', 'agents', 'cum_weights', 'total')
+
+    def __init__(self, version, agents, weights):
+        if not agents:
+            raise ValueError('User-Agent池为空，检查RANDOM_UA_TYPE/RANDOM_UA_PLATFORMS配置')
+        self.version = version
+        self.agents = tuple(agents)
+        cum_weights = []
+        total = 0.0
+        for weight in weights:
+            total += weight
+            cum_weights.append(total)
+        self.cum_weights = tuple(cum_weights)
+        self.total = total
+
+    @classmethod
+    def load(cls, path=DATA_PATH, browser='random', platforms=None):
+        """
+        :param browser: 'random' 不限浏览器，或 chrome/edge/firefox/safari
+        :param platforms: None 不限平台，或 ['windows', 'mac', 'linux', 'android', 'ios'] 中的若干个
+        同一进程中相同参数的池只加载一次
+        """
+        cache_key = (path, browser, tuple(platforms) if platforms else None)
+        if cache_key not in _cache:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            agents = []
+            weights = []
+            for user_agent, agent_browser, platform, weight in data['agents']:
+                if browser not in (None, 'random') and agent_browser != browser:
+                    continue
+                if platforms and platform not in platforms:
+                    continue
+                agents.append(user_agent)
+                weights.append(weight)
+            _cache[cache_key] = cls(data['version'], agents, weights)
+        return _cache[cache_key]
+
+    def __len__(self):
+        return len(self.agents)
+
+    def get(self):
+        """ 按权重(浏览器/平台占比)随机取一个 """
+        return self.agents[bisect.bisect(self.cum_weights, random.random() * self.total)]
+
+
+class PinnedUserAgents(object):
+    """ 代理会话固定User-Agent: 同一个代理一直使用同一个UA，最多记录capacity个代理 """
+    def __init__(self, pool, capacity=10000):
+        self.pool = pool
+        self.capacity = capacity
+        self.pinned = OrderedDict()
+
+    def get(self, proxy):
+        user_agent = self.pinned.get(proxy)
+        if user_agent is None:
+            user_agent = self.pool.get()
+            self.pinned[proxy] = user_agent
+            if len(self.pinned) > self.capacity:
+                self.pinned.popitem(last=False)
+        return user_agent
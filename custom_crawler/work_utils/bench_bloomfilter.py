@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+布隆过滤器微基准: 对比逐位GETBIT/SETBIT(改造前)和批量BITFIELD(改造后)的每秒操作数
+使用临时key，结束后删除
+python -m custom_crawler.work_utils.bench_bloomfilter --host 127.0.0.1 --db 15 -n 20000 --batch 500
+"""
+import argparse
+import time
+import uuid
+from hashlib import md5
+
+import redis
+
+from custom_crawler.utils.redis_bloomfilter import BloomFilter
+
+
+def old_positions(bf, value):
+    """ 改造前的算法: md5十六进制串，逐字符SimpleHash """
+    str_input = md5(value.encode()).hexdigest()
+    name = bf.key + str(int(str_input[0:2], 16) % bf.blockNum)
+    locations = []
+    for seed in bf.seeds:
+        ret = 0
+        for i in range(len(str_input)):
+            ret += seed * ret + ord(str_input[i])
+        locations.append((bf.bit_size - 1) & ret)
+    return name, locations
+
+
+def old_add(bf, value):
+    name, locations = old_positions(bf, value)
+    for location in locations:
+        bf.server.setbit(name, location, 1)
+
+
+def old_is_exist(bf, value):
+    name, locations = old_positions(bf, value)
+    ret = True
+    for location in locations:
+        ret = ret & bf.server.getbit(name, location)
+    return ret
+
+
+def timeit(label, count, func):
+    start = time.perf_counter()
+    func()
+    cost = time.perf_counter() - start
+    print('{:<36}{:>12.0f} ops/s'.format(label, count / cost))
+
+
+def chunks(values, size):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='布隆过滤器微基准')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--password', default=None)
+    parser.add_argument('--db', type=int, default=15)
+    parser.add_argument('-n', type=int, default=20000, help='测试的值数量')
+    parser.add_argument('--batch', type=int, default=500, help='批量接口每批数量')
+    args = parser.parse_args()
+
+    server = redis.Redis(host=args.host, port=args.port, password=args.password, db=args.db)
+    key = 'bench:bloomfilter:{}:'.format(uuid.uuid4().hex)
+    legacy = BloomFilter(server=server, key=key + 'legacy', blockNum=1, hash_mode='legacy')
+    double = BloomFilter(server=server, key=key + 'double', blockNum=1, hash_mode='double')
+    values = ['https://xin.baidu.com/detail/basicAjax?pid={}'.format(i) for i in range(args.n)]
+    try:
+        print('-- 只计算位置 --')
+        timeit('改造前 SimpleHash', args.n, lambda: [old_positions(legacy, value) for value in values])
+        timeit('legacy SimpleHash(逐步取模)', args.n, lambda: [legacy.positions(value) for value in values])
+        timeit('double 双重哈希', args.n, lambda: [double.positions(value) for value in values])
+        print('-- redis 往返 --')
+        timeit('改造前 add(逐位SETBIT)', args.n, lambda: [old_add(legacy, value) for value in values])
+        timeit('改造前 is_exist(逐位GETBIT)', args.n, lambda: [old_is_exist(legacy, value) for value in values])
+        server.delete(legacy.key + '0')
+        timeit('legacy add_many', args.n, lambda: [legacy.add_many(batch) for batch in chunks(values, args.batch)])
+        timeit('legacy contains_many', args.n, lambda: [legacy.contains_many(batch) for batch in chunks(values, args.batch)])
+        timeit('double add_many', args.n, lambda: [double.add_many(batch) for batch in chunks(values, args.batch)])
+        timeit('double contains_many', args.n, lambda: [double.contains_many(batch) for batch in chunks(values, args.batch)])
+        assert all(double.contains_many(values[:args.batch]))
+    finally:
+        server.delete(legacy.key + '0', double.key + '0')
+
+
+if __name__ == '__main__':
+    main()
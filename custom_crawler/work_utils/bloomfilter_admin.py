@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+可扩容布隆过滤器离线管理(爬虫停止时使用)
+查看层数、基数和误判率估算(--exact 用BITCOUNT统计实际填充率):
+    python -m custom_crawler.work_utils.bloomfilter_admin stats baidu_xin:bloomfilter --exact
+把旧的布隆过滤器(BloomFilter legacy模式)接入成第0层，已有数据继续有效，之后按新参数扩容
+(已经自动创建了空的第0层、还没有添加过数据时也可以接入):
+    python -m custom_crawler.work_utils.bloomfilter_admin adopt baidu_xin:bloomfilter --legacy-key baidu_xin:bloomfilter --legacy-blocks 1
+从数据源按新的容量和误判率重建(迁移/调整大小)，数据源为redis集合或文本文件(每行一个值)，
+如把scrapy_redis集合中的请求指纹导入BloomDupeFilter，完成后可以删除原来的集合:
+    python -m custom_crawler.work_utils.bloomfilter_admin rebuild baidu_xin:dupefilter --from-set baidu_xin:dupefilter --capacity 200000000
+"""
+import argparse
+import json
+import logging
+import math
+
+import redis
+
+from custom_crawler import settings
+from custom_crawler.utils.redis_bloomfilter import BloomFilter, ScalableBloomFilter
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_cardinality(server, key, blocks, bits, hash_count):
+    """ 按BITCOUNT估算旧过滤器中的数量，每个块分别计算 """
+    total = 0
+    for block in range(blocks):
+        ratio = float(server.bitcount(key + str(block))) / bits
+        if ratio >= 1:
+            raise ValueError('过滤器已经全部置1--{}{}'.format(key, block))
+        total += int(-float(bits) / hash_count * math.log(1 - ratio))
+    return total
+
+
+def is_unused(server, bloomfilter):
+    """ 只有自动创建的空第0层(没有添加过数据)，可以删除后接入旧的过滤器 """
+    layers = bloomfilter.load()
+    if len(layers) != 1:
+        return False
+    layer, params = layers[0]
+    if params['count']:
+        return False
+    return not any(server.exists(layer.key + str(block)) for block in range(layer.blockNum))
+
+
+def adopt(server, bloomfilter, legacy_key, legacy_blocks):
+    if server.exists(bloomfilter.meta_key):
+        # 爬虫或关键词导入先用到了过滤器时会自动创建空的第0层，没有数据时可以替换
+        if not is_unused(server, bloomfilter):
+            raise ValueError('{}已经有数据，只能在第一次使用之前接入旧的过滤器'.format(bloomfilter.meta_key))
+        logger.info('{}只有空的第0层，删除后接入旧的过滤器'.format(bloomfilter.meta_key))
+        bloomfilter.delete()
+    legacy = BloomFilter(server=server, key=legacy_key, blockNum=legacy_blocks)
+    count = legacy_cardinality(server, legacy_key, legacy_blocks, legacy.bit_size, legacy.hash_count)
+    params = {
+        'key': legacy_key,
+        'mode': 'legacy',
+        'bits': legacy.bit_size * legacy_blocks,
+        'hash_count': legacy.hash_count,
+        'capacity': count,  # 只读层，下次添加时扩容
+        'blocks': legacy_blocks,
+    }
+    bloomfilter.create_layer(0, params, count=count)
+    # 旧过滤器不再添加新值
+    bloomfilter.load()
+    bloomfilter.grow()
+    logger.info('接入完成--{}--估算数量:{}'.format(legacy_key, count))
+
+
+def iter_source(server, args, batch_size):
+    batch = []
+    if args.from_set:
+        for value in server.sscan_iter(args.from_set, count=batch_size):
+            batch.append(value.decode('utf-8'))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    else:
+        with open(args.from_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                value = line.strip()
+                if value:
+                    batch.append(value)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def rebuild(server, bloomfilter, args):
+    if server.exists(bloomfilter.meta_key):
+        if not args.reset:
+            raise ValueError('{}已经存在，使用--reset删除后重建'.format(bloomfilter.meta_key))
+        bloomfilter.delete()
+    total = 0
+    for batch in iter_source(server, args, args.batch_size):
+        bloomfilter.add_many(batch)
+        total += len(batch)
+        if total % (args.batch_size * 100) < args.batch_size:
+            logger.info('已导入{}'.format(total))
+    logger.info('重建完成--导入{}'.format(total))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='可扩容布隆过滤器离线管理')
+    parser.add_argument('command', choices=['stats', 'adopt', 'rebuild'])
+    parser.add_argument('key', help='过滤器key，如 baidu_xin:bloomfilter')
+    parser.add_argument('--host', default=settings.REDIS_HOST)
+    parser.add_argument('--port', type=int, default=settings.REDIS_PORT)
+    parser.add_argument('--password', default=settings.REDIS_PASSWORD)
+    parser.add_argument('--db', type=int, default=settings.REDIS_DB)
+    parser.add_argument('--capacity', type=int, default=10000000, help='第0层容量(新建时有效)')
+    parser.add_argument('--error-rate', type=float, default=0.0001, help='总误判率(新建时有效)')
+    parser.add_argument('--exact', action='store_true', help='stats: 用BITCOUNT统计实际填充率')
+    parser.add_argument('--legacy-key', help='adopt: 旧过滤器的key前缀')
+    parser.add_argument('--legacy-blocks', type=int, default=1, help='adopt: 旧过滤器的blockNum')
+    parser.add_argument('--from-set', help='rebuild: 数据源redis集合')
+    parser.add_argument('--from-file', help='rebuild: 数据源文本文件')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--reset', action='store_true', help='rebuild: 删除已有的过滤器')
+    args = parser.parse_args()
+    logging.basicConfig(level=settings.LOG_LEVEL)
+
+    server = redis.StrictRedis(host=args.host, port=args.port, password=args.password, db=args.db)
+    bloomfilter = ScalableBloomFilter(server, args.key, capacity=args.capacity, error_rate=args.error_rate)
+    if args.command == 'stats':
+        if not server.exists(bloomfilter.meta_key):
+            raise SystemExit('{}不存在'.format(bloomfilter.meta_key))
+        print(json.dumps(bloomfilter.estimate(exact_fill=args.exact), ensure_ascii=False, indent=2))
+    elif args.command == 'adopt':
+        if not args.legacy_key:
+            parser.error('adopt 需要 --legacy-key')
+        adopt(server, bloomfilter, args.legacy_key, args.legacy_blocks)
+    else:
+        if not (args.from_set or args.from_file):
+            parser.error('rebuild 需要 --from-set 或 --from-file')
+        rebuild(server, bloomfilter, args)
+
+
+if __name__ == '__main__':
+    main()
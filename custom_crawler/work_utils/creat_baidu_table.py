@@ -6,7 +6,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from custom_crawler.settings import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME, DB_CHARSET
 from sqlalchemy.dialects.mysql import LONGTEXT
-from sqlalchemy import Column, Integer, String, TEXT, DATETIME, SMALLINT, ForeignKey
+from sqlalchemy import Column, Integer, String, TEXT, DATETIME, SMALLINT, ForeignKey, UniqueConstraint
 
 warnings.filterwarnings("ignore")
 Base = declarative_base()
@@ -24,6 +24,7 @@ engine = create_engine(
 class BusinessCollection(Base):
     """ 百度企业信用-工商信息表 """
     __tablename__ = 'business_information'
+    __table_args__ = (UniqueConstraint('url', name='uk_natural_key'),)
     id = Column(Integer, autoincrement=True, primary_key=True, nullable=False)
     ent_name = Column(String(length=128), nullable=True, index=True, comment='企业名称')
     reg_capital = Column(String(length=64), nullable=True, comment='注册资本')
@@ -52,6 +53,7 @@ class BusinessCollection(Base):
 
     contents = Column(LONGTEXT, nullable=True, comment='数据字典')
     url = Column(String(length=128), nullable=False, comment='详情url')
+    content_hash = Column(String(length=32), nullable=True, comment='内容哈希')
     spider_time = Column(DATETIME, nullable=False, default=datetime.now, comment='抓取时间')
     xxly = Column(String(length=20), nullable=True, comment='数据来源')
     process_status = Column(Integer, default=0, nullable=True, onupdate=1, comment='状态')
@@ -65,6 +67,7 @@ class BusinessCollection(Base):
 class ShareCollection(Base):
     """ 百度企业信用-股东信息表 """
     __tablename__ = 'share_information'
+    __table_args__ = (UniqueConstraint('ent_name', 'gd_name', name='uk_natural_key'),)
     id = Column(Integer, autoincrement=True, primary_key=True, nullable=False)
     ent_name = Column(String(length=128), nullable=True, index=True, comment='企业名称')
     gd_name = Column(String(length=128), nullable=True, comment='股东姓名')
@@ -75,6 +78,7 @@ class ShareCollection(Base):
 
     contents = Column(LONGTEXT, nullable=True, comment='数据字典')
     url = Column(String(length=128), nullable=False, comment='详情url')
+    content_hash = Column(String(length=32), nullable=True, comment='内容哈希')
     spider_time = Column(DATETIME, nullable=False, default=datetime.now, comment='抓取时间')
     xxly = Column(String(length=20), nullable=True, comment='数据来源')
     process_status = Column(Integer, default=0, nullable=True, onupdate=1, comment='状态')
@@ -88,6 +92,7 @@ class ShareCollection(Base):
 class WenshuCollection(Base):
     """ 百度企业信用-裁判文书表 """
     __tablename__ = 'wenshu_information'
+    __table_args__ = (UniqueConstraint('url', name='uk_natural_key'),)
     id = Column(Integer, autoincrement=True, primary_key=True, nullable=False)
     ent_name = Column(String(length=128), nullable=True, index=True, comment='企业名称')
     legal_person = Column(String(length=64), nullable=True, comment='法人')
@@ -108,6 +113,7 @@ class WenshuCollection(Base):
 
     contents = Column(LONGTEXT, nullable=True, comment='文本内容')
     url = Column(String(length=128), nullable=False, comment='详情url')
+    content_hash = Column(String(length=32), nullable=True, comment='内容哈希')
     spider_time = Column(DATETIME, nullable=False, default=datetime.now, comment='抓取时间')
     xxly = Column(String(length=20), nullable=True, comment='数据来源')
     process_status = Column(Integer, default=0, nullable=True, onupdate=1, comment='状态')
@@ -121,6 +127,7 @@ class WenshuCollection(Base):
 class DiscreditCollection(Base):
     """ 百度企业信用-失信被执行人表 """
     __tablename__ = 'discredit_information'
+    __table_args__ = (UniqueConstraint('url', 'implement_number', name='uk_natural_key'),)
     id = Column(Integer, autoincrement=True, primary_key=True, nullable=False)
     ent_name = Column(String(length=128), nullable=True, index=True, comment='企业名称')
     legal_person = Column(String(length=64), nullable=True, comment='法人')
@@ -146,6 +153,7 @@ class DiscreditCollection(Base):
     unperform_content = Column(TEXT, nullable=True, comment='未履行内容')
 
     url = Column(String(length=128), nullable=False, comment='详情url')
+    content_hash = Column(String(length=32), nullable=True, comment='内容哈希')
     spider_time = Column(DATETIME, nullable=False, default=datetime.now, comment='抓取时间')
     xxly = Column(String(length=20), nullable=True, comment='数据来源')
     process_status = Column(Integer, default=0, nullable=True, onupdate=1, comment='状态')
@@ -159,6 +167,7 @@ class DiscreditCollection(Base):
 class AbnormalCollection(Base):
     """ 百度企业信用-经营异常表 """
     __tablename__ = 'abnormal_information'
+    __table_args__ = (UniqueConstraint('ent_name', 'enter_date', 'authority', name='uk_natural_key'),)
     id = Column(Integer, autoincrement=True, primary_key=True, nullable=False)
     ent_name = Column(String(length=128), nullable=True, index=True, comment='企业名称')
     legal_person = Column(String(length=64), nullable=True, comment='法人')
@@ -177,6 +186,7 @@ class AbnormalCollection(Base):
 
     contents = Column(LONGTEXT, nullable=True, comment='文本内容')
     url = Column(String(length=128), nullable=False, comment='详情url')
+    content_hash = Column(String(length=32), nullable=True, comment='内容哈希')
     spider_time = Column(DATETIME, nullable=False, default=datetime.now, comment='抓取时间')
     xxly = Column(String(length=20), nullable=True, comment='数据来源')
     process_status = Column(Integer, default=0, nullable=True, onupdate=1, comment='状态')
@@ -190,6 +200,7 @@ class AbnormalCollection(Base):
 class PenaltiesCollection(Base):
     """ 百度企业信用-行政处罚表 """
     __tablename__ = 'penalties_information'
+    __table_args__ = (UniqueConstraint('url', 'cf_wsh', name='uk_natural_key'),)
     id = Column(Integer, autoincrement=True, primary_key=True, nullable=False)
     ent_name = Column(String(length=128), nullable=True, index=True, comment='企业名称')
     legal_person = Column(String(length=64), nullable=True, comment='法人')
@@ -212,6 +223,7 @@ class PenaltiesCollection(Base):
 
     contents = Column(LONGTEXT, nullable=True, comment='文本内容')
     url = Column(String(length=128), nullable=False, comment='详情url')
+    content_hash = Column(String(length=32), nullable=True, comment='内容哈希')
     spider_time = Column(DATETIME, nullable=False, default=datetime.now, comment='抓取时间')
     xxly = Column(String(length=20), nullable=True, comment='数据来源')
     process_status = Column(Integer, default=0, nullable=True, onupdate=1, comment='状态')
@@ -225,6 +237,7 @@ class PenaltiesCollection(Base):
 class FreezeCollection(Base):
     """ 百度企业信用-股权冻结表 """
     __tablename__ = 'freeze_infomation'
+    __table_args__ = (UniqueConstraint('url', name='uk_natural_key'),)
     id = Column(Integer, autoincrement=True, primary_key=True, nullable=False)
     ent_name = Column(String(length=128), nullable=True, index=True, comment='企业名称')
     legal_person = Column(String(length=64), nullable=True, comment='法人')
@@ -253,6 +266,7 @@ class FreezeCollection(Base):
     continuation_freeze = Column(String(length=256), nullable=True, comment='续行冻结情况')
 
     url = Column(String(length=128), nullable=False, comment='详情url')
+    content_hash = Column(String(length=32), nullable=True, comment='内容哈希')
     spider_time = Column(DATETIME, nullable=False, default=datetime.now, comment='抓取时间')
     xxly = Column(String(length=20), nullable=True, comment='数据来源')
     process_status = Column(Integer, default=0, nullable=True, onupdate=1, comment='状态')
@@ -266,6 +280,7 @@ class FreezeCollection(Base):
 class IllegalCollection(Base):
     """ 百度企业信用-严重违法表 """
     __tablename__ = 'illegal_infomation'
+    __table_args__ = (UniqueConstraint('ent_name', 'enter_date', 'authority', name='uk_natural_key'),)
     id = Column(Integer, autoincrement=True, primary_key=True, nullable=False)
     ent_name = Column(String(length=128), nullable=True, index=True, comment='企业名称')
     legal_person = Column(String(length=64), nullable=True, comment='法人')
@@ -284,6 +299,7 @@ class IllegalCollection(Base):
 
     contents = Column(LONGTEXT, nullable=True, comment='文本内容')
     url = Column(String(length=128), nullable=False, comment='详情url')
+    content_hash = Column(String(length=32), nullable=True, comment='内容哈希')
     spider_time = Column(DATETIME, nullable=False, default=datetime.now, comment='抓取时间')
     xxly = Column(String(length=20), nullable=True, comment='数据来源')
     process_status = Column(Integer, default=0, nullable=True, onupdate=1, comment='状态')
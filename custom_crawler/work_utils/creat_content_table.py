@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+import warnings
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from custom_crawler.settings import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME, DB_CHARSET
+from sqlalchemy.dialects.mysql import LONGBLOB
+from sqlalchemy import Column, Integer, String, CHAR, DATETIME
+
+warnings.filterwarnings("ignore")
+Base = declarative_base()
+# 初始化数据库连接:
+engine = create_engine(
+    "mysql+pymysql://{username}:{password}@{host}:{port}/{db}?charset={charset}".format(username=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT, db=DB_NAME, charset=DB_CHARSET),
+    # echo=True,  # 打印过程
+)
+
+
+class ContentStoreCollection(Base):
+    """ 内容存储表-压缩后的原始内容，按sha1去重，各数据表通过 content:<sha1> 引用 """
+    __tablename__ = 'content_store'
+    content_key = Column(CHAR(length=40), primary_key=True, nullable=False, comment='原始内容sha1')
+    codec = Column(String(length=8), nullable=False, comment='压缩方式 zstd/zlib')
+    raw_size = Column(Integer, nullable=False, comment='原始字节数')
+    data = Column(LONGBLOB, nullable=False, comment='压缩后的内容')
+    create_time = Column(DATETIME, nullable=False, default=datetime.now, comment='写入时间')
+
+    def __repr__(self):
+        return "<ContentStoreCollection %r>" % self.content_key
+
+
+if __name__ == '__main__':
+    Base.metadata.create_all(engine)  # 新建表
+    # Base.metadata.drop_all(engine)  # 删除表
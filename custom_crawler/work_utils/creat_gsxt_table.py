@@ -6,7 +6,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from custom_crawler.settings import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME, DB_CHARSET
 from sqlalchemy.dialects.mysql import LONGTEXT
-from sqlalchemy import Column, Integer, String, TEXT, DATETIME, SMALLINT, ForeignKey
+from sqlalchemy import Column, Integer, String, TEXT, DATETIME, SMALLINT, ForeignKey, UniqueConstraint
 
 warnings.filterwarnings("ignore")
 Base = declarative_base()
@@ -24,6 +24,7 @@ engine = create_engine(
 class BusinessCollection(Base):
     """ 国家企业公示系统-工商信息表 """
     __tablename__ = 'gsxt_business_information'
+    __table_args__ = (UniqueConstraint('url', name='uk_natural_key'),)
     id = Column(Integer, autoincrement=True, primary_key=True, nullable=False)
     ent_name = Column(String(length=128), nullable=True, index=True, comment='企业名称')
     unified_code = Column(String(length=64), nullable=True, comment='统一社会信用代码')
@@ -43,6 +44,7 @@ class BusinessCollection(Base):
 
     contents = Column(LONGTEXT, nullable=True, comment='数据字典')
     url = Column(String(length=512), nullable=False, comment='详情url')
+    content_hash = Column(String(length=32), nullable=True, comment='内容哈希')
     spider_time = Column(DATETIME, nullable=False, default=datetime.now, comment='抓取时间')
     xxly = Column(String(length=20), nullable=True, comment='数据来源')
     process_status = Column(Integer, default=0, nullable=True, onupdate=1, comment='状态')
@@ -56,6 +58,7 @@ class BusinessCollection(Base):
 class AbnormalCollection(Base):
     """ 国家企业公示系统-经营异常表 """
     __tablename__ = 'gsxt_abnormal_information'
+    __table_args__ = (UniqueConstraint('ent_name', 'enter_date', 'authority', name='uk_natural_key'),)
     id = Column(Integer, autoincrement=True, primary_key=True, nullable=False)
     ent_name = Column(String(length=128), nullable=True, index=True, comment='企业名称')
     unified_code = Column(String(length=64), nullable=True, comment='统一社会信用代码')
@@ -70,7 +73,8 @@ class AbnormalCollection(Base):
     leave_date = Column(String(length=16), nullable=True, comment='移出日期')
 
     contents = Column(LONGTEXT, nullable=True, comment='文本内容')
-    url = Column(String(length=128), nullable=False, comment='详情url')
+    url = Column(String(length=512), nullable=False, comment='详情url')
+    content_hash = Column(String(length=32), nullable=True, comment='内容哈希')
     spider_time = Column(DATETIME, nullable=False, default=datetime.now, comment='抓取时间')
     xxly = Column(String(length=20), nullable=True, comment='数据来源')
     process_status = Column(Integer, default=0, nullable=True, onupdate=1, comment='状态')
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+根据建表模型生成items.py中的定长字段数据类，修改建表模型后重新运行:
+python -m custom_crawler.work_utils.creat_items
+"""
+import os
+
+from sqlalchemy import TEXT, Integer, String, Text, UniqueConstraint
+
+from custom_crawler.work_utils import creat_baidu_table, creat_gsxt_table
+
+ITEMS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'items.py')
+BEGIN_MARK = '# ---- 以下代码由 work_utils/creat_items.py 根据建表模型生成，不要手动修改 ----\n'
+END_MARK = '# ---- 生成代码结束 ----\n'
+TEXT_MAX_CHARS = 65535 // 3  # TEXT最大65535字节，按utf8每个字符3字节计算
+
+
+def class_name(table_name):
+    """ business_information -> BusinessInformationItem """
+    return ''.join(word.capitalize() for word in table_name.split('_')) + 'Item'
+
+
+def render_tuple(values, indent):
+    lines = []
+    line = indent
+    for value in values:
+        text = "'{}', ".format(value)
+        if len(line) + len(text) > 120:
+            lines.append(line.rstrip())
+            line = indent
+        line += text
+    lines.append(line.rstrip())
+    return '\n'.join(lines)
+
+
+def render_model(model):
+    table = model.__table__
+    columns = [column for column in table.columns if not column.primary_key]
+    max_lengths = {}
+    int_fields = []
+    for column in columns:
+        if isinstance(column.type, Integer):
+            int_fields.append(column.name)
+        elif isinstance(column.type, Text):
+            if type(column.type) is TEXT:  # LONGTEXT不限制
+                max_lengths[column.name] = TEXT_MAX_CHARS
+        elif isinstance(column.type, String) and column.type.length:
+            max_lengths[column.name] = column.type.length
+    names = [column.name for column in columns]
+    # 业务主键(唯一索引)和url不截断，截断后会写错行或者写成重复数据
+    untruncated = [name for name in names if name == 'url']
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint):
+            untruncated.extend(column.name for column in constraint.columns if column.name not in untruncated)
+    untruncated = [name for name in untruncated if name in max_lengths]
+    lines = [
+        '',
+        '',
+        'class {}(SlotItem):'.format(class_name(table.name)),
+        '    """{}"""'.format(model.__doc__),
+        "    collection = '{}'".format(table.name),
+        '    __slots__ = (',
+        render_tuple(names, '        '),
+        '    )',
+        '    fields = frozenset(__slots__)',
+        '    max_lengths = {',
+    ]
+    lines.extend("        '{}': {},".format(name, length) for name, length in max_lengths.items())
+    lines.append('    }')
+    lines.append('    int_fields = frozenset(({}))'.format(', '.join("'{}'".format(name) for name in int_fields) + (',' if len(int_fields) == 1 else '')))
+    lines.append('    untruncated_fields = frozenset(({}))'.format(', '.join("'{}'".format(name) for name in untruncated) + (',' if len(untruncated) == 1 else '')))
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    code = ''
+    for module in (creat_baidu_table, creat_gsxt_table):
+        for model in module.Base.__subclasses__():
+            code += render_model(model)
+    with open(ITEMS_PATH, 'r', encoding='utf-8') as f:
+        source = f.read()
+    head = source[:source.index(BEGIN_MARK) + len(BEGIN_MARK)]
+    tail = source[source.index(END_MARK):]
+    with open(ITEMS_PATH, 'w', encoding='utf-8') as f:
+        f.write(head + code + '\n\n' + tail)
+    print('生成完成--{}'.format(ITEMS_PATH))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,27 @@
 # -*- coding: utf-8 -*-
+"""
+百度信用-搜索关键词导入redis: 按score从高到低分页读取jieba_cut_words，分批推入按收益排序的关键词队列
+(baidu_xin:keyword_queue，score作为初始优先级，爬虫按搜索结果的收益调整整族关键词的优先级)
+按(score, keyword)的键集分页(索引用 work_utils/migrate_keyword_index.py 创建)，每批推入后记录断点，中断后重新运行从断点继续
+已经在布隆过滤器中(搜索过没有结果)的关键词跳过
+
+python -m custom_crawler.work_utils.get_keyword
+python -m custom_crawler.work_utils.get_keyword --reset  # 忽略断点从头导入
+python -m custom_crawler.work_utils.get_keyword --migrate-list  # 把旧列表baidu_xin:keywords中剩下的关键词移入队列
+"""
+import argparse
+import logging
+import os
+import time
+from decimal import Decimal
+
 import pymysql
 import redis
 
+from custom_crawler import settings
+from custom_crawler.utils.item_log import Checkpoint
+from custom_crawler.utils.keyword_queue import KeywordQueue
+from custom_crawler.utils.redis_bloomfilter import ScalableBloomFilter
 
 MYSQL_HOST = '114.115.128.41'
 MYSQL_PORT = 3306
@@ -14,34 +34,168 @@ REDIS_HOST = '127.0.0.1'
 REDIS_PORT = '6379'
 REDIS_PWD = ''
 REDIS_DB = 4
-mysql_client = pymysql.connect(host=MYSQL_HOST, port=MYSQL_PORT, user=MYSQL_USER, password=MYSQL_PWD, db=MYSQL_DB, charset=MYSQL_CHARSET)
-redis_client = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PWD, db=REDIS_DB)
 
+KEYWORDS_KEY = 'baidu_xin:keyword_queue'
+LEGACY_KEYWORDS_KEY = 'baidu_xin:keywords'
+BLOOMFILTER_KEY = 'baidu_xin:bloomfilter'
+CHECKPOINT_NAME = 'jieba_cut_words'
 
-def mysql_redis_keyword():
-    """ 百度信用-搜索关键词 """
-    num = 0
-    cursor = mysql_client.cursor()
-    sql_query = """
-            SELECT keyword FROM `jieba_cut_words` ORDER BY score DESC LIMIT 0,100000;
+logger = logging.getLogger(__name__)
+
+
+def keyword_queue(redis_client):
+    return KeywordQueue(
+        redis_client, KEYWORDS_KEY,
+        prefix_length=settings.KEYWORD_FAMILY_PREFIX_LENGTH,
+        default_yield=settings.KEYWORD_YIELD_DEFAULT,
+        alpha=settings.KEYWORD_YIELD_ALPHA,
+        floor=settings.KEYWORD_YIELD_FLOOR,
+        saturation=settings.KEYWORD_YIELD_SATURATION,
+    )
+
+
+def migrate_list(redis_client, batch_size=1000):
+    """ 旧列表中的关键词没有score，按0分移入队列(排在导入的关键词之后) """
+    queue = keyword_queue(redis_client)
+    total = 0
+    while True:
+        pipe = redis_client.pipeline()
+        pipe.lrange(LEGACY_KEYWORDS_KEY, -batch_size, -1)
+        pipe.ltrim(LEGACY_KEYWORDS_KEY, 0, -batch_size - 1)
+        keywords = pipe.execute()[0]
+        if not keywords:
+            break
+        queue.push_many([(keyword.decode('utf-8'), 0) for keyword in keywords])
+        total += len(keywords)
+    logger.info('旧列表迁移完成--{}个'.format(total))
+
+
+def keyset_index_exists(cursor):
+    """ 是否有(score, keyword)开头的索引 """
+    cursor.execute(
+        "SELECT index_name FROM information_schema.statistics WHERE table_schema = DATABASE() "
+        "AND table_name = 'jieba_cut_words' GROUP BY index_name "
+        "HAVING GROUP_CONCAT(column_name ORDER BY seq_in_index) LIKE %s", ('score,keyword%',))
+    return cursor.fetchone() is not None
+
+
+def check_index(connection):
+    """ 键集分页依赖(score, keyword)索引，没有时每一页都要全表排序，只提示不自动建(大表DDL需要确认后执行) """
+    with connection.cursor() as cursor:
+        if not keyset_index_exists(cursor):
+            logger.warning('jieba_cut_words缺少(score, keyword)索引，每页都要全表排序，'
+                           '先运行 python -m custom_crawler.work_utils.migrate_keyword_index --apply')
+
+
+def query_page(connection, last, page_size):
+    """
+    读取一页，last为上一页最后一行的(score, keyword)
+    score相同时按keyword排序，保证分页不重复不遗漏
+    整页读完后关闭游标再推入redis，等待redis消费时不占用MySQL的结果集(否则超过net_write_timeout连接被断开)
     """
-    try:
-        cursor.execute(sql_query)
-        mysql_client.commit()
-        keywords = cursor.fetchall()
-        for keyword in keywords:
-            num += 1
-            # print(keyword[0])
-            redis_client.lpush('baidu_xin:keywords', keyword[0])
-            print('插入第{}条'.format(num))
-    except Exception as e:
-        mysql_client.rollback()
-        print('出错:{}'.format(repr(e)))
-        mysql_redis_keyword()
-    finally:
-        cursor.close()
-        mysql_client.close()
+    if last is None:
+        sql = "SELECT score, keyword FROM `jieba_cut_words` ORDER BY score DESC, keyword DESC LIMIT %s"
+        params = (page_size,)
+    else:
+        sql = ("SELECT score, keyword FROM `jieba_cut_words` "
+               "WHERE score < %s OR (score = %s AND keyword < %s) "
+               "ORDER BY score DESC, keyword DESC LIMIT %s")
+        params = (last[0], last[0], last[1], page_size)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+class KeywordLoader(object):
+    """ 读取、过滤、分批推入redis并记录断点 """
+    def __init__(self, redis_client, checkpoint, chunk_size=1000, max_pending=0):
+        self.redis_client = redis_client
+        self.checkpoint = checkpoint
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending  # redis中待搜索关键词的上限，0为不限制
+        self.queue = keyword_queue(redis_client)
+        self.bloomfilter = ScalableBloomFilter(
+            redis_client, BLOOMFILTER_KEY,
+            capacity=settings.KEYWORD_BLOOM_CAPACITY,
+            error_rate=settings.KEYWORD_BLOOM_ERROR_RATE,
+        )
+        state = checkpoint.get(CHECKPOINT_NAME) or {}
+        # 断点中的score按数据库返回的原值保存为字符串，还原成Decimal后作为精确数值传回查询
+        self.last = (Decimal(str(state['score'])), state['keyword']) if state else None
+        self.pushed = state.get('pushed', 0)
+        self.skipped = state.get('skipped', 0)
+
+    def wait_pending(self):
+        while self.max_pending and len(self.queue) >= self.max_pending:
+            time.sleep(5)
+
+    def flush(self, rows):
+        """ 跳过布隆过滤器中的关键词，剩下的按score推入队列，然后记录断点 """
+        exists = self.bloomfilter.contains_many([row[1] for row in rows])
+        pending = [(row[1], row[0]) for row, existed in zip(rows, exists) if not existed]
+        self.wait_pending()
+        if pending:
+            self.queue.push_many(pending)
+        self.pushed += len(pending)
+        self.skipped += len(rows) - len(pending)
+        # score保持数据库返回的值，转成float后可能和库中的值不相等，score相同的一组在页边界会被跳过
+        self.last = (rows[-1][0], rows[-1][1])
+        # 推入后再记录断点，中断时最多重复推入一批
+        self.checkpoint.set(CHECKPOINT_NAME, {
+            'score': str(self.last[0]), 'keyword': self.last[1], 'pushed': self.pushed, 'skipped': self.skipped,
+        })
+
+    def load(self, connection, page_size):
+        """ :return: 本次读取的行数，0表示已经全部导入 """
+        rows = query_page(connection, self.last, page_size)
+        for start in range(0, len(rows), self.chunk_size):
+            self.flush(rows[start:start + self.chunk_size])
+        return len(rows)
+
+
+def mysql_redis_keyword(page_size=100000, chunk_size=1000, max_pending=0, checkpoint_path='get_keyword.checkpoint.json',
+                        reset=False):
+    """ 百度信用-搜索关键词 """
+    if reset and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    redis_client = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PWD, db=REDIS_DB)
+    loader = KeywordLoader(redis_client, Checkpoint(checkpoint_path), chunk_size=chunk_size, max_pending=max_pending)
+    if loader.last:
+        logger.info('从断点继续--score:{}--keyword:{}--已推入:{}'.format(loader.last[0], loader.last[1], loader.pushed))
+    while True:
+        connection = None
+        try:
+            connection = pymysql.connect(host=MYSQL_HOST, port=MYSQL_PORT, user=MYSQL_USER, password=MYSQL_PWD,
+                                         db=MYSQL_DB, charset=MYSQL_CHARSET)
+            check_index(connection)
+            while loader.load(connection, page_size):
+                logger.info('已推入:{}--已跳过:{}'.format(loader.pushed, loader.skipped))
+            break
+        except (pymysql.MySQLError, redis.RedisError) as e:
+            # 连接出错，等待后从断点继续
+            logger.error('出错:{}--10秒后从断点继续'.format(repr(e)))
+            time.sleep(10)
+        finally:
+            if connection is not None:
+                connection.close()
+    logger.info('导入完成--推入:{}--跳过:{}'.format(loader.pushed, loader.skipped))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='百度信用搜索关键词导入redis')
+    parser.add_argument('--page-size', type=int, default=100000, help='每次查询的行数')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='每批推入redis的数量')
+    parser.add_argument('--max-pending', type=int, default=0, help='redis中待搜索关键词达到该数量时暂停，0为不限制')
+    parser.add_argument('--checkpoint', default='get_keyword.checkpoint.json', help='断点文件')
+    parser.add_argument('--reset', action='store_true', help='忽略断点从头导入')
+    parser.add_argument('--migrate-list', action='store_true', help='只把旧列表中剩下的关键词移入队列')
+    args = parser.parse_args()
+    logging.basicConfig(level=settings.LOG_LEVEL)
+    if args.migrate_list:
+        migrate_list(redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PWD, db=REDIS_DB))
+        return
+    mysql_redis_keyword(args.page_size, args.chunk_size, args.max_pending, args.checkpoint, args.reset)
 
 
 if __name__ == '__main__':
-    mysql_redis_keyword()
\ No newline at end of file
+    main()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+预写日志导入工具: 持续读取ItemLogPipeline写出的分段文件，批量导入MySQL/mongodb，并记录导入进度
+数据库不可用时等待重试，恢复后从断点继续导入
+
+python -m custom_crawler.work_utils.load_item_log --target mysql
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+import pymongo
+import pymysql
+from pymongo.errors import BulkWriteError
+
+from custom_crawler import settings
+from custom_crawler.pipelines import build_insert_sql, content_hash
+from custom_crawler.utils.item_log import Checkpoint, list_segments, read_records
+
+logger = logging.getLogger(__name__)
+
+# 需要重新连接后整批重试的错误码: 连不上(2003)、连接断开(2006/2013)、锁等待超时(1205)、死锁(1213)
+# PyMySQL把没有单独映射的错误码(如1366字符串不合法)也抛成OperationalError，这些是数据错误，按行拒绝
+RETRY_ERRNOS = {2003, 2006, 2013, 1205, 1213}
+
+
+def is_connection_error(error):
+    """ 连接断开(InterfaceError)和RETRY_ERRNOS中的OperationalError才重试，其他错误是数据的问题 """
+    if isinstance(error, pymysql.err.InterfaceError):
+        return True
+    return isinstance(error, pymysql.err.OperationalError) and bool(error.args) and error.args[0] in RETRY_ERRNOS
+
+
+class MysqlLoader(object):
+    """
+    导入MySQL，整批失败时逐条写入，重复数据忽略，其他错误数据写入rejected文件
+    连接错误时重新连接并重试整批(事务没有提交，不会重复写入)，重试retries次仍然失败时抛出，由外层等待后从断点继续
+    """
+    def __init__(self, rejected_path, retries=3, retry_delay=1):
+        self.rejected_path = rejected_path
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.upsert = settings.MYSQL_UPSERT
+        self.upsert_keys = settings.MYSQL_UPSERT_KEYS
+        self.client = None
+
+    def connect(self):
+        self.client = pymysql.connect(
+            host=settings.DB_HOST, port=settings.DB_PORT, user=settings.DB_USER, password=settings.DB_PASSWORD,
+            db=settings.DB_NAME, charset=settings.DB_CHARSET,
+        )
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+        self.client = None
+
+    def load(self, records):
+        groups = {}
+        for record in records:
+            row = dict(record)
+            table = row.pop('collection')
+            upsert = self.upsert and table in self.upsert_keys
+            if upsert and 'content_hash' not in row:
+                row['content_hash'] = content_hash(row)
+            groups.setdefault((table, tuple(row.keys()), upsert), []).append(row)
+        for attempt in range(self.retries + 1):
+            try:
+                self.load_groups(groups)
+                return
+            except pymysql.err.MySQLError as e:
+                if not is_connection_error(e):
+                    raise
+                # 关闭连接，没有提交的事务回滚，重新连接后整批重试
+                self.close()
+                if attempt >= self.retries:
+                    raise
+                logger.info('MySQL连接错误--{}--重新连接后重试第{}次'.format(repr(e), attempt + 1))
+                time.sleep(self.retry_delay * (attempt + 1))
+
+    def load_groups(self, groups):
+        """ 一个事务写入全部分组，提交成功后才写rejected文件，重试时不会重复记录 """
+        if not self.client:
+            self.connect()
+        rejected = []
+        with self.client.cursor() as cursor:
+            for (table, fields, upsert), rows in groups.items():
+                rejected.extend(self.insert_rows(cursor, table, fields, upsert, rows))
+        self.client.commit()
+        if rejected:
+            with open(self.rejected_path, 'a', encoding='utf-8') as f:
+                for row in rejected:
+                    f.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def insert_rows(self, cursor, table, fields, upsert, rows):
+        """ :return: 数据错误写入失败的行，连接错误(is_connection_error)直接抛出 """
+        sql = build_insert_sql(table, fields, len(rows), upsert=upsert)
+        try:
+            cursor.execute(sql, tuple(value for row in rows for value in row.values()))
+            return []
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            logger.debug('批量插入失败--{}--改为逐条插入'.format(repr(e)))
+        sql = build_insert_sql(table, fields, upsert=upsert)
+        rejected = []
+        for row in rows:
+            try:
+                cursor.execute(sql, tuple(row.values()))
+            except Exception as e:
+                if is_connection_error(e):
+                    raise
+                if "Duplicate" in repr(e):
+                    continue
+                logger.info('插入失败--{}'.format(repr(e)))
+                rejected.append(dict(row, collection=table))
+        return rejected
+
+
+class MongoLoader(object):
+    """ 导入mongodb，无序批量写入，重复数据忽略 """
+    def __init__(self):
+        self.client = pymongo.MongoClient(settings.MONGO_URI)
+        self.db = self.client[settings.MONGO_DATA_BASE]
+
+    def load(self, records):
+        groups = {}
+        for record in records:
+            document = dict(record)
+            groups.setdefault(document.pop('collection'), []).append(document)
+        for collection_name, documents in groups.items():
+            try:
+                self.db[collection_name].insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                errors = [error for error in e.details.get('writeErrors', []) if error.get('code') != 11000]
+                if errors:
+                    logger.info('mongodb批量写入部分失败--{}--{}'.format(collection_name, errors[0].get('errmsg')))
+
+
+def load_segments(log_dir, loader, checkpoint, batch_size, keep=False):
+    """ 导入一轮，返回导入条数 """
+    count = 0
+    for name, path, closed in list_segments(log_dir):
+        offset = checkpoint.get(name)
+        while True:
+            records, new_offset = read_records(path, offset, batch_size)
+            if not records:
+                break
+            loader.load(records)
+            checkpoint.set(name, new_offset)
+            offset = new_offset
+            count += len(records)
+        # 已经关闭并且导入完成的分段清理掉
+        if closed and offset >= os.path.getsize(path):
+            if not keep:
+                os.remove(path)
+            checkpoint.remove(name)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='预写日志导入数据库')
+    parser.add_argument('--dir', default=settings.ITEM_LOG_DIR, help='预写日志目录')
+    parser.add_argument('--target', choices=['mysql', 'mongo'], default='mysql', help='导入目标')
+    parser.add_argument('--batch-size', type=int, default=500, help='每批导入条数')
+    parser.add_argument('--interval', type=float, default=5, help='没有新数据时的等待秒数')
+    parser.add_argument('--once', action='store_true', help='导入一轮后退出')
+    parser.add_argument('--keep', action='store_true', help='导入完成后保留分段文件')
+    args = parser.parse_args()
+    logging.basicConfig(level=settings.LOG_LEVEL)
+
+    if args.target == 'mysql':
+        loader = MysqlLoader(os.path.join(args.dir, 'rejected.{}.jsonl'.format(args.target)))
+    else:
+        loader = MongoLoader()
+    checkpoint = Checkpoint(os.path.join(args.dir, 'checkpoint.{}.json'.format(args.target)))
+    while True:
+        try:
+            count = load_segments(args.dir, loader, checkpoint, args.batch_size, keep=args.keep)
+            if count:
+                logger.info('导入{}条'.format(count))
+        except Exception as e:
+            # 数据库不可用，等待后从断点继续
+            logger.error('导入出错--{}--等待重试'.format(repr(e)))
+            count = 0
+        if args.once:
+            break
+        if not count:
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+关键词表索引迁移: get_keyword按(score, keyword)键集分页，jieba_cut_words需要索引idx_score_keyword(score, keyword)
+表有几千万行，ALTER TABLE耗时较长，确认后在业务低峰期执行；keyword为TEXT类型时只能建前缀索引keyword(64)
+
+python -m custom_crawler.work_utils.migrate_keyword_index            # 只检查
+python -m custom_crawler.work_utils.migrate_keyword_index --apply    # 创建索引
+"""
+import argparse
+import logging
+
+import pymysql
+
+from custom_crawler import settings
+from custom_crawler.work_utils.get_keyword import (
+    MYSQL_CHARSET, MYSQL_DB, MYSQL_HOST, MYSQL_PORT, MYSQL_PWD, MYSQL_USER, keyset_index_exists,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = 'idx_score_keyword'
+
+
+def keyword_column(cursor):
+    """ 索引中的keyword列定义，TEXT类型使用前缀 """
+    cursor.execute(
+        "SELECT data_type FROM information_schema.columns WHERE table_schema = DATABASE() "
+        "AND table_name = 'jieba_cut_words' AND column_name = 'keyword'")
+    row = cursor.fetchone()
+    return 'keyword(64)' if row and 'text' in row[0].lower() else 'keyword'
+
+
+def migrate(connection, apply=False):
+    with connection.cursor() as cursor:
+        if keyset_index_exists(cursor):
+            logger.info('jieba_cut_words--已有(score, keyword)索引，不需要迁移')
+            return
+        keyword = keyword_column(cursor)
+        cursor.execute("SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() "
+                       "AND table_name = 'jieba_cut_words'")
+        row = cursor.fetchone()
+        logger.info('jieba_cut_words--缺少索引{}(score, {})--估算行数:{}'.format(INDEX_NAME, keyword, row[0] if row else 0))
+        if not apply:
+            return
+        cursor.execute("ALTER TABLE `jieba_cut_words` ADD INDEX {} (score, {})".format(INDEX_NAME, keyword))
+        logger.info('jieba_cut_words--已添加索引{}'.format(INDEX_NAME))
+    connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='关键词表索引迁移: 添加(score, keyword)索引')
+    parser.add_argument('--apply', action='store_true', help='执行迁移，不加时只检查')
+    args = parser.parse_args()
+    logging.basicConfig(level=settings.LOG_LEVEL)
+
+    connection = pymysql.connect(host=MYSQL_HOST, port=MYSQL_PORT, user=MYSQL_USER, password=MYSQL_PWD,
+                                 db=MYSQL_DB, charset=MYSQL_CHARSET)
+    try:
+        migrate(connection, apply=args.apply)
+    finally:
+        connection.close()
+    if not args.apply:
+        logger.info('只做了检查，确认后加 --apply 执行迁移')
+
+
+if __name__ == '__main__':
+    main()
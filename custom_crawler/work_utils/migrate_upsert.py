@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+MySQL upsert 迁移: 已有的表加上content_hash字段和业务主键唯一索引uk_natural_key(MYSQL_UPSERT_KEYS)，
+完成后才能开启MYSQL_UPSERT，否则写入时报 Unknown column 'content_hash'
+加唯一索引前需要去掉重复数据: 每组业务主键保留id最大(最后抓取)的一条，删除的行先备份到 <表名>_dup_backup
+业务主键中有NULL的行不受唯一索引约束，不去重
+业务主键和url写入时不再截断，建表后加长过的字段(WIDEN_COLUMNS)同时修改已有表的字段长度
+
+python -m custom_crawler.work_utils.migrate_upsert              # 只检查，显示每张表要做的操作和重复数量
+python -m custom_crawler.work_utils.migrate_upsert --apply      # 执行迁移
+python -m custom_crawler.work_utils.migrate_upsert --apply --tables business_information share_information
+"""
+import argparse
+import logging
+
+import pymysql
+
+from custom_crawler import settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = 'uk_natural_key'
+# 加长过的字段: {表名: {字段: (长度, 字段定义)}}
+WIDEN_COLUMNS = {
+    'gsxt_abnormal_information': {'url': (512, "VARCHAR(512) NOT NULL COMMENT '详情url'")},
+}
+
+
+def column_exists(cursor, table, column):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def column_length(cursor, table, column):
+    cursor.execute(
+        "SELECT character_maximum_length FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def index_exists(cursor, table, index):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+        (table, index))
+    return cursor.fetchone()[0] > 0
+
+
+def table_exists(cursor, table):
+    cursor.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s", (table,))
+    return cursor.fetchone()[0] > 0
+
+
+def duplicates_sql(table, keys):
+    """ 重复的业务主键分组和每组保留的id """
+    not_null = ' AND '.join('{} IS NOT NULL'.format(key) for key in keys)
+    return "SELECT {0}, MAX(id) AS keep_id, COUNT(*) AS total FROM {1} WHERE {2} GROUP BY {0} HAVING COUNT(*) > 1".format(
+        ', '.join(keys), table, not_null)
+
+
+def count_duplicates(cursor, table, keys):
+    """ :return: 要删除的行数 """
+    cursor.execute("SELECT IFNULL(SUM(total - 1), 0) FROM ({}) d".format(duplicates_sql(table, keys)))
+    return int(cursor.fetchone()[0])
+
+
+def remove_duplicates(cursor, table, keys):
+    """ 重复数据备份到 <表名>_dup_backup 后删除，每组保留id最大的一条 """
+    backup = table + '_dup_backup'
+    join = ' AND '.join('t.{0} = d.{0}'.format(key) for key in keys)
+    cursor.execute("CREATE TABLE IF NOT EXISTS {} LIKE {}".format(backup, table))
+    cursor.execute("INSERT INTO {0} SELECT t.* FROM {1} t JOIN ({2}) d ON {3} AND t.id < d.keep_id".format(
+        backup, table, duplicates_sql(table, keys), join))
+    cursor.execute("DELETE t FROM {0} t JOIN ({1}) d ON {2} AND t.id < d.keep_id".format(
+        table, duplicates_sql(table, keys), join))
+    return cursor.rowcount
+
+
+def migrate_table(connection, table, keys, apply=False):
+    with connection.cursor() as cursor:
+        if not table_exists(cursor, table):
+            logger.info('{}--表不存在，跳过(新建表用work_utils中的建表脚本)'.format(table))
+            return
+        narrow = [(column, definition) for column, (length, definition) in WIDEN_COLUMNS.get(table, {}).items()
+                  if (column_length(cursor, table, column) or length) < length]
+        for column, definition in narrow:
+            logger.info('{}--字段{}需要加长为{}'.format(table, column, definition))
+        has_column = column_exists(cursor, table, 'content_hash')
+        has_index = index_exists(cursor, table, INDEX_NAME)
+        duplicates = 0 if has_index else count_duplicates(cursor, table, keys)
+        logger.info('{}--content_hash字段:{}--唯一索引{}({}):{}--重复数据:{}条'.format(
+            table, '已有' if has_column else '缺少', INDEX_NAME, ', '.join(keys), '已有' if has_index else '缺少', duplicates))
+        if not apply:
+            return
+        for column, definition in narrow:
+            cursor.execute("ALTER TABLE {} MODIFY COLUMN {} {}".format(table, column, definition))
+            logger.info('{}--已加长字段{}'.format(table, column))
+        if not has_column:
+            cursor.execute("ALTER TABLE {} ADD COLUMN content_hash VARCHAR(32) NULL COMMENT '内容哈希'".format(table))
+            logger.info('{}--已添加content_hash字段'.format(table))
+        if not has_index:
+            if duplicates:
+                removed = remove_duplicates(cursor, table, keys)
+                connection.commit()
+                logger.info('{}--已删除重复数据{}条，备份在{}_dup_backup'.format(table, removed, table))
+            cursor.execute("ALTER TABLE {} ADD UNIQUE KEY {} ({})".format(table, INDEX_NAME, ', '.join(keys)))
+            logger.info('{}--已添加唯一索引{}'.format(table, INDEX_NAME))
+    connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MySQL upsert 迁移: 添加content_hash字段、去重并添加业务主键唯一索引')
+    parser.add_argument('--apply', action='store_true', help='执行迁移，不加时只检查')
+    parser.add_argument('--tables', nargs='*', help='只迁移这些表，默认MYSQL_UPSERT_KEYS中的全部表')
+    args = parser.parse_args()
+    logging.basicConfig(level=settings.LOG_LEVEL)
+
+    tables = args.tables or list(settings.MYSQL_UPSERT_KEYS)
+    connection = pymysql.connect(host=settings.DB_HOST, port=settings.DB_PORT, user=settings.DB_USER,
+                                 password=settings.DB_PASSWORD, db=settings.DB_NAME, charset=settings.DB_CHARSET)
+    try:
+        for table in tables:
+            keys = settings.MYSQL_UPSERT_KEYS.get(table)
+            if not keys:
+                logger.info('{}--没有配置业务主键，跳过'.format(table))
+                continue
+            migrate_table(connection, table, keys, apply=args.apply)
+    finally:
+        connection.close()
+    if not args.apply:
+        logger.info('只做了检查，确认后加 --apply 执行迁移')
+
+
+if __name__ == '__main__':
+    main()